@@ -3,11 +3,75 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime
+from contextlib import contextmanager
+
+from database_sqlite import MEASUREMENT_COLUMNS
+from timeseries import TimeSeriesAnalyzer
+from anova import AnovaEngine
+from bootstrap import BootstrapAnalyzer
+from dose_response import DoseResponseAnalyzer
+from changepoint import ChangepointDetector
+from response_curves import ResponseCurveFitter
+from sensors import SensorStore
+from derived_metrics import DerivedMetricEngine
+from validation import MeasurementValidator
+from snapshots import SnapshotManager
+from result_cache import AnalysisResultCache, cached_analysis
 
 class StressAnalyzer:
+    # Helpers that query through their own reference to the database
+    SUBSYSTEMS = ('timeseries', 'anova', 'bootstrap', 'dose_response', 'changepoints',
+                  'curves', 'sensors', 'derived', 'validator')
+    
     def __init__(self, database):
         self.db = database
+        self.live_db = database
+        self.snapshots = SnapshotManager(database)
+        # Stays on the live database when analyses switch to a snapshot
+        self.results = AnalysisResultCache(database)
+        self.timeseries = TimeSeriesAnalyzer(database)
+        self.anova = AnovaEngine(database)
+        self.bootstrap = BootstrapAnalyzer(database)
+        self.dose_response = DoseResponseAnalyzer(database)
+        self.changepoints = ChangepointDetector(database)
+        self.curves = ResponseCurveFitter(database)
+        self.sensors = SensorStore(database)
+        self.derived = DerivedMetricEngine(database)
+        self.validator = MeasurementValidator(database)
+    
+    def use_database(self, database):
+        """Point this analyzer and all its helpers at another database (live or snapshot)"""
+        self.db = database
+        for name in self.SUBSYSTEMS:
+            helper = getattr(self, name)
+            helper.db = database
+            # Lazily created tables may not exist on the new connection
+            if hasattr(helper, '_tables_ready'):
+                helper._tables_ready = False
+    
+    def use_snapshot(self, experiment_id=None):
+        """Run subsequent analyses, plots and exports against an in-memory snapshot"""
+        snapshot = self.snapshots.load(experiment_id)
+        if snapshot is not self.db:
+            self.use_database(snapshot)
+        return snapshot
     
+    def use_live(self):
+        """Go back to querying the database file"""
+        if self.db is not self.live_db:
+            self.use_database(self.live_db)
+    
+    @contextmanager
+    def snapshot_mode(self, experiment_id=None):
+        """Temporarily analyse a consistent in-memory snapshot"""
+        previous = self.db
+        self.use_snapshot(experiment_id)
+        try:
+            yield self.db
+        finally:
+            self.use_database(previous)
+    
+    @cached_analysis('growth_rates')
     def calculate_growth_rates(self, experiment_id):
         """Calculate growth rates for all treatments in an experiment"""
         try:
@@ -38,11 +102,69 @@ class StressAnalyzer:
             print(f"Error calculating growth rates: {e}")
             return None
     
+    def plant_time_series(self, experiment_id, metrics=('plant_height', 'leaf_area', 'biomass_fresh')):
+        """Per-plant measurement series for a whole experiment in a single indexed query"""
+        try:
+            for metric in metrics:
+                if metric not in MEASUREMENT_COLUMNS:
+                    raise ValueError(f"Unknown metric '{metric}'")
+            query = f"""
+                SELECT t.treatment_name, p.id AS plant_id, p.plant_label, p.replicate,
+                       p.block, p.position, m.measurement_date,
+                       {', '.join('m.' + metric for metric in metrics)}
+                FROM treatments t
+                JOIN plants p ON p.treatment_id = t.id
+                JOIN measurements m ON m.plant_id = p.id
+                WHERE t.experiment_id = ?
+                ORDER BY t.treatment_name, p.id, m.measurement_date
+            """
+            return pd.read_sql_query(query, self.db.connection, params=(experiment_id,))
+                
+        except Exception as e:
+            print(f"Error loading plant time series: {e}")
+            return None
+    
+    def calculate_plant_growth_rates(self, experiment_id, metric='plant_height'):
+        """Per-plant linear growth rates (units/day)
+        
+        Returns (per-treatment summary, per-plant rates) or None.
+        """
+        try:
+            df = self.plant_time_series(experiment_id, (metric,))
+            if df is None or df.empty:
+                return None
+            
+            df = df.dropna(subset=[metric])
+            df['day'] = (pd.to_datetime(df['measurement_date']) - pd.Timestamp('1970-01-01')).dt.days
+            
+            # Least-squares slope per plant from grouped sums
+            df['xy'] = df['day'] * df[metric]
+            df['xx'] = df['day'] ** 2
+            sums = df.groupby(['treatment_name', 'plant_id', 'plant_label']).agg(
+                n=('day', 'size'), sx=('day', 'sum'), sy=(metric, 'sum'),
+                sxy=('xy', 'sum'), sxx=('xx', 'sum'))
+            denominator = sums['n'] * sums['sxx'] - sums['sx'] ** 2
+            sums['growth_rate'] = (sums['n'] * sums['sxy'] - sums['sx'] * sums['sy']) / denominator.where(denominator != 0)
+            per_plant = sums.reset_index()[['treatment_name', 'plant_id', 'plant_label', 'n', 'growth_rate']]
+            
+            growth_rates = per_plant.groupby('treatment_name').agg(
+                plants=('plant_id', 'nunique'),
+                mean_growth_rate=('growth_rate', 'mean'),
+                std_growth_rate=('growth_rate', 'std')
+            ).round(4)
+            
+            return growth_rates, per_plant.round(4)
+                
+        except Exception as e:
+            print(f"Error calculating plant growth rates: {e}")
+            return None
+    
+    @cached_analysis('stress_impact')
     def stress_impact_analysis(self, experiment_id):
         """Analyze stress impact by comparing treatments"""
         try:
             query = """
-                SELECT t.treatment_name, t.treatment_type, t.stress_level,
+                SELECT t.treatment_name, t.treatment_type_id, t.stress_level_id,
                        AVG(m.plant_height) as avg_height,
                        AVG(m.leaf_area) as avg_leaf_area,
                        AVG(m.water_content) as avg_water_content,
@@ -50,8 +172,8 @@ class StressAnalyzer:
                 FROM treatments t
                 LEFT JOIN measurements m ON t.id = m.treatment_id
                 WHERE t.experiment_id = ?
-                GROUP BY t.id, t.treatment_name, t.treatment_type, t.stress_level
-                ORDER BY t.treatment_type, t.stress_level
+                GROUP BY t.id
+                ORDER BY t.id
             """
             results = self.db.execute_query(query, (experiment_id,))
             
@@ -60,6 +182,12 @@ class StressAnalyzer:
                     'treatment_name', 'treatment_type', 'stress_level',
                     'avg_height', 'avg_leaf_area', 'avg_water_content', 'measurement_count'
                 ])
+                # Decode the lookup codes through the cached id -> name maps
+                for column, lookup in (('treatment_type', 'treatment_types'), ('stress_level', 'stress_levels')):
+                    df[column] = df[column].map(self.db.lookup_names(lookup, df[column].dropna().tolist()))
+                # Sort on the decoded names so reports keep their alphabetical order
+                df = df.sort_values(['treatment_type', 'stress_level'], kind='mergesort',
+                                    na_position='first', ignore_index=True)
                 return df.round(2)
             else:
                 return None
@@ -122,6 +250,51 @@ class StressAnalyzer:
             print(f"Error creating timeline plot: {e}")
             return False
     
+    def create_environment_plot(self, experiment_id, variable='temperature', start=None, end=None,
+                                filename='environment_plot.png'):
+        """Plot sensor series for an experiment at a resolution matching the figure width"""
+        try:
+            series = self.db.execute_query("""
+                SELECT s.id, COALESCE(t.treatment_name, 'Experiment'), s.unit
+                FROM sensor_series s
+                LEFT JOIN treatments t ON s.treatment_id = t.id
+                WHERE s.experiment_id = ? AND s.variable = ?
+                ORDER BY s.id
+            """, (experiment_id, variable))
+            
+            if not series:
+                return False
+            
+            dpi = 150
+            fig, ax = plt.subplots(figsize=(12, 5), dpi=dpi)
+            pixel_width = int(fig.get_figwidth() * dpi)
+            levels = set()
+            for series_id, label, unit in series:
+                df = self.sensors.query_series(series_id, start, end, pixel_width=pixel_width)
+                if df is None or df.empty:
+                    continue
+                levels.add(df.attrs['level'])
+                line, = ax.plot(df['timestamp'], df['mean'], label=label, linewidth=1)
+                if df.attrs['level'] != 'raw':
+                    ax.fill_between(df['timestamp'], df['min'], df['max'],
+                                    color=line.get_color(), alpha=0.2, linewidth=0)
+            
+            ax.set_title(f"{variable.replace('_', ' ').title()} ({', '.join(sorted(levels))} resolution)")
+            ax.set_ylabel(f"{variable} ({series[0][2]})" if series[0][2] else variable)
+            ax.set_xlabel('Date')
+            ax.legend()
+            ax.grid(True, alpha=0.3)
+            
+            plt.tight_layout()
+            plt.savefig(filename, dpi=dpi, bbox_inches='tight')
+            plt.close()
+            
+            return True
+                
+        except Exception as e:
+            print(f"Error creating environment plot: {e}")
+            return False
+    
     def export_experiment_data(self, experiment_id):
         """Export experiment data to Excel"""
         try:
@@ -147,7 +320,8 @@ class StressAnalyzer:
                 exp_df = pd.DataFrame(exp_data, columns=[
                     'id', 'experiment_code', 'experiment_name', 'plant_species', 
                     'stress_type', 'researcher', 'start_date', 'end_date', 
-                    'description', 'status', 'created_at', 'updated_at'
+                    'description', 'status', 'created_at', 'updated_at',
+                    'species_id', 'stress_type_id', 'researcher_id'
                 ])
             else:
                 exp_df = pd.DataFrame()
@@ -156,7 +330,8 @@ class StressAnalyzer:
                 treatments_df = pd.DataFrame(treatments_data, columns=[
                     'id', 'experiment_id', 'treatment_name', 'treatment_type',
                     'stress_level', 'concentration', 'duration_days', 'temperature',
-                    'description', 'created_at', 'updated_at'
+                    'description', 'created_at', 'updated_at',
+                    'treatment_type_id', 'stress_level_id'
                 ])
             else:
                 treatments_df = pd.DataFrame()
@@ -166,7 +341,8 @@ class StressAnalyzer:
                     'id', 'treatment_id', 'measurement_date', 'plant_height', 
                     'leaf_area', 'chlorophyll_content', 'photosynthesis_rate',
                     'stomatal_conductance', 'root_length', 'biomass_fresh',
-                    'biomass_dry', 'water_content', 'notes', 'created_at', 'treatment_name'
+                    'biomass_dry', 'water_content', 'notes', 'created_at', 'plant_id',
+                    'updated_at', 'treatment_name'
                 ])
             else:
                 measurements_df = pd.DataFrame()
@@ -188,6 +364,7 @@ class StressAnalyzer:
             print(f"❌ Export error: {e}")
             return False
     
+    @cached_analysis('statistics')
     def calculate_statistics(self, experiment_id):
         """Calculate comprehensive statistics for an experiment"""
         try:
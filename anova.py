@@ -0,0 +1,262 @@
+# anova.py - BATCHED ANOVA AND TUKEY HSD ACROSS ALL METRICS
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from database_sqlite import MEASUREMENT_COLUMNS
+
+class AnovaEngine:
+    """One-way/two-way ANOVA and Tukey HSD over every measurement column at once.
+
+    Each metric is a column of one (rows x metrics) matrix; missing values are
+    masked rather than dropped row-wise, so every statistic is computed from
+    group sufficient statistics (counts, sums, sums of squares) with NumPy
+    reductions over all nine metrics together instead of a loop per metric.
+    """
+
+    # Grouping factors available to the engine and the SQL expression for each
+    FACTORS = {
+        'treatment': 't.treatment_name',
+        'treatment_type': 't.treatment_type_id',
+        'stress_level': 'COALESCE(t.stress_level_id, 0)',
+        'date': 'm.measurement_date'
+    }
+
+    # Factors grouped on integer lookup codes, with the table that names them
+    FACTOR_LOOKUPS = {
+        'treatment_type': 'treatment_types',
+        'stress_level': 'stress_levels'
+    }
+
+    def __init__(self, database):
+        self.db = database
+
+    def load_matrix(self, experiment_id, factors=('treatment',), metrics=None):
+        """Return (factor codes, level names, values matrix, metric names)"""
+        metrics = list(metrics or MEASUREMENT_COLUMNS)
+        for name in metrics:
+            if name not in MEASUREMENT_COLUMNS:
+                raise ValueError(f"Unknown metric '{name}'")
+        for name in factors:
+            if name not in self.FACTORS:
+                raise ValueError(f"Unknown factor '{name}'")
+
+        select = [f"{self.FACTORS[f]} AS {f}" for f in factors]
+        select += [f"m.{name}" for name in metrics]
+        query = f"""
+            SELECT {', '.join(select)}
+            FROM measurements m
+            JOIN treatments t ON m.treatment_id = t.id
+            WHERE t.experiment_id = ?
+        """
+        df = pd.read_sql_query(query, self.db.connection, params=(experiment_id,))
+
+        codes, levels = [], []
+        for name in factors:
+            code, uniques = pd.factorize(df[name], sort=True)
+            codes.append(code)
+            if name in self.FACTOR_LOOKUPS:
+                # Code 0 stands for a missing value (see FACTORS)
+                names = self.db.lookup_names(self.FACTOR_LOOKUPS[name], [v for v in uniques.tolist() if v])
+                levels.append([names.get(value, 'unspecified') for value in uniques])
+            else:
+                levels.append(list(uniques))
+        values = df[metrics].to_numpy(dtype=float)
+        return codes, levels, values, metrics
+
+    @staticmethod
+    def group_sums(codes, n_groups, values):
+        """Per-group counts, sums and sums of squares for every metric column"""
+        mask = ~np.isnan(values)
+        # Centre on the column mean to keep the sums-of-squares well conditioned
+        centred = np.where(mask, values - np.nanmean(values, axis=0), 0.0)
+
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        present = sorted_codes[starts]
+
+        counts = np.zeros((n_groups, values.shape[1]))
+        sums = np.zeros_like(counts)
+        sumsq = np.zeros_like(counts)
+        counts[present] = np.add.reduceat(mask[order].astype(float), starts, axis=0)
+        sums[present] = np.add.reduceat(centred[order], starts, axis=0)
+        sumsq[present] = np.add.reduceat(centred[order] ** 2, starts, axis=0)
+        return counts, sums, sumsq
+
+    @staticmethod
+    def _between_ss(counts, sums):
+        """Sum of n * mean^2 over groups, ignoring empty ones"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(counts > 0, sums ** 2 / counts, 0.0).sum(axis=0)
+
+    def one_way_anova(self, experiment_id, factor='treatment', metrics=None):
+        """One-way ANOVA of every metric against a single factor"""
+        try:
+            codes, levels, values, metrics = self.load_matrix(experiment_id, (factor,), metrics)
+            if values.size == 0:
+                return None
+            counts, sums, sumsq = self.group_sums(codes[0], len(levels[0]), values)
+
+            n_total = counts.sum(axis=0)
+            grand = sums.sum(axis=0)
+            ss_total = sumsq.sum(axis=0) - grand ** 2 / np.maximum(n_total, 1)
+            ss_between = self._between_ss(counts, sums) - grand ** 2 / np.maximum(n_total, 1)
+            ss_within = ss_total - ss_between
+
+            df_between = (counts > 0).sum(axis=0) - 1
+            df_within = n_total - (counts > 0).sum(axis=0)
+            table = self._anova_rows(metrics, [factor, 'Residual'],
+                                     np.vstack([ss_between, ss_within]),
+                                     np.vstack([df_between, df_within]))
+            table.insert(0, 'test', 'one-way')
+            return table
+
+        except Exception as e:
+            print(f"Error running one-way ANOVA: {e}")
+            return None
+
+    def two_way_anova(self, experiment_id, factor_a='treatment', factor_b='date', metrics=None):
+        """Two-way ANOVA with interaction (Type II sums of squares)
+
+        The observations are reduced to cell sufficient statistics and each
+        additive/main-effect model is fitted as a weighted least-squares
+        problem on the cell means, batched over metrics. Degrees of freedom
+        come from design-matrix ranks, so confounded factors (e.g. a
+        treatment that always has the same stress_level) report zero df.
+        """
+        try:
+            codes, levels, values, metrics = self.load_matrix(
+                experiment_id, (factor_a, factor_b), metrics)
+            if values.size == 0:
+                return None
+
+            n_a, n_b = len(levels[0]), len(levels[1])
+            cell_codes = codes[0] * n_b + codes[1]
+            counts, sums, sumsq = self.group_sums(cell_codes, n_a * n_b, values)
+
+            occupied = counts.sum(axis=1) > 0
+            counts, sums, sumsq = counts[occupied], sums[occupied], sumsq[occupied]
+            cell_ids = np.flatnonzero(occupied)
+            cell_a, cell_b = cell_ids // n_b, cell_ids % n_b
+
+            # Design blocks on the occupied cells (reference coding)
+            intercept = np.ones((len(cell_ids), 1))
+            dummies_a = (cell_a[:, None] == np.arange(1, n_a)[None, :]).astype(float)
+            dummies_b = (cell_b[:, None] == np.arange(1, n_b)[None, :]).astype(float)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cell_means = np.where(counts > 0, sums / counts, 0.0)
+            ss_within_cells = sumsq.sum(axis=0) - self._between_ss(counts, sums)
+
+            def rss(design):
+                """Residual SS and rank of a cell-level model for all metrics"""
+                weights = counts.T                                   # (metrics, cells)
+                xtwx = np.einsum('cp,kc,cq->kpq', design, weights, design)
+                xtwy = np.einsum('cp,kc,ck->kp', design, weights, cell_means)
+                beta = np.einsum('kpq,kq->kp', np.linalg.pinv(xtwx), xtwy)
+                fitted = design @ beta.T                             # (cells, metrics)
+                lack_of_fit = (counts * (cell_means - fitted) ** 2).sum(axis=0)
+                rank = np.linalg.matrix_rank(np.sqrt(weights)[:, :, None] * design[None, :, :])
+                return ss_within_cells + lack_of_fit, rank
+
+            rss_a, rank_a = rss(np.hstack([intercept, dummies_a]))
+            rss_b, rank_b = rss(np.hstack([intercept, dummies_b]))
+            rss_ab, rank_ab = rss(np.hstack([intercept, dummies_a, dummies_b]))
+
+            n_total = counts.sum(axis=0)
+            n_cells = (counts > 0).sum(axis=0)
+            ss = np.vstack([rss_b - rss_ab, rss_a - rss_ab, rss_ab - ss_within_cells, ss_within_cells])
+            df = np.vstack([rank_ab - rank_b, rank_ab - rank_a, n_cells - rank_ab, n_total - n_cells])
+
+            table = self._anova_rows(metrics, [factor_a, factor_b, f"{factor_a}:{factor_b}", 'Residual'],
+                                     np.maximum(ss, 0.0), df)
+            table.insert(0, 'test', f"two-way ({factor_a} x {factor_b})")
+            return table
+
+        except Exception as e:
+            print(f"Error running two-way ANOVA: {e}")
+            return None
+
+    @staticmethod
+    def _anova_rows(metrics, terms, ss, df):
+        """Build a tidy ANOVA table from (terms x metrics) SS and df arrays"""
+        df = df.astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ms = np.where(df > 0, ss / df, np.nan)
+            f_value = ms[:-1] / ms[-1]
+        p_value = stats.f.sf(f_value, df[:-1], df[-1])
+
+        rows = []
+        for t, term in enumerate(terms):
+            for k, metric in enumerate(metrics):
+                is_effect = t < len(terms) - 1
+                rows.append({
+                    'metric': metric, 'term': term,
+                    'df': df[t, k], 'sum_sq': ss[t, k], 'mean_sq': ms[t, k],
+                    'F': f_value[t, k] if is_effect else np.nan,
+                    'p_value': p_value[t, k] if is_effect else np.nan
+                })
+        table = pd.DataFrame(rows)
+        table['metric'] = pd.Categorical(table['metric'], metrics, ordered=True)
+        return table.sort_values(['metric'], kind='stable').reset_index(drop=True)
+
+    def tukey_hsd(self, experiment_id, factor='treatment', metrics=None, alpha=0.05):
+        """Tukey HSD for all pairs of factor levels, for every metric at once"""
+        try:
+            codes, levels, values, metrics = self.load_matrix(experiment_id, (factor,), metrics)
+            if values.size == 0:
+                return None
+            names = levels[0]
+            counts, sums, sumsq = self.group_sums(codes[0], len(names), values)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means = np.where(counts > 0, sums / counts, np.nan) + np.nanmean(values, axis=0)
+                n_groups = (counts > 0).sum(axis=0)
+                df_within = counts.sum(axis=0) - n_groups
+                ss_within = sumsq.sum(axis=0) - self._between_ss(counts, sums)
+                mse = np.where(df_within > 0, ss_within / df_within, np.nan)
+
+                i, j = np.triu_indices(len(names), k=1)
+                diff = means[j] - means[i]                              # (pairs, metrics)
+                se = np.sqrt(mse / 2.0 * (1.0 / counts[i] + 1.0 / counts[j]))
+                q_stat = np.abs(diff) / se
+
+            valid = np.isfinite(q_stat) & (n_groups >= 2) & (df_within > 0)
+            k_b = np.broadcast_to(n_groups, q_stat.shape)
+            df_b = np.broadcast_to(df_within, q_stat.shape)
+            p_adj = np.full(q_stat.shape, np.nan)
+            p_adj[valid] = stats.studentized_range.sf(q_stat[valid], k_b[valid], df_b[valid])
+
+            q_crit = np.full(len(metrics), np.nan)
+            ok = (n_groups >= 2) & (df_within > 0)
+            q_crit[ok] = stats.studentized_range.ppf(1 - alpha, n_groups[ok], df_within[ok])
+            margin = q_crit * se
+
+            result = pd.DataFrame({
+                'metric': np.repeat(np.array(metrics)[None, :], len(i), axis=0).ravel(order='F'),
+                'group1': np.repeat(np.array(names, dtype=object)[i][:, None], len(metrics), axis=1).ravel(order='F'),
+                'group2': np.repeat(np.array(names, dtype=object)[j][:, None], len(metrics), axis=1).ravel(order='F'),
+                'mean_diff': diff.ravel(order='F'),
+                'ci_lower': (diff - margin).ravel(order='F'),
+                'ci_upper': (diff + margin).ravel(order='F'),
+                'p_adj': p_adj.ravel(order='F')
+            })
+            result['reject'] = result['p_adj'] < alpha
+            return result.dropna(subset=['mean_diff']).reset_index(drop=True)
+
+        except Exception as e:
+            print(f"Error running Tukey HSD: {e}")
+            return None
+
+    def results_table(self, experiment_id, metrics=None):
+        """Tidy table of the one-way and standard two-way designs"""
+        tables = [
+            self.one_way_anova(experiment_id, 'treatment', metrics),
+            self.two_way_anova(experiment_id, 'treatment', 'stress_level', metrics),
+            self.two_way_anova(experiment_id, 'treatment', 'date', metrics)
+        ]
+        tables = [t for t in tables if t is not None]
+        if not tables:
+            return None
+        return pd.concat(tables, ignore_index=True).round(6)
@@ -0,0 +1,151 @@
+# audit.py - CHANGE HISTORY AND "AS OF" RECONSTRUCTION
+import json
+import pandas as pd
+
+from database_sqlite import CHANGE_TRACKED_TABLES
+
+class ChangeHistory:
+    """Read side of the change_history table written by StressDatabase's triggers.
+
+    History entries hold the values a row had before each update (only the
+    changed columns) or before it was deleted (the whole row). A row as of
+    time T is therefore its current state with every later entry undone,
+    newest first. Entries are found through the (table_name, row_id,
+    changed_at) and (table_name, changed_at) indexes, so the cost depends on
+    how much changed after T, not on the size of the history.
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    def _check_table(self, table):
+        if table not in CHANGE_TRACKED_TABLES:
+            raise ValueError(f"'{table}' has no change history")
+
+    def _columns(self, table):
+        return [row[1] for row in self.db.cursor.execute(f"PRAGMA table_info({table})")]
+
+    def _entries_after(self, table, timestamp, row_ids=None):
+        """History entries after timestamp, newest first"""
+        query = """
+            SELECT row_id, operation, old_values FROM change_history
+            WHERE table_name = ? AND changed_at > ?
+        """
+        params = [table, timestamp]
+        if row_ids is not None:
+            query += f" AND row_id IN ({', '.join('?' * len(row_ids))})"
+            params.extend(int(i) for i in row_ids)
+        query += " ORDER BY changed_at DESC, id DESC"
+        return self.db.cursor.execute(query, params).fetchall()
+
+    def rows_as_of(self, table, timestamp, current=None):
+        """Rebuild rows of table as they were at timestamp; returns {id: row dict}
+
+        current is the {id: row dict} to start from (by default the whole
+        table); rows deleted since timestamp are brought back and rows created
+        after it are dropped.
+        """
+        self._check_table(table)
+        columns = self._columns(table)
+        if current is None:
+            rows = self.db.cursor.execute(f"SELECT * FROM {table}").fetchall()
+            current = {row[0]: dict(zip(columns, row)) for row in rows}
+        state = {row_id: dict(row) for row_id, row in current.items()}
+
+        for row_id, operation, old_values in self._entries_after(table, timestamp):
+            old = json.loads(old_values)
+            if operation == 'D':
+                state[row_id] = {'id': row_id, **old}
+            elif row_id in state:
+                state[row_id].update(old)
+
+        # created_at has second resolution; compare on that prefix
+        cutoff = str(timestamp)[:19]
+        return {row_id: row for row_id, row in state.items()
+                if row.get('created_at') is None or str(row['created_at'])[:19] <= cutoff}
+
+    def row_as_of(self, table, row_id, timestamp):
+        """One row as it was at timestamp, or None if it did not exist"""
+        try:
+            self._check_table(table)
+            columns = self._columns(table)
+            row = self.db.cursor.execute(f"SELECT * FROM {table} WHERE id = ?", (row_id,)).fetchone()
+            state = dict(zip(columns, row)) if row else None
+            for _, operation, old_values in self._entries_after(table, timestamp, [row_id]):
+                old = json.loads(old_values)
+                if operation == 'D':
+                    state = {'id': row_id, **old}
+                elif state is not None:
+                    state.update(old)
+            if state and state.get('created_at') and str(state['created_at'])[:19] > str(timestamp)[:19]:
+                return None
+            return state
+
+        except Exception as e:
+            print(f"Error reconstructing {table} {row_id}: {e}")
+            return None
+
+    def measurements_as_of(self, experiment_id, timestamp):
+        """An experiment's measurements as they were at timestamp, as a DataFrame"""
+        try:
+            treatments = self.rows_as_of('treatments', timestamp)
+            treatment_ids = {tid for tid, row in treatments.items() if row['experiment_id'] == experiment_id}
+            if not treatment_ids:
+                return None
+
+            # Start from rows currently in the experiment plus any touched since timestamp
+            columns = self._columns('measurements')
+            placeholders = ', '.join('?' * len(treatment_ids))
+            rows = self.db.cursor.execute(f"""
+                SELECT * FROM measurements WHERE treatment_id IN ({placeholders})
+                UNION
+                SELECT m.* FROM measurements m
+                JOIN change_history h ON h.row_id = m.id
+                WHERE h.table_name = 'measurements' AND h.changed_at > ?
+            """, (*treatment_ids, timestamp)).fetchall()
+            current = {row[0]: dict(zip(columns, row)) for row in rows}
+            state = self.rows_as_of('measurements', timestamp, current)
+
+            result = [row for row in state.values() if row.get('treatment_id') in treatment_ids]
+            if not result:
+                return None
+            df = pd.DataFrame(result).reindex(columns=columns)
+            df['treatment_name'] = df['treatment_id'].map(
+                {tid: treatments[tid]['treatment_name'] for tid in treatment_ids})
+            return df.sort_values(['treatment_name', 'measurement_date', 'id']).reset_index(drop=True)
+
+        except Exception as e:
+            print(f"Error reconstructing measurements: {e}")
+            return None
+
+    def get_history(self, table, row_id):
+        """Every recorded change to one row, oldest first, as (changed_at, operation, column, old, new)"""
+        try:
+            self._check_table(table)
+            entries = self.db.cursor.execute("""
+                SELECT changed_at, operation, old_values FROM change_history
+                WHERE table_name = ? AND row_id = ?
+                ORDER BY changed_at DESC, id DESC
+            """, (table, row_id)).fetchall()
+            if not entries:
+                return None
+
+            # Walk back from the current row so each change's new value is known
+            columns = self._columns(table)
+            row = self.db.cursor.execute(f"SELECT * FROM {table} WHERE id = ?", (row_id,)).fetchone()
+            state = dict(zip(columns, row)) if row else {}
+            changes = []
+            for changed_at, operation, old_values in entries:
+                old = json.loads(old_values)
+                if operation == 'D':
+                    changes.append((changed_at, 'delete', None, None, None))
+                    state = dict(old)
+                    continue
+                for column, value in old.items():
+                    changes.append((changed_at, 'update', column, value, state.get(column)))
+                state.update(old)
+            return pd.DataFrame(changes[::-1], columns=['changed_at', 'operation', 'column', 'old_value', 'new_value'])
+
+        except Exception as e:
+            print(f"Error loading change history: {e}")
+            return None
@@ -0,0 +1,207 @@
+# backup.py - ONLINE BACKUP, ROTATING COMPRESSED SNAPSHOTS AND RESTORE
+import os
+import gzip
+import time
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+
+SNAPSHOT_PREFIX = 'plant_stress_'
+SNAPSHOT_SUFFIX = '.db.gz'
+
+HISTORY_TABLE = """
+    CREATE TABLE IF NOT EXISTS backup_history (
+        id INTEGER PRIMARY KEY,
+        snapshot_path TEXT NOT NULL,
+        database_bytes INTEGER,
+        snapshot_bytes INTEGER,
+        backup_seconds REAL,
+        compress_seconds REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+class _BackupRestarted(Exception):
+    """Raised from the progress callback to abandon a stepped backup"""
+
+class BackupManager:
+    """Consistent snapshots of the live database without stopping the app.
+
+    Snapshots use SQLite's online backup API, copying pages_per_step pages at a
+    time on a separate connection, so other connections can keep writing
+    between steps; a snapshot can run on a background thread while the GUI
+    stays responsive. Each snapshot is gzip-compressed into backup_dir, only
+    the newest keep snapshots are retained, and timings are logged in
+    backup_history so throughput can be tracked as the database grows. If
+    concurrent writes restart the stepped copy more than max_restarts times,
+    the snapshot finishes in a single pass instead.
+    """
+
+    def __init__(self, database, backup_dir='backups', keep=7, pages_per_step=4096,
+                 step_sleep=0.005, max_restarts=3, compresslevel=6):
+        self.db = database
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+        self.compresslevel = compresslevel
+        self.progress = None
+        self._thread = None
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the snapshot history table"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute(HISTORY_TABLE)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def create_snapshot(self, progress_callback=None):
+        """Back up, compress and rotate; returns a dict of sizes, timings and throughput
+
+        Opens its own connections, so it is safe to call from a worker thread.
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        raw_path = os.path.join(self.backup_dir, f"{SNAPSHOT_PREFIX}{stamp}.db.partial")
+        snapshot_path = os.path.join(self.backup_dir, f"{SNAPSHOT_PREFIX}{stamp}{SNAPSHOT_SUFFIX}")
+
+        restarts = [0, None]
+
+        def report(status, remaining, total):
+            # A write from another connection restarts a stepped backup from page one
+            if restarts[1] is not None and remaining > restarts[1]:
+                restarts[0] += 1
+                if restarts[0] > self.max_restarts:
+                    raise _BackupRestarted()
+            restarts[1] = remaining
+            self.progress = (total - remaining, total)
+            if progress_callback:
+                progress_callback(total - remaining, total)
+
+        source = sqlite3.connect(self.db.db_file, timeout=30)
+        target = sqlite3.connect(raw_path)
+        try:
+            start = time.perf_counter()
+            try:
+                source.backup(target, pages=self.pages_per_step, progress=report, sleep=self.step_sleep)
+            except _BackupRestarted:
+                # Writes keep landing between steps: copy in one pass under a read lock instead
+                source.backup(target)
+            backup_seconds = time.perf_counter() - start
+        finally:
+            target.close()
+
+        try:
+            start = time.perf_counter()
+            with open(raw_path, 'rb') as raw, gzip.open(snapshot_path + '.partial', 'wb', compresslevel=self.compresslevel) as packed:
+                shutil.copyfileobj(raw, packed, 1 << 20)
+            os.replace(snapshot_path + '.partial', snapshot_path)
+            compress_seconds = time.perf_counter() - start
+
+            stats = {
+                'snapshot_path': snapshot_path,
+                'database_bytes': os.path.getsize(raw_path),
+                'snapshot_bytes': os.path.getsize(snapshot_path),
+                'backup_seconds': backup_seconds,
+                'compress_seconds': compress_seconds
+            }
+            megabytes = stats['database_bytes'] / 1e6
+            stats['backup_mb_per_s'] = megabytes / backup_seconds if backup_seconds else None
+            stats['compress_mb_per_s'] = megabytes / compress_seconds if compress_seconds else None
+
+            with source:
+                source.execute(HISTORY_TABLE)
+                source.execute("""
+                    INSERT INTO backup_history
+                    (snapshot_path, database_bytes, snapshot_bytes, backup_seconds, compress_seconds)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (snapshot_path, stats['database_bytes'], stats['snapshot_bytes'],
+                      backup_seconds, compress_seconds))
+            self.rotate()
+            return stats
+        finally:
+            source.close()
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+
+    def start_snapshot(self, on_done=None):
+        """Run create_snapshot on a background thread; on_done receives the stats or the exception"""
+        if self._thread and self._thread.is_alive():
+            return False
+
+        def run():
+            try:
+                result = self.create_snapshot()
+            except Exception as e:
+                result = e
+            self.progress = None
+            if on_done:
+                on_done(result)
+
+        self._thread = threading.Thread(target=run, name='snapshot', daemon=True)
+        self._thread.start()
+        return True
+
+    def is_running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def list_snapshots(self):
+        """Snapshot paths, newest first"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [name for name in os.listdir(self.backup_dir)
+                 if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)]
+        return [os.path.join(self.backup_dir, name) for name in sorted(names, reverse=True)]
+
+    def rotate(self):
+        """Delete all but the newest keep snapshots; returns the paths removed"""
+        removed = self.list_snapshots()[self.keep:]
+        for path in removed:
+            os.remove(path)
+        return removed
+
+    def restore_snapshot(self, snapshot_path):
+        """Replace the live database contents with a snapshot; returns seconds taken
+
+        The snapshot is decompressed and checked with quick_check first, then
+        copied into the open connection with the backup API, so the app keeps
+        its connection and nothing is left half-restored if the file is bad.
+        """
+        try:
+            start = time.perf_counter()
+            raw_path = snapshot_path + '.restore'
+            with gzip.open(snapshot_path, 'rb') as packed, open(raw_path, 'wb') as raw:
+                shutil.copyfileobj(packed, raw, 1 << 20)
+            try:
+                source = sqlite3.connect(raw_path)
+                try:
+                    status = source.execute("PRAGMA quick_check").fetchone()[0]
+                    if status != 'ok':
+                        raise ValueError(f"snapshot failed integrity check: {status}")
+                    self.db.connection.commit()
+                    source.backup(self.db.connection)
+                finally:
+                    source.close()
+            finally:
+                os.remove(raw_path)
+            # Restored schema may predate tables created lazily by other subsystems
+            self._tables_ready = False
+            print(f"✅ Database restored from {os.path.basename(snapshot_path)}")
+            return time.perf_counter() - start
+
+        except Exception as e:
+            print(f"❌ Restore error: {e}")
+            return None
+
+    def get_history(self, limit=20):
+        """Recent snapshots with sizes and throughput"""
+        self.create_tables()
+        return self.db.execute_query("""
+            SELECT snapshot_path, database_bytes, snapshot_bytes, backup_seconds,
+                   compress_seconds, created_at
+            FROM backup_history ORDER BY id DESC LIMIT ?
+        """, (limit,))
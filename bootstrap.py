@@ -0,0 +1,169 @@
+# bootstrap.py - PARALLEL BOOTSTRAP CONFIDENCE INTERVALS
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy import stats
+
+from database_sqlite import MEASUREMENT_COLUMNS
+
+def _resample_mean_differences(treated, control, n_resamples, seed):
+    """Bootstrap (treated - control) mean differences for one chunk of resamples
+
+    Module-level so it can be pickled into worker processes. Every resample
+    is a row of an index matrix, so a whole chunk is one fancy-indexing pass
+    per group instead of a Python loop over resamples.
+    """
+    rng = np.random.default_rng(seed)
+    treated_idx = rng.integers(0, len(treated), size=(n_resamples, len(treated)))
+    control_idx = rng.integers(0, len(control), size=(n_resamples, len(control)))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        return (np.nanmean(treated[treated_idx], axis=1) -
+                np.nanmean(control[control_idx], axis=1))
+
+class BootstrapAnalyzer:
+    """Treatment-vs-control bootstrap CIs for every metric.
+
+    Resamples are split into chunks whose index matrices and gathered values
+    fit inside memory_limit_mb; each chunk gets its own child SeedSequence,
+    so results are reproducible regardless of how many worker processes run
+    or in which order the chunks finish.
+    """
+
+    def __init__(self, database, max_workers=None, memory_limit_mb=256):
+        self.db = database
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.memory_limit_mb = memory_limit_mb
+
+    def load_groups(self, experiment_id, metrics=None):
+        """Return {treatment_name: values matrix} and the list of control treatments"""
+        metrics = list(metrics or MEASUREMENT_COLUMNS)
+        for name in metrics:
+            if name not in MEASUREMENT_COLUMNS:
+                raise ValueError(f"Unknown metric '{name}'")
+        query = f"""
+            SELECT t.treatment_name, t.treatment_type_id = ? AS is_control, {', '.join('m.' + c for c in metrics)}
+            FROM measurements m
+            JOIN treatments t ON m.treatment_id = t.id
+            WHERE t.experiment_id = ?
+        """
+        df = pd.read_sql_query(query, self.db.connection,
+                               params=(self.db.lookup_id('treatment_types', 'control'), experiment_id))
+        groups = {name: group[metrics].to_numpy(dtype=float)
+                  for name, group in df.groupby('treatment_name')}
+        controls = sorted(df.loc[df['is_control'] == 1, 'treatment_name'].unique())
+        return groups, controls, metrics
+
+    def chunk_size(self, n_treated, n_control, n_metrics):
+        """Resamples per chunk allowed by the memory limit"""
+        # int64 indices plus float64 gathered values for both groups
+        bytes_per_resample = (n_treated + n_control) * (8 + 8 * n_metrics)
+        return max(1, int(self.memory_limit_mb * 1024 * 1024 // bytes_per_resample))
+
+    def bootstrap_distribution(self, treated, control, n_resamples=2000, seed=0):
+        """Bootstrap distribution of mean differences, shape (n_resamples, metrics)"""
+        per_chunk = self.chunk_size(len(treated), len(control), treated.shape[1])
+        sizes = [per_chunk] * (n_resamples // per_chunk)
+        if n_resamples % per_chunk:
+            sizes.append(n_resamples % per_chunk)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+        jobs = [(treated, control, size, s) for size, s in zip(sizes, seeds)]
+        if self.max_workers <= 1 or len(jobs) == 1:
+            parts = [_resample_mean_differences(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+                parts = list(pool.map(_resample_mean_differences, *zip(*jobs)))
+        return np.vstack(parts)
+
+    @staticmethod
+    def _jackknife_acceleration(treated, control):
+        """BCa acceleration from closed-form leave-one-out mean differences"""
+        def leave_one_out(values):
+            mask = ~np.isnan(values)
+            count = mask.sum(axis=0)
+            total = np.where(mask, values, 0.0).sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                loo = np.where(mask, (total - values) / (count - 1), np.nan)
+                return loo, total / count
+
+        loo_t, mean_t = leave_one_out(treated)
+        loo_c, mean_c = leave_one_out(control)
+        jack = np.vstack([loo_t - mean_c, mean_t - loo_c])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            dev = np.nanmean(jack, axis=0) - jack
+            num = np.nansum(dev ** 3, axis=0)
+            den = 6.0 * np.nansum(dev ** 2, axis=0) ** 1.5
+            return np.where(den > 0, num / den, 0.0)
+
+    @staticmethod
+    def _column_quantiles(boot, q):
+        """Per-column quantiles of the bootstrap matrix, q shaped (levels, metrics)"""
+        ordered = np.sort(boot, axis=0)                    # NaNs sort to the end
+        valid = (~np.isnan(boot)).sum(axis=0)
+        pos = np.clip(np.nan_to_num(q) * (valid - 1), 0, None)
+        lower = np.floor(pos).astype(int)
+        upper = np.minimum(lower + 1, np.maximum(valid - 1, 0))
+        frac = pos - lower
+        low_vals = np.take_along_axis(ordered, lower, axis=0)
+        high_vals = np.take_along_axis(ordered, upper, axis=0)
+        result = low_vals + frac * (high_vals - low_vals)
+        return np.where((valid > 0) & ~np.isnan(q), result, np.nan)
+
+    def confidence_intervals(self, treated, control, n_resamples=2000, confidence=0.95,
+                             method='bca', seed=0):
+        """Point estimate and CI of the mean difference for every metric column"""
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            estimate = np.nanmean(treated, axis=0) - np.nanmean(control, axis=0)
+        boot = self.bootstrap_distribution(treated, control, n_resamples, seed)
+
+        alpha = (1 - confidence) / 2
+        levels = np.array([alpha, 1 - alpha])[:, None] * np.ones((1, boot.shape[1]))
+        if method == 'bca':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                valid = (~np.isnan(boot)).sum(axis=0)
+                below = (boot < estimate).sum(axis=0) / valid
+                z0 = stats.norm.ppf(below)
+                accel = self._jackknife_acceleration(treated, control)
+                z = stats.norm.ppf(levels)
+                levels = stats.norm.cdf(z0 + (z0 + z) / (1 - accel * (z0 + z)))
+        elif method != 'percentile':
+            raise ValueError(f"Unknown interval method '{method}'")
+
+        bounds = self._column_quantiles(boot, levels)
+        return estimate, bounds[0], bounds[1]
+
+    def treatment_effects(self, experiment_id, control_name=None, metrics=None,
+                          n_resamples=2000, confidence=0.95, method='bca', seed=0):
+        """Bootstrap CIs of (treatment - control) for every treatment and metric"""
+        try:
+            groups, controls, metrics = self.load_groups(experiment_id, metrics)
+            control_name = control_name or (controls[0] if controls else None)
+            if control_name not in groups:
+                print("Error in bootstrap analysis: no control treatment with measurements")
+                return None
+
+            control = groups[control_name]
+            rows = []
+            for offset, (name, treated) in enumerate(sorted(groups.items())):
+                if name == control_name:
+                    continue
+                estimate, lower, upper = self.confidence_intervals(
+                    treated, control, n_resamples, confidence, method, seed=[seed, offset])
+                for k, metric in enumerate(metrics):
+                    rows.append({
+                        'treatment_name': name, 'control_name': control_name, 'metric': metric,
+                        'n_treatment': int((~np.isnan(treated[:, k])).sum()),
+                        'n_control': int((~np.isnan(control[:, k])).sum()),
+                        'mean_difference': estimate[k], 'ci_lower': lower[k], 'ci_upper': upper[k],
+                        'method': method, 'confidence': confidence, 'n_resamples': n_resamples
+                    })
+            return pd.DataFrame(rows).round(4) if rows else None
+
+        except Exception as e:
+            print(f"Error in bootstrap analysis: {e}")
+            return None
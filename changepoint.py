@@ -0,0 +1,203 @@
+# changepoint.py - STRESS-ONSET AND CHANGEPOINT DETECTION
+import numpy as np
+import pandas as pd
+
+from database_sqlite import MEASUREMENT_COLUMNS
+
+DEFAULT_METRICS = ('water_content', 'stomatal_conductance')
+
+class ChangepointDetector:
+    """Binary segmentation of treatment-minus-control series, all treatments at once.
+
+    Each treatment's daily mean is differenced against the control's daily
+    mean on a shared date grid, giving a (treatments x days) matrix. Segment
+    costs come from prefix sums, so evaluating every candidate split is O(n)
+    per series, and every split step is a single NumPy pass over the matrix.
+    Detected changepoints are stored in stress_onsets so the app can show
+    onset dates without recomputing.
+    """
+
+    def __init__(self, database, penalty_factor=2.0, max_changepoints=3, min_segment=2):
+        self.db = database
+        self.penalty_factor = penalty_factor
+        self.max_changepoints = max_changepoints
+        self.min_segment = min_segment
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the persisted changepoint table"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stress_onsets (
+                id INTEGER PRIMARY KEY,
+                experiment_id INTEGER NOT NULL,
+                treatment_id INTEGER NOT NULL,
+                control_treatment_id INTEGER NOT NULL,
+                metric TEXT NOT NULL,
+                change_date TEXT NOT NULL,
+                mean_before REAL,
+                mean_after REAL,
+                is_onset INTEGER DEFAULT 0,
+                detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (experiment_id) REFERENCES experiments (id) ON DELETE CASCADE,
+                FOREIGN KEY (treatment_id) REFERENCES treatments (id) ON DELETE CASCADE
+            )
+        """)
+        self.db.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stress_onsets_experiment
+            ON stress_onsets (experiment_id, metric)
+        """)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def divergence_matrix(self, experiment_id, metric, control_treatment_id=None):
+        """(treatment ids, control id, dates, treatments x days matrix of differences from control)"""
+        if metric not in MEASUREMENT_COLUMNS:
+            raise ValueError(f"Unknown metric '{metric}'")
+        query = f"""
+            SELECT m.treatment_id, t.treatment_type_id = ? AS is_control, m.measurement_date, AVG(m.{metric}) AS value
+            FROM measurements m
+            JOIN treatments t ON m.treatment_id = t.id
+            WHERE t.experiment_id = ? AND m.{metric} IS NOT NULL
+            GROUP BY m.treatment_id, m.measurement_date
+        """
+        df = pd.read_sql_query(query, self.db.connection,
+                               params=(self.db.lookup_id('treatment_types', 'control'), experiment_id))
+        if df.empty:
+            return None
+
+        if control_treatment_id is None:
+            controls = df.loc[df['is_control'] == 1, 'treatment_id']
+            if controls.empty:
+                return None
+            control_treatment_id = int(controls.min())
+
+        wide = df.pivot(index='treatment_id', columns='measurement_date', values='value')
+        wide = wide.sort_index(axis=1)
+        if control_treatment_id not in wide.index:
+            return None
+        # Fill gaps along each series so every treatment shares one date grid
+        wide = wide.interpolate(axis=1, limit_direction='both')
+        diff = wide.drop(index=control_treatment_id) - wide.loc[control_treatment_id]
+        diff = diff.dropna(how='any')
+        return list(diff.index), control_treatment_id, list(diff.columns), diff.to_numpy(dtype=float)
+
+    def segment(self, series):
+        """Binary segmentation of every row of series; returns a boolean changepoint mask
+
+        mask[r, i] is True when a new segment of row r starts at column i.
+        """
+        rows, n = series.shape
+        prefix = np.zeros((rows, n + 1))
+        prefix_sq = np.zeros((rows, n + 1))
+        prefix[:, 1:] = np.cumsum(series, axis=1)
+        prefix_sq[:, 1:] = np.cumsum(series ** 2, axis=1)
+
+        def cost(a, b):
+            """Within-segment sum of squares for [a, b) per row, vectorised"""
+            length = np.maximum(b - a, 1)
+            seg_sum = np.take_along_axis(prefix, b, 1) - np.take_along_axis(prefix, a, 1)
+            seg_sq = np.take_along_axis(prefix_sq, b, 1) - np.take_along_axis(prefix_sq, a, 1)
+            return seg_sq - seg_sum ** 2 / length
+
+        # Robust noise scale from first differences (MAD), one per series
+        steps = np.diff(series, axis=1)
+        mad = np.median(np.abs(steps - np.median(steps, axis=1, keepdims=True)), axis=1)
+        sigma = mad / 0.6745 / np.sqrt(2.0)
+        sigma = np.where(sigma > 0, sigma, np.std(series, axis=1) + 1e-12)
+        penalty = self.penalty_factor * sigma ** 2 * np.log(max(n, 2))
+
+        starts = np.zeros((rows, n + 1), dtype=bool)
+        starts[:, 0] = True
+        positions = np.broadcast_to(np.arange(n + 1), (rows, n + 1))
+        for _ in range(self.max_changepoints):
+            # Start and end of the segment containing every candidate split point
+            seg_start = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+            boundaries = starts.copy()
+            boundaries[:, n] = True
+            at_or_after = np.minimum.accumulate(
+                np.where(boundaries, positions, n)[:, ::-1], axis=1)[:, ::-1]
+            seg_end = np.concatenate([at_or_after[:, 1:], np.full((rows, 1), n)], axis=1)
+
+            gain = cost(seg_start, seg_end) - cost(seg_start, positions) - cost(positions, seg_end)
+            allowed = ((positions - seg_start >= self.min_segment) &
+                       (seg_end - positions >= self.min_segment) & ~starts)
+            gain = np.where(allowed, gain, -np.inf)
+
+            best = np.argmax(gain, axis=1)
+            best_gain = gain[np.arange(rows), best]
+            accept = best_gain > penalty
+            if not accept.any():
+                break
+            starts[np.flatnonzero(accept), best[accept]] = True
+
+        return starts[:, :n]
+
+    def detect(self, experiment_id, metrics=DEFAULT_METRICS, control_treatment_id=None):
+        """Detect changepoints for every treatment and metric and persist them"""
+        try:
+            self.create_tables()
+            rows = []
+            for metric in metrics:
+                matrix = self.divergence_matrix(experiment_id, metric, control_treatment_id)
+                if matrix is None:
+                    continue
+                treatment_ids, control_id, dates, series = matrix
+                if series.shape[1] < 2 * self.min_segment:
+                    continue
+
+                starts = self.segment(series)
+                segment_ids = np.cumsum(starts, axis=1) - 1
+                for r, treatment_id in enumerate(treatment_ids):
+                    means = np.bincount(segment_ids[r], weights=series[r]) / np.bincount(segment_ids[r])
+                    onset_found = False
+                    for seg, index in enumerate(np.flatnonzero(starts[r])[1:], start=1):
+                        before, after = means[seg - 1], means[seg]
+                        is_onset = not onset_found and abs(after) > abs(before)
+                        onset_found = onset_found or is_onset
+                        rows.append((experiment_id, int(treatment_id), control_id, metric,
+                                     dates[index], float(before), float(after), int(is_onset)))
+
+            with self.db.connection:
+                placeholders = ', '.join('?' * len(metrics))
+                self.db.connection.execute(
+                    f"DELETE FROM stress_onsets WHERE experiment_id = ? AND metric IN ({placeholders})",
+                    (experiment_id, *metrics))
+                self.db.connection.executemany("""
+                    INSERT INTO stress_onsets
+                    (experiment_id, treatment_id, control_treatment_id, metric,
+                     change_date, mean_before, mean_after, is_onset)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+            return self.get_changepoints(experiment_id)
+
+        except Exception as e:
+            print(f"Error detecting stress onset: {e}")
+            return None
+
+    def get_changepoints(self, experiment_id, onsets_only=False):
+        """Stored changepoints for an experiment, without recomputing"""
+        try:
+            self.create_tables()
+            query = """
+                SELECT t.treatment_name, s.metric, s.change_date, s.mean_before,
+                       s.mean_after, s.is_onset, s.detected_at
+                FROM stress_onsets s
+                JOIN treatments t ON s.treatment_id = t.id
+                WHERE s.experiment_id = ?
+            """
+            if onsets_only:
+                query += " AND s.is_onset = 1"
+            query += " ORDER BY s.metric, t.treatment_name, s.change_date"
+            results = self.db.execute_query(query, (experiment_id,))
+            if results:
+                return pd.DataFrame(results, columns=[
+                    'treatment_name', 'metric', 'change_date', 'mean_before',
+                    'mean_after', 'is_onset', 'detected_at'
+                ]).round(3)
+            return None
+
+        except Exception as e:
+            print(f"Error loading stress onsets: {e}")
+            return None
@@ -0,0 +1,291 @@
+# compact_storage.py - COMPACT STRICT / WITHOUT ROWID MEASUREMENT LAYOUT
+import os
+import time
+import random
+import sqlite3
+from datetime import date, timedelta
+
+from database_sqlite import MEASUREMENT_COLUMNS, MEASUREMENTS_TABLE
+
+EPOCH = date(1970, 1, 1)
+
+# Clustered on (treatment_id, day, id): one treatment's time series is stored
+# contiguously, so a date-range scan reads a few adjacent leaf pages
+COMPACT_TABLES = [
+    f"""
+    CREATE TABLE measurements_compact (
+        treatment_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        id INTEGER NOT NULL,
+        plant_id INTEGER,
+        {', '.join(f'{c} REAL' for c in MEASUREMENT_COLUMNS)},
+        created_at INTEGER,
+        updated_at_ms INTEGER,
+        PRIMARY KEY (treatment_id, day, id)
+    ) STRICT, WITHOUT ROWID
+    """,
+    "CREATE UNIQUE INDEX idx_measurements_compact_id ON measurements_compact (id)",
+    """
+    CREATE TABLE measurement_notes (
+        id INTEGER PRIMARY KEY,
+        notes TEXT NOT NULL
+    ) STRICT
+    """
+]
+
+# Same columns, in the same order, as the standard measurements table, for
+# reading the archived rows with plain SQL
+COMPACT_VIEW = f"""
+    CREATE VIEW measurements AS
+    SELECT c.id, c.treatment_id, date(c.day * 86400, 'unixepoch') AS measurement_date,
+           {', '.join('c.' + c for c in MEASUREMENT_COLUMNS)},
+           n.notes, datetime(c.created_at, 'unixepoch') AS created_at, c.plant_id,
+           strftime('%Y-%m-%d %H:%M:%S', c.updated_at_ms / 1000, 'unixepoch')
+               || printf('.%03d', c.updated_at_ms % 1000) AS updated_at
+    FROM measurements_compact c
+    LEFT JOIN measurement_notes n ON n.id = c.id
+"""
+
+def _io_read_bytes():
+    """Bytes this process has read through read()/pread(), or None off Linux
+
+    SQLite reads every page it misses in its own cache with pread(), so the
+    difference across a workload is the page cache misses times page_size.
+    """
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+def _days_to_date(day):
+    return (EPOCH + timedelta(days=day)).isoformat()
+
+class CompactMeasurementLayout:
+    """Optional dense storage of measurements for archive and benchmark copies.
+
+    The compact layout is a STRICT, WITHOUT ROWID table clustered on
+    (treatment_id, day, id) with integer dates (days since 1970-01-01) and
+    integer timestamps; notes, which are mostly empty, live in a side table.
+    A compact file is a full copy of the database in which measurements is a
+    read-only view over these tables, so plain SELECTs on measurements (the
+    benchmark, the sqlite3 shell) return the same rows. It is a benchmark and
+    archive copy only: StressDatabase refuses to open it, because the entry
+    forms, triggers and incremental jobs need the standard layout. expand()
+    converts a compact file back before it is used again. benchmark() compares
+    file size, page cache hit rate and range-scan speed of the two layouts on
+    the same data.
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    @staticmethod
+    def layout_of(path):
+        """'compact' or 'standard' for a database file"""
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'measurements'").fetchone()
+        finally:
+            conn.close()
+        return 'compact' if kind and kind[0] == 'view' else 'standard'
+
+    def _copy_to(self, source_path, target_path):
+        """Consistent copy of source_path at target_path via the backup API; returns its connection"""
+        source = sqlite3.connect(source_path, timeout=30)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+        target.execute("PRAGMA foreign_keys = OFF")
+        return target
+
+    def convert(self, target_path):
+        """Write a compact-layout copy of the open database to target_path; returns row and byte counts"""
+        if sqlite3.sqlite_version_info < (3, 37, 0):
+            raise RuntimeError(f"STRICT tables need SQLite 3.37 or newer (have {sqlite3.sqlite_version})")
+        start = time.perf_counter()
+        partial = target_path + '.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        self.db.connection.commit()
+        conn = self._copy_to(self.db.db_file, partial)
+        try:
+            # Integer days are only lossless for plain YYYY-MM-DD dates
+            bad = conn.execute(
+                "SELECT COUNT(*) FROM measurements WHERE date(measurement_date) IS NOT measurement_date").fetchone()[0]
+            if bad:
+                raise ValueError(f"{bad} measurements have dates that are not plain YYYY-MM-DD")
+            # STRICT columns reject values the standard table accepted silently
+            untyped = [name for name in MEASUREMENT_COLUMNS if conn.execute(
+                f"SELECT 1 FROM measurements WHERE typeof({name}) NOT IN ('real', 'integer', 'null') LIMIT 1"
+            ).fetchone()]
+            if untyped:
+                raise ValueError(f"Non-numeric values stored in: {', '.join(untyped)}")
+
+            with conn:
+                for statement in COMPACT_TABLES:
+                    conn.execute(statement)
+                rows = conn.execute(f"""
+                    INSERT INTO measurements_compact
+                    (treatment_id, day, id, plant_id, {', '.join(MEASUREMENT_COLUMNS)}, created_at, updated_at_ms)
+                    SELECT treatment_id, CAST(unixepoch(measurement_date) / 86400 AS INTEGER), id, plant_id,
+                           {', '.join(MEASUREMENT_COLUMNS)}, unixepoch(created_at),
+                           CAST(round((julianday(updated_at) - 2440587.5) * 86400000) AS INTEGER)
+                    FROM measurements
+                    ORDER BY treatment_id, measurement_date, id
+                """).rowcount
+                conn.execute("INSERT INTO measurement_notes SELECT id, notes FROM measurements WHERE notes IS NOT NULL")
+                # Dropping the table also drops its indexes and triggers
+                conn.execute("DROP TABLE measurements")
+                conn.execute(COMPACT_VIEW)
+            conn.execute("VACUUM")
+            conn.close()
+        except Exception:
+            conn.close()
+            os.remove(partial)
+            raise
+        os.replace(partial, target_path)
+
+        seconds = time.perf_counter() - start
+        print(f"✅ Compact copy written to {target_path} ({rows} measurements, {seconds:.1f} s)")
+        return {'rows': rows, 'seconds': seconds,
+                'standard_bytes': os.path.getsize(self.db.db_file),
+                'compact_bytes': os.path.getsize(target_path)}
+
+    def expand(self, compact_path, target_path):
+        """Write a standard-layout copy of a compact file to target_path; returns the row count
+
+        Indexes and triggers on measurements are recreated when the expanded
+        file is next opened with StressDatabase.
+        """
+        if self.layout_of(compact_path) != 'compact':
+            raise ValueError(f"{compact_path} does not use the compact layout")
+        partial = target_path + '.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        conn = self._copy_to(compact_path, partial)
+        try:
+            columns = ['id', 'treatment_id', 'measurement_date', *MEASUREMENT_COLUMNS,
+                       'notes', 'created_at', 'plant_id', 'updated_at']
+            with conn:
+                conn.execute("DROP VIEW measurements")
+                conn.execute(MEASUREMENTS_TABLE)
+                conn.execute(COMPACT_VIEW.replace("CREATE VIEW measurements", "CREATE TEMP VIEW compact_rows"))
+                rows = conn.execute(f"""
+                    INSERT INTO measurements ({', '.join(columns)})
+                    SELECT {', '.join(columns)} FROM temp.compact_rows ORDER BY id
+                """).rowcount
+                conn.execute("DROP VIEW temp.compact_rows")
+                conn.execute("DROP TABLE measurement_notes")
+                conn.execute("DROP TABLE measurements_compact")
+            conn.execute("VACUUM")
+            conn.close()
+        except Exception:
+            conn.close()
+            os.remove(partial)
+            raise
+        os.replace(partial, target_path)
+        print(f"✅ Standard copy written to {target_path} ({rows} measurements)")
+        return rows
+
+    @staticmethod
+    def _object_bytes(conn, names):
+        """Bytes used by each table or index (dbstat), or None without dbstat"""
+        try:
+            return {name: conn.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = ? AND aggregate = TRUE", (name,)).fetchone()[0]
+                for name in names}
+        except sqlite3.Error:
+            return None
+
+    def _run_scans(self, path, query, windows, cache_kib):
+        """Run the range scans on a fresh read-only connection; returns (seconds, rows, bytes read)"""
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            conn.execute(f"PRAGMA cache_size = -{cache_kib}")
+            conn.execute("PRAGMA mmap_size = 0")
+            read_before = _io_read_bytes()
+            start = time.perf_counter()
+            rows = 0
+            for params in windows:
+                rows += len(conn.execute(query, params).fetchall())
+            seconds = time.perf_counter() - start
+            read_after = _io_read_bytes()
+        finally:
+            conn.close()
+        return seconds, rows, None if read_before is None else read_after - read_before
+
+    def benchmark(self, compact_path, scans=500, window_days=7, cache_kib=2000, seed=0):
+        """Compare the live standard layout with a compact copy of it
+
+        Runs the same random (treatment, date window) range scans against
+        both files and returns {'standard': {...}, 'compact': {...}} with file
+        and per-object sizes, scan time, rows per second and, where the OS
+        reports read counts, page reads and an estimated cache hit rate.
+        The hit rate compares page reads under cache_kib of cache with page
+        reads under a minimal cache, which approximates the pages requested.
+        """
+        self.db.connection.commit()
+        conn = sqlite3.connect(f"file:{compact_path}?mode=ro", uri=True)
+        try:
+            spans = conn.execute(
+                "SELECT treatment_id, MIN(day), MAX(day) FROM measurements_compact GROUP BY treatment_id").fetchall()
+            compact_objects = self._object_bytes(
+                conn, ['measurements_compact', 'idx_measurements_compact_id', 'measurement_notes'])
+        finally:
+            conn.close()
+        if not spans:
+            return None
+
+        rng = random.Random(seed)
+        days = []
+        for _ in range(scans):
+            treatment_id, first, last = rng.choice(spans)
+            begin = rng.randint(first, max(first, last - window_days + 1))
+            days.append((treatment_id, begin, begin + window_days - 1))
+
+        metrics = ', '.join(MEASUREMENT_COLUMNS)
+        cases = {
+            'standard': (self.db.db_file,
+                         f"SELECT measurement_date, {metrics} FROM measurements "
+                         "WHERE treatment_id = ? AND measurement_date BETWEEN ? AND ?",
+                         [(t, _days_to_date(a), _days_to_date(b)) for t, a, b in days]),
+            'compact': (compact_path,
+                        f"SELECT day, {metrics} FROM measurements_compact "
+                        "WHERE treatment_id = ? AND day BETWEEN ? AND ?",
+                        days)
+        }
+
+        conn = sqlite3.connect(f"file:{self.db.db_file}?mode=ro", uri=True)
+        try:
+            standard_objects = self._object_bytes(
+                conn, ['measurements', 'idx_measurements_treatment_date'])
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        finally:
+            conn.close()
+
+        results = {}
+        for layout, (path, query, windows) in cases.items():
+            seconds, rows, read_bytes = self._run_scans(path, query, windows, cache_kib)
+            _, _, requested_bytes = self._run_scans(path, query, windows, 1)
+            result = {
+                'file_bytes': os.path.getsize(path),
+                'object_bytes': standard_objects if layout == 'standard' else compact_objects,
+                'scans': scans,
+                'rows': rows,
+                'seconds': seconds,
+                'rows_per_second': rows / seconds if seconds else None,
+                'page_reads': None,
+                'cache_hit_rate': None
+            }
+            if read_bytes is not None:
+                result['page_reads'] = read_bytes // page_size
+                if requested_bytes:
+                    result['cache_hit_rate'] = max(0.0, 1 - read_bytes / requested_bytes)
+            results[layout] = result
+        return results
@@ -1,25 +1,96 @@
 # database_sqlite.py - UPDATED VERSION
+import re
 import sqlite3
 import pandas as pd
 from datetime import datetime
 import os
 
+# Numeric physiological columns of the measurements table, in schema order
+MEASUREMENT_COLUMNS = [
+    'plant_height', 'leaf_area', 'chlorophyll_content', 'photosynthesis_rate',
+    'stomatal_conductance', 'root_length', 'biomass_fresh', 'biomass_dry',
+    'water_content'
+]
+
+# Tables whose updated_at is maintained by triggers and whose deletions are tombstoned
+CHANGE_TRACKED_TABLES = ('experiments', 'treatments', 'measurements')
+
+# Current time with milliseconds, as written by the change-tracking triggers
+NOW_MS = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Repeated text attributes stored once in a lookup table and referenced by integer code:
+# table -> ((text column, lookup table, code column), ...)
+LOOKUP_COLUMNS = {
+    'experiments': (
+        ('plant_species', 'species', 'species_id'),
+        ('stress_type', 'stress_types', 'stress_type_id'),
+        ('researcher', 'researchers', 'researcher_id')
+    ),
+    'treatments': (
+        ('treatment_type', 'treatment_types', 'treatment_type_id'),
+        ('stress_level', 'stress_levels', 'stress_level_id')
+    )
+}
+LOOKUP_CODE_COLUMNS = tuple(code for specs in LOOKUP_COLUMNS.values() for _, _, code in specs)
+
+# Tables whose rows move to a per-experiment partition file when an experiment is archived
+PARTITIONED_TABLES = ('treatments', 'plants', 'measurements')
+
+# Writes that bump an experiment's data version: table -> (events, experiment id of a {row})
+DATA_VERSION_SOURCES = {
+    'experiments': (('UPDATE',), "SELECT {row}.id"),
+    'treatments': (('INSERT', 'UPDATE', 'DELETE'), "SELECT {row}.experiment_id"),
+    'plants': (('INSERT', 'UPDATE', 'DELETE'), "SELECT experiment_id FROM treatments WHERE id = {row}.treatment_id"),
+    'measurements': (('INSERT', 'UPDATE', 'DELETE'), "SELECT experiment_id FROM treatments WHERE id = {row}.treatment_id")
+}
+
+# Standard (row-per-measurement) layout of the measurements table; compact_storage.py
+# converts to and from a denser layout
+MEASUREMENTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS measurements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        treatment_id INTEGER NOT NULL,
+        measurement_date TEXT NOT NULL,
+        plant_height REAL,
+        leaf_area REAL,
+        chlorophyll_content REAL,
+        photosynthesis_rate REAL,
+        stomatal_conductance REAL,
+        root_length REAL,
+        biomass_fresh REAL,
+        biomass_dry REAL,
+        water_content REAL,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        plant_id INTEGER REFERENCES plants (id) ON DELETE SET NULL,
+        updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+        FOREIGN KEY (treatment_id) REFERENCES treatments (id) ON DELETE CASCADE
+    )
+"""
+
 class StressDatabase:
     def __init__(self):
         self.db_file = "plant_stress.db"
         self.connection = None
         self.cursor = None
+        self._lookup_cache = {}
+        self.attached_partition = None
     
     def create_database(self):
         """Create SQLite database and tables"""
         try:
             self.connection = sqlite3.connect(self.db_file)
             self.cursor = self.connection.cursor()
+            self._lookup_cache = {}
+            self.attached_partition = None
             print(f"Using SQLite database: {self.db_file}")
             
             # Enable foreign keys
             self.cursor.execute("PRAGMA foreign_keys = ON")
             
+            # Lets freed pages be returned in steps; only takes effect on a new, empty file
+            self.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            
             # Create experiments table
             experiments_table = """
             CREATE TABLE IF NOT EXISTS experiments (
@@ -34,7 +105,10 @@ class StressDatabase:
                 description TEXT,
                 status TEXT DEFAULT 'active',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                species_id INTEGER REFERENCES species (id),
+                stress_type_id INTEGER REFERENCES stress_types (id),
+                researcher_id INTEGER REFERENCES researchers (id)
             )
             """
             self.cursor.execute(experiments_table)
@@ -43,7 +117,7 @@ class StressDatabase:
             # Create treatments table
             treatments_table = """
             CREATE TABLE IF NOT EXISTS treatments (
-                id INTEGER PRIMARY KEY,
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
                 experiment_id INTEGER NOT NULL,
                 treatment_name TEXT NOT NULL,
                 treatment_type TEXT NOT NULL,
@@ -54,6 +128,8 @@ class StressDatabase:
                 description TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                treatment_type_id INTEGER REFERENCES treatment_types (id),
+                stress_level_id INTEGER REFERENCES stress_levels (id),
                 FOREIGN KEY (experiment_id) REFERENCES experiments (id) ON DELETE CASCADE,
                 UNIQUE(experiment_id, treatment_name)
             )
@@ -62,27 +138,64 @@ class StressDatabase:
             print("✅ Table 2 (treatments) created successfully")
             
             # Create measurements table
-            measurements_table = """
-            CREATE TABLE IF NOT EXISTS measurements (
-                id INTEGER PRIMARY KEY,
+            # A compact-layout copy exposes measurements as a read-only view
+            kind = self.cursor.execute(
+                "SELECT type FROM sqlite_master WHERE name = 'measurements'").fetchone()
+            if kind and kind[0] == 'view':
+                print("❌ Database error: this file uses the compact measurement layout; expand it first (see compact_storage.py)")
+                return False
+            self.cursor.execute(MEASUREMENTS_TABLE)
+            print("✅ Table 3 (measurements) created successfully")
+            
+            # Create plants table (individual replicates within a treatment)
+            plants_table = """
+            CREATE TABLE IF NOT EXISTS plants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
                 treatment_id INTEGER NOT NULL,
-                measurement_date TEXT NOT NULL,
-                plant_height REAL,
-                leaf_area REAL,
-                chlorophyll_content REAL,
-                photosynthesis_rate REAL,
-                stomatal_conductance REAL,
-                root_length REAL,
-                biomass_fresh REAL,
-                biomass_dry REAL,
-                water_content REAL,
+                plant_label TEXT NOT NULL,
+                replicate INTEGER,
+                block TEXT,
+                position TEXT,
                 notes TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (treatment_id) REFERENCES treatments (id) ON DELETE CASCADE
+                FOREIGN KEY (treatment_id) REFERENCES treatments (id) ON DELETE CASCADE,
+                UNIQUE(treatment_id, plant_label)
             )
             """
-            self.cursor.execute(measurements_table)
-            print("✅ Table 3 (measurements) created successfully")
+            self.cursor.execute(plants_table)
+            print("✅ Table 4 (plants) created successfully")
+            
+            # Catalog of archived experiments whose rows live in their own files
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS experiment_partitions (
+                    experiment_id INTEGER PRIMARY KEY REFERENCES experiments (id) ON DELETE CASCADE,
+                    path TEXT NOT NULL,
+                    previous_status TEXT,
+                    treatments INTEGER,
+                    measurements INTEGER,
+                    file_bytes INTEGER,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            self.migrate_autoincrement()
+            self.migrate_plants()
+            self.migrate_change_tracking()
+            self.migrate_lookups()
+            self.install_history_triggers()
+            self.install_data_version_triggers()
+            
+            # Index used by per-treatment time-series queries
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_measurements_treatment_date
+                ON measurements (treatment_id, measurement_date)
+            """)
+            
+            # Index used by per-plant time-series queries
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_measurements_plant_date
+                ON measurements (plant_id, measurement_date)
+            """)
             
             self.connection.commit()
             print("✅ SQLite database connected successfully!")
@@ -92,6 +205,392 @@ class StressDatabase:
             print(f"❌ Database error: {e}")
             return False
     
+    def migrate_autoincrement(self):
+        """Rebuild older PARTITIONED_TABLES with AUTOINCREMENT ids
+        
+        A plain INTEGER PRIMARY KEY hands out one more than the largest id
+        currently in the table, so archiving an experiment whose rows hold the
+        largest ids would let new rows take them. AUTOINCREMENT ids are never
+        reused, which keeps restored partitions and delta destinations from
+        seeing two rows under one id. Each table is copied into a new one with
+        the same definition and its indexes and triggers are recreated.
+        """
+        tables = [(table, sql) for table in PARTITIONED_TABLES for (sql,) in self.cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchall()
+            if 'AUTOINCREMENT' not in sql.upper()]
+        if not tables:
+            return
+        
+        # Dropping a parent must not cascade, and renames must leave other tables' references alone
+        self.connection.commit()
+        self.cursor.execute("PRAGMA foreign_keys = OFF")
+        self.cursor.execute("PRAGMA legacy_alter_table = ON")
+        try:
+            self.cursor.execute("BEGIN")
+            for table, sql in tables:
+                dependents = [row[0] for row in self.cursor.execute("""
+                    SELECT sql FROM sqlite_master
+                    WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+                """, (table,)).fetchall()]
+                definition = re.sub(r'(?i)\bid\s+INTEGER\s+PRIMARY\s+KEY\b',
+                                    'id INTEGER PRIMARY KEY AUTOINCREMENT', sql, count=1)
+                definition = re.sub(rf'(?i)^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?"?{table}"?',
+                                    f'CREATE TABLE {table}_rebuild', definition, count=1)
+                self.cursor.execute(definition)
+                self.cursor.execute(f"INSERT INTO {table}_rebuild SELECT * FROM {table}")
+                self.cursor.execute(f"DROP TABLE {table}")
+                self.cursor.execute(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+                for statement in dependents:
+                    self.cursor.execute(statement)
+                print(f"✅ Migrated {table} to ids that are never reused")
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+        finally:
+            self.cursor.execute("PRAGMA legacy_alter_table = OFF")
+            self.cursor.execute("PRAGMA foreign_keys = ON")
+    
+    def migrate_plants(self):
+        """Add measurements.plant_id to older databases and infer plants for existing rows
+        
+        Older databases have no notion of individual plants. The n-th
+        measurement entered for a treatment on a given date is assumed to be
+        replicate n, which matches how replicates are normally typed in; the
+        generated plants are labelled R1, R2, ... and noted as inferred.
+        """
+        columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(measurements)")]
+        if 'plant_id' in columns:
+            return
+        
+        self.cursor.execute("ALTER TABLE measurements ADD COLUMN plant_id INTEGER REFERENCES plants (id) ON DELETE SET NULL")
+        self.cursor.execute("""
+            CREATE TEMP TABLE plant_migration AS
+            SELECT id, treatment_id,
+                   ROW_NUMBER() OVER (PARTITION BY treatment_id, measurement_date ORDER BY id) AS replicate
+            FROM measurements
+        """)
+        self.cursor.execute("""
+            INSERT OR IGNORE INTO plants (treatment_id, plant_label, replicate, notes)
+            SELECT DISTINCT treatment_id, 'R' || replicate, replicate,
+                   'Migrated: replicate inferred from entry order'
+            FROM plant_migration
+        """)
+        self.cursor.execute("""
+            UPDATE measurements SET plant_id = (
+                SELECT p.id FROM plant_migration pm
+                JOIN plants p ON p.treatment_id = pm.treatment_id AND p.plant_label = 'R' || pm.replicate
+                WHERE pm.id = measurements.id
+            )
+        """)
+        self.cursor.execute("DROP TABLE plant_migration")
+        print("✅ Migrated existing measurements to per-plant records")
+    
+    def migrate_change_tracking(self):
+        """Maintain updated_at with triggers and record deletions as tombstones
+        
+        Older databases get measurements.updated_at backfilled from
+        created_at. Timestamps written by the triggers carry milliseconds so
+        delta exports can tell apart changes made within the same second.
+        """
+        columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(measurements)")]
+        if 'updated_at' not in columns:
+            self.cursor.execute("ALTER TABLE measurements ADD COLUMN updated_at TIMESTAMP")
+            self.cursor.execute("UPDATE measurements SET updated_at = created_at")
+        
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS deleted_rows (
+                id INTEGER PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                deleted_at TIMESTAMP NOT NULL
+            )
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_deleted_rows_time ON deleted_rows (deleted_at)")
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS export_watermarks (
+                destination TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                watermark TEXT NOT NULL,
+                exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (destination, table_name)
+            )
+        """)
+        
+        for table in CHANGE_TRACKED_TABLES:
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_updated ON {table} (updated_at)")
+            self.cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_stamp_insert
+                AFTER INSERT ON {table} FOR EACH ROW WHEN NEW.updated_at IS NULL
+                BEGIN
+                    UPDATE {table} SET updated_at = {NOW_MS} WHERE id = NEW.id;
+                END
+            """)
+            # Only stamp when the statement did not set updated_at itself
+            self.cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_stamp_update
+                AFTER UPDATE ON {table} FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+                BEGIN
+                    UPDATE {table} SET updated_at = {NOW_MS} WHERE id = NEW.id;
+                END
+            """)
+            self.cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_tombstone
+                AFTER DELETE ON {table} FOR EACH ROW
+                BEGIN
+                    INSERT INTO deleted_rows (table_name, row_id, deleted_at)
+                    VALUES ('{table}', OLD.id, {NOW_MS});
+                END
+            """)
+    
+    def migrate_lookups(self):
+        """Dictionary-encode the repeated text attributes listed in LOOKUP_COLUMNS
+        
+        Each attribute gets a lookup table of distinct names and an integer
+        code column, backfilled for existing rows. Triggers keep the codes in
+        step with the text on every insert and update, so code that writes
+        the text columns (forms, imports, merges) needs no changes; grouping
+        and filtering can then use the small integer codes.
+        """
+        for table, specs in LOOKUP_COLUMNS.items():
+            columns = [row[1] for row in self.cursor.execute(f"PRAGMA table_info({table})")]
+            for text_column, lookup, code_column in specs:
+                self.cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {lookup} (
+                        id INTEGER PRIMARY KEY,
+                        name TEXT UNIQUE NOT NULL
+                    )
+                """)
+                if code_column not in columns:
+                    self.cursor.execute(
+                        f"ALTER TABLE {table} ADD COLUMN {code_column} INTEGER REFERENCES {lookup} (id)")
+                    self.cursor.execute(f"""
+                        INSERT OR IGNORE INTO {lookup} (name)
+                        SELECT DISTINCT {text_column} FROM {table} WHERE {text_column} IS NOT NULL
+                    """)
+                    self.cursor.execute(f"""
+                        UPDATE {table} SET {code_column} = (
+                            SELECT id FROM {lookup} WHERE name = {table}.{text_column})
+                    """)
+                    print(f"✅ Encoded {table}.{text_column} as {lookup} codes")
+                self.cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{code_column} ON {table} ({code_column})")
+            
+            # Register new names, then point the row at their codes
+            body = ''.join(f"""
+                    INSERT OR IGNORE INTO {lookup} (name)
+                    SELECT NEW.{text_column} WHERE NEW.{text_column} IS NOT NULL;""" for text_column, lookup, _ in specs)
+            assignments = ', '.join(f"{code_column} = (SELECT id FROM {lookup} WHERE name = NEW.{text_column})"
+                                    for text_column, lookup, code_column in specs)
+            text_columns = ', '.join(text_column for text_column, _, _ in specs)
+            for event in ('INSERT', f'UPDATE OF {text_columns}'):
+                self.cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_lookup_{event.split()[0].lower()}
+                    AFTER {event} ON {table} FOR EACH ROW
+                    BEGIN{body}
+                        UPDATE {table} SET {assignments} WHERE id = NEW.id;
+                    END
+                """)
+    
+    def install_data_version_triggers(self):
+        """Count writes to each experiment's data in experiment_data_versions
+        
+        Every insert, update or delete that reaches an experiment through
+        DATA_VERSION_SOURCES increments its version, so anything derived from
+        an experiment's data (cached analysis results, snapshots) is current
+        exactly when it was computed at the experiment's present version.
+        Experiments with no recorded writes are at version 0.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS experiment_data_versions (
+                experiment_id INTEGER PRIMARY KEY REFERENCES experiments (id) ON DELETE CASCADE,
+                version INTEGER NOT NULL
+            )
+        """)
+        for table, (events, experiment) in DATA_VERSION_SOURCES.items():
+            for event in events:
+                rows = {'INSERT': ('NEW',), 'UPDATE': ('OLD', 'NEW'), 'DELETE': ('OLD',)}[event]
+                experiments = ' UNION '.join(experiment.format(row=row) for row in rows)
+                # Parents removed in the same statement (cascades) have nothing left to version
+                self.cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_data_version_{event.lower()}
+                    AFTER {event} ON {table} FOR EACH ROW
+                    BEGIN
+                        INSERT INTO experiment_data_versions (experiment_id, version)
+                        SELECT id, 1 FROM experiments WHERE id IN ({experiments})
+                        ON CONFLICT (experiment_id) DO UPDATE SET version = version + 1;
+                    END
+                """)
+    
+    def data_version(self, experiment_id):
+        """Number of writes so far to an experiment's data"""
+        result = self.cursor.execute(
+            "SELECT version FROM experiment_data_versions WHERE experiment_id = ?", (experiment_id,)).fetchone()
+        return result[0] if result else 0
+    
+    def lookup_names(self, lookup, codes=(), refresh=False):
+        """{code: name} for a lookup table, cached; reloaded when any of codes is unknown"""
+        names = self._lookup_cache.get(lookup)
+        if refresh or names is None or any(code not in names for code in codes if code is not None):
+            names = dict(self.cursor.execute(f"SELECT id, name FROM {lookup}").fetchall())
+            self._lookup_cache[lookup] = names
+        return names
+    
+    def lookup_id(self, lookup, name):
+        """Code of name in a lookup table, or None if the name has never been used"""
+        names = self.lookup_names(lookup)
+        if name not in names.values():
+            names = self.lookup_names(lookup, refresh=True)
+        return next((code for code, value in names.items() if value == name), None)
+    
+    def lookup_matches(self, lookup, term):
+        """Codes whose name contains term, ignoring case as LIKE '%term%' does"""
+        term = term.lower()
+        return [code for code, name in self.lookup_names(lookup, refresh=True).items() if term in name.lower()]
+    
+    def install_history_triggers(self):
+        """Record every update and delete of the tracked tables in change_history
+        
+        Updates store only the previous values of the columns that changed, as
+        a JSON object; deletes store the whole previous row. Together with the
+        current rows this is enough to rebuild any row as of a past time (see
+        audit.py). Triggers are rebuilt on every start so they follow schema
+        changes; updated_at or lookup codes alone changing is not recorded.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS change_history (
+                id INTEGER PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                operation TEXT NOT NULL,
+                changed_at TIMESTAMP NOT NULL,
+                old_values TEXT NOT NULL
+            )
+        """)
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_change_history_row
+            ON change_history (table_name, row_id, changed_at)
+        """)
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_change_history_time
+            ON change_history (table_name, changed_at)
+        """)
+        
+        for table in CHANGE_TRACKED_TABLES:
+            columns = [row[1] for row in self.cursor.execute(f"PRAGMA table_info({table})")
+                       if row[1] not in ('id', 'updated_at') and row[1] not in LOOKUP_CODE_COLUMNS]
+            changed = ' OR '.join(f"OLD.{c} IS NOT NEW.{c}" for c in columns)
+            deltas = ' UNION ALL '.join(
+                f"SELECT '{c}' AS k, OLD.{c} AS v WHERE OLD.{c} IS NOT NEW.{c}" for c in columns)
+            full_row = ', '.join(f"'{c}', OLD.{c}" for c in columns + ['updated_at'])
+            
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_history_update")
+            self.cursor.execute(f"""
+                CREATE TRIGGER trg_{table}_history_update
+                AFTER UPDATE ON {table} FOR EACH ROW WHEN {changed}
+                BEGIN
+                    INSERT INTO change_history (table_name, row_id, operation, changed_at, old_values)
+                    VALUES ('{table}', OLD.id, 'U', {NOW_MS},
+                            (SELECT json_group_object(k, v) FROM ({deltas})));
+                END
+            """)
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_history_delete")
+            self.cursor.execute(f"""
+                CREATE TRIGGER trg_{table}_history_delete
+                AFTER DELETE ON {table} FOR EACH ROW
+                BEGIN
+                    INSERT INTO change_history (table_name, row_id, operation, changed_at, old_values)
+                    VALUES ('{table}', OLD.id, 'D', {NOW_MS}, json_object({full_row}));
+                END
+            """)
+    
+    def get_delta(self, destination, tables=CHANGE_TRACKED_TABLES):
+        """Rows changed since the last export to destination, plus deletions
+        
+        Returns (frames, watermarks): a DataFrame per table and 'deleted_rows',
+        and the watermarks to store with save_export_watermarks once the
+        export has been written. Rows stamped exactly at the previous
+        watermark are included again, so no change is ever missed.
+        """
+        stored = dict(self.cursor.execute(
+            "SELECT table_name, watermark FROM export_watermarks WHERE destination = ?",
+            (destination,)).fetchall())
+        frames, watermarks = {}, {}
+        for table in (*tables, 'deleted_rows'):
+            column = 'deleted_at' if table == 'deleted_rows' else 'updated_at'
+            since = stored.get(table)
+            query = f"SELECT * FROM main.{table}"
+            if since is not None:
+                query += f" WHERE {column} >= ?"
+            frames[table] = pd.read_sql_query(query, self.connection,
+                                              params=(since,) if since is not None else None)
+            latest = frames[table][column].max() if not frames[table].empty else None
+            watermarks[table] = latest if isinstance(latest, str) else since
+        return frames, watermarks
+    
+    def save_export_watermarks(self, destination, watermarks):
+        """Record how far destination has been exported"""
+        self.cursor.executemany("""
+            INSERT OR REPLACE INTO export_watermarks (destination, table_name, watermark, exported_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        """, [(destination, table, mark) for table, mark in watermarks.items() if mark is not None])
+        self.connection.commit()
+    
+    def get_or_create_plant(self, treatment_id, plant_label, replicate=None, block=None, position=None):
+        """Return the id of a plant in a treatment, creating it if needed"""
+        existing = self.execute_query(
+            "SELECT id FROM plants WHERE treatment_id = ? AND plant_label = ?",
+            (treatment_id, plant_label))
+        if existing:
+            return existing[0][0]
+        self.cursor.execute("""
+            INSERT INTO plants (treatment_id, plant_label, replicate, block, position)
+            VALUES (?, ?, ?, ?, ?)
+        """, (treatment_id, plant_label, replicate, block, position))
+        self.connection.commit()
+        return self.cursor.lastrowid
+    
+    def partition_path(self, experiment_id):
+        """File holding an archived experiment's rows, or None if it lives in the main file"""
+        result = self.cursor.execute(
+            "SELECT path FROM experiment_partitions WHERE experiment_id = ?", (experiment_id,)).fetchone()
+        return result[0] if result else None
+    
+    def use_experiment(self, experiment_id):
+        """Make experiment_id's rows visible to queries, attaching its partition if it is archived
+        
+        While a partition is attached, temp views named after PARTITIONED_TABLES
+        shadow the main tables, so existing queries on treatments, plants and
+        measurements read the archived experiment unchanged. The views are
+        read-only; switching to an experiment in the main file detaches the
+        partition again. Returns True if a partition is in use.
+        """
+        path = self.partition_path(experiment_id) if experiment_id is not None else None
+        if path is None:
+            self.detach_partition()
+            return False
+        if self.attached_partition == experiment_id:
+            return True
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Partition file {path} is missing")
+        
+        self.detach_partition()
+        self.connection.commit()
+        self.cursor.execute("ATTACH DATABASE ? AS partition", (path,))
+        for table in PARTITIONED_TABLES:
+            self.cursor.execute(f"CREATE TEMP VIEW {table} AS SELECT * FROM partition.{table}")
+        self.attached_partition = experiment_id
+        return True
+    
+    def detach_partition(self):
+        """Drop the shadow views and detach the partition, if one is attached"""
+        if self.attached_partition is None:
+            return
+        for table in PARTITIONED_TABLES:
+            self.cursor.execute(f"DROP VIEW IF EXISTS temp.{table}")
+        self.connection.commit()
+        self.cursor.execute("DETACH DATABASE partition")
+        self.attached_partition = None
+    
     def execute_query(self, query, params=None):
         """Execute a query and return results"""
         try:
@@ -122,25 +621,39 @@ class StressDatabase:
                 print(f"With params: {params}")
             return False
     
-    def export_to_excel(self):
-        """Export all data to Excel file"""
+    def export_to_excel(self, filename='plant_stress_data.xlsx', destination=None):
+        """Export all data to Excel file, or only changes since the last export to destination"""
         try:
-            # Get experiments data
-            experiments_df = pd.read_sql_query("SELECT * FROM experiments", self.connection)
-            
-            # Get treatments data
-            treatments_df = pd.read_sql_query("SELECT * FROM treatments", self.connection)
-            
-            # Get measurements data
-            measurements_df = pd.read_sql_query("SELECT * FROM measurements", self.connection)
+            if destination:
+                frames, watermarks = self.get_delta(destination)
+                experiments_df = frames['experiments']
+                treatments_df = frames['treatments']
+                measurements_df = frames['measurements']
+                deleted_df = frames['deleted_rows']
+            else:
+                # Get experiments data
+                experiments_df = pd.read_sql_query("SELECT * FROM experiments", self.connection)
+                
+                # Get treatments data
+                treatments_df = pd.read_sql_query("SELECT * FROM main.treatments", self.connection)
+                
+                # Get measurements data
+                measurements_df = pd.read_sql_query("SELECT * FROM main.measurements", self.connection)
             
             # Create Excel writer
-            with pd.ExcelWriter('plant_stress_data.xlsx', engine='openpyxl') as writer:
+            with pd.ExcelWriter(filename, engine='openpyxl') as writer:
                 experiments_df.to_excel(writer, sheet_name='Experiments', index=False)
                 treatments_df.to_excel(writer, sheet_name='Treatments', index=False)
                 measurements_df.to_excel(writer, sheet_name='Measurements', index=False)
+                if destination:
+                    deleted_df.to_excel(writer, sheet_name='Deleted', index=False)
             
-            print("✅ Data exported to plant_stress_data.xlsx")
+            if destination:
+                self.save_export_watermarks(destination, watermarks)
+                print(f"✅ Changes since last export to '{destination}' written to {filename} "
+                      f"({len(measurements_df)} measurements, {len(deleted_df)} deletions)")
+            else:
+                print(f"✅ Data exported to {filename}")
             return True
             
         except Exception as e:
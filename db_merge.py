@@ -0,0 +1,223 @@
+# db_merge.py - MERGE MEASUREMENTS FROM OTHER LAB DATABASE FILES
+import os
+
+from database_sqlite import MEASUREMENT_COLUMNS, LOOKUP_CODE_COLUMNS, NOW_MS
+
+# Fields compared when the same experiment/treatment exists on both sides
+EXPERIMENT_FIELDS = ('experiment_name', 'plant_species', 'stress_type', 'researcher', 'start_date', 'end_date')
+TREATMENT_FIELDS = ('treatment_type', 'stress_level', 'concentration', 'duration_days', 'temperature')
+
+class DatabaseMerger:
+    """Merge the core tables of other plant_stress.db files into this database.
+
+    Each source file is ATTACHed and merged in one transaction with set-based
+    INSERT ... SELECT statements. Experiments are matched by experiment_code,
+    treatments by (experiment, treatment_name) and plants by (treatment,
+    plant_label); unmatched ones are created, and temporary id maps translate
+    the source's ids to ours. Measurements already present (same treatment,
+    date, entry time and values) are skipped, so merging a file twice is
+    harmless. Matched records whose descriptive fields differ are reported as
+    conflicts and keep this database's values. Merged rows are stamped with
+    the merge time as updated_at, so the next delta export includes them. Source experiments
+    being deleted, or archived to a partition file the source keeps elsewhere,
+    are skipped and listed.
+    """
+
+    def __init__(self, database):
+        self.db = database
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the merge history table"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS database_merges (
+                id INTEGER PRIMARY KEY,
+                source_path TEXT NOT NULL,
+                experiments_added INTEGER,
+                treatments_added INTEGER,
+                measurements_added INTEGER,
+                conflicts INTEGER,
+                merged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def _columns(self, schema, table):
+        return [row[1] for row in self.db.connection.execute(f"PRAGMA {schema}.table_info({table})")]
+
+    def _shared_columns(self, table, exclude):
+        # Lookup codes are local to each file; the insert triggers derive them from the text.
+        # updated_at is stamped here (see _stamped) so merged rows count as changed locally.
+        theirs = set(self._columns('src', table))
+        return [c for c in self._columns('main', table)
+                if c in theirs and c not in exclude and c != 'updated_at' and c not in LOOKUP_CODE_COLUMNS]
+
+    def _stamped(self, table, columns, values):
+        """Column and value lists for an INSERT, with updated_at set to now when the table has it"""
+        if 'updated_at' in self._columns('main', table):
+            return ', '.join([*columns, 'updated_at']), ', '.join([*values, NOW_MS])
+        return ', '.join(columns), ', '.join(values)
+
+    def merge_files(self, paths, progress_callback=None):
+        """Merge several database files; returns a summary dict with per-file counts and conflicts"""
+        self.create_tables()
+        summary = {'files': 0, 'experiments': 0, 'treatments': 0, 'measurements': 0,
+                   'conflicts': [], 'skipped': [], 'errors': []}
+        for number, path in enumerate(paths, start=1):
+            result = self.merge_file(path)
+            if result is None:
+                summary['errors'].append(path)
+            else:
+                summary['files'] += 1
+                for key in ('experiments', 'treatments', 'measurements'):
+                    summary[key] += result[key]
+                summary['conflicts'].extend(result['conflicts'])
+                summary['skipped'].extend(result['skipped'])
+            if progress_callback:
+                progress_callback(number, len(paths))
+        return summary
+
+    def merge_file(self, path):
+        """Merge one database file in a single transaction; returns counts and conflicts"""
+        try:
+            self.create_tables()
+            if os.path.abspath(path) == os.path.abspath(self.db.db_file):
+                raise ValueError("cannot merge a database into itself")
+            conn = self.db.connection
+            conn.commit()
+            conn.execute("ATTACH DATABASE ? AS src", (path,))
+            try:
+                with conn:
+                    return self._merge_attached(path)
+            finally:
+                conn.execute("DETACH DATABASE src")
+
+        except Exception as e:
+            print(f"❌ Error merging {path}: {e}")
+            return None
+
+    def _merge_attached(self, path):
+        conn = self.db.connection
+        result = {'source': path, 'conflicts': []}
+        for name in ('experiment_map', 'treatment_map', 'plant_map'):
+            conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+            conn.execute(f"CREATE TEMP TABLE {name} (src_id INTEGER PRIMARY KEY, dst_id INTEGER NOT NULL)")
+
+        # Experiments by code; a status of 'deleting' or 'archived' means the source's rows are
+        # partial or live in another file, so those experiments are left out
+        columns = self._shared_columns('experiments', ('id',))
+        merged = "s.status IS NOT 'deleting' AND s.status IS NOT 'archived'" if 'status' in columns else '1'
+        result['skipped'] = [code for (code,) in conn.execute(
+            f"SELECT experiment_code FROM src.experiments s WHERE NOT ({merged}) ORDER BY experiment_code")]
+        result['conflicts'] += self._conflicts(
+            'experiment', """
+                SELECT s.experiment_code, {fields}
+                FROM src.experiments s JOIN main.experiments e ON e.experiment_code = s.experiment_code
+            """, [f for f in EXPERIMENT_FIELDS if f in columns], 'e', 's')
+        targets, values = self._stamped('experiments', columns, ['s.' + c for c in columns])
+        result['experiments'] = conn.execute(f"""
+            INSERT INTO main.experiments ({targets})
+            SELECT {values} FROM src.experiments s
+            WHERE {merged}
+              AND NOT EXISTS (SELECT 1 FROM main.experiments e WHERE e.experiment_code = s.experiment_code)
+        """).rowcount
+        conn.execute(f"""
+            INSERT INTO temp.experiment_map
+            SELECT s.id, e.id FROM src.experiments s
+            JOIN main.experiments e ON e.experiment_code = s.experiment_code
+            WHERE {merged}
+        """)
+
+        # Treatments by (experiment, name)
+        columns = self._shared_columns('treatments', ('id', 'experiment_id'))
+        result['conflicts'] += self._conflicts(
+            'treatment', """
+                SELECT e.experiment_code || ' / ' || s.treatment_name, {fields}
+                FROM src.treatments s
+                JOIN temp.experiment_map em ON s.experiment_id = em.src_id
+                JOIN main.experiments e ON e.id = em.dst_id
+                JOIN main.treatments t ON t.experiment_id = em.dst_id AND t.treatment_name = s.treatment_name
+            """, [f for f in TREATMENT_FIELDS if f in columns], 't', 's')
+        targets, values = self._stamped('treatments', ['experiment_id', *columns],
+                                        ['em.dst_id', *('s.' + c for c in columns)])
+        result['treatments'] = conn.execute(f"""
+            INSERT INTO main.treatments ({targets})
+            SELECT {values}
+            FROM src.treatments s JOIN temp.experiment_map em ON s.experiment_id = em.src_id
+            WHERE NOT EXISTS (SELECT 1 FROM main.treatments t
+                              WHERE t.experiment_id = em.dst_id AND t.treatment_name = s.treatment_name)
+        """).rowcount
+        conn.execute("""
+            INSERT INTO temp.treatment_map
+            SELECT s.id, t.id FROM src.treatments s
+            JOIN temp.experiment_map em ON s.experiment_id = em.src_id
+            JOIN main.treatments t ON t.experiment_id = em.dst_id AND t.treatment_name = s.treatment_name
+        """)
+
+        # Plants by (treatment, label); files from before per-plant tracking have none
+        has_plants = bool(self._columns('src', 'plants'))
+        if has_plants:
+            columns = self._shared_columns('plants', ('id', 'treatment_id'))
+            targets, values = self._stamped('plants', ['treatment_id', *columns],
+                                            ['tm.dst_id', *('s.' + c for c in columns)])
+            conn.execute(f"""
+                INSERT INTO main.plants ({targets})
+                SELECT {values}
+                FROM src.plants s JOIN temp.treatment_map tm ON s.treatment_id = tm.src_id
+                WHERE NOT EXISTS (SELECT 1 FROM main.plants p
+                                  WHERE p.treatment_id = tm.dst_id AND p.plant_label = s.plant_label)
+            """)
+            conn.execute("""
+                INSERT INTO temp.plant_map
+                SELECT s.id, p.id FROM src.plants s
+                JOIN temp.treatment_map tm ON s.treatment_id = tm.src_id
+                JOIN main.plants p ON p.treatment_id = tm.dst_id AND p.plant_label = s.plant_label
+            """)
+
+        # Measurements, skipping rows this database already holds
+        columns = self._shared_columns('measurements', ('id', 'treatment_id', 'plant_id'))
+        plant_source = 'pm.dst_id' if has_plants and 'plant_id' in self._columns('src', 'measurements') else 'NULL'
+        plant_join = 'LEFT JOIN temp.plant_map pm ON s.plant_id = pm.src_id' if plant_source != 'NULL' else ''
+        same_values = ' AND '.join(f"m.{c} IS s.{c}" for c in ('measurement_date', 'created_at', *MEASUREMENT_COLUMNS)
+                                   if c in columns)
+        targets, values = self._stamped('measurements', ['treatment_id', 'plant_id', *columns],
+                                        ['tm.dst_id', plant_source, *('s.' + c for c in columns)])
+        result['measurements'] = conn.execute(f"""
+            INSERT INTO main.measurements ({targets})
+            SELECT {values}
+            FROM src.measurements s
+            JOIN temp.treatment_map tm ON s.treatment_id = tm.src_id
+            {plant_join}
+            WHERE NOT EXISTS (SELECT 1 FROM main.measurements m
+                              WHERE m.treatment_id = tm.dst_id AND {same_values})
+        """).rowcount
+
+        conn.execute("""
+            INSERT INTO database_merges
+            (source_path, experiments_added, treatments_added, measurements_added, conflicts)
+            VALUES (?, ?, ?, ?, ?)
+        """, (os.path.abspath(path), result['experiments'], result['treatments'],
+              result['measurements'], len(result['conflicts'])))
+        for name in ('experiment_map', 'treatment_map', 'plant_map'):
+            conn.execute(f"DROP TABLE temp.{name}")
+        return result
+
+    def _conflicts(self, kind, query, fields, ours, theirs):
+        """Matched records whose fields differ, as dicts"""
+        if not fields:
+            return []
+        selected = ', '.join(f"{ours}.{f}, {theirs}.{f}" for f in fields)
+        differs = ' OR '.join(f"{ours}.{f} IS NOT {theirs}.{f}" for f in fields)
+        rows = self.db.connection.execute(
+            query.format(fields=selected) + f" WHERE {differs}").fetchall()
+        conflicts = []
+        for row in rows:
+            for i, field in enumerate(fields):
+                ours_value, theirs_value = row[1 + 2 * i], row[2 + 2 * i]
+                if ours_value != theirs_value:
+                    conflicts.append({'kind': kind, 'key': row[0], 'field': field,
+                                      'ours': ours_value, 'theirs': theirs_value})
+        return conflicts
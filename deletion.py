@@ -0,0 +1,183 @@
+# deletion.py - CHUNKED, RESUMABLE BACKGROUND DELETION OF LARGE EXPERIMENTS
+import json
+import time
+import sqlite3
+import threading
+
+class ChunkedDeleter:
+    """Delete an experiment in many short transactions instead of one huge cascade.
+
+    A job row in deletion_jobs is created first and the experiment is marked
+    'deleting' so the app stops listing it. Measurements are then removed
+    chunk_size at a time, each chunk committed together with the job's
+    progress, so other writers only ever wait for one chunk and a crash loses
+    at most the chunk in flight; resume() picks up unfinished jobs. Treatments
+    and the experiment go last. If the database uses incremental auto-vacuum,
+    freed pages are returned to the file system afterwards.
+
+    Every deleted row gets its history entry and tombstone as usual, so
+    ChangeHistory can still rebuild the experiment as of an earlier time and
+    delta exports carry each deletion. Those history entries hold the whole
+    rows, so the file grows by about the size of the data deleted.
+    prune_history=True drops the audit history of the deleted treatments and
+    measurements instead, in the same transactions: the file does not grow,
+    but the experiment can no longer be rebuilt as of any earlier time. The
+    tombstones are kept either way.
+    """
+
+    def __init__(self, database, chunk_size=5000, vacuum=True, vacuum_pages=2000, prune_history=False):
+        self.db = database
+        self.chunk_size = chunk_size
+        self.vacuum = vacuum
+        self.vacuum_pages = vacuum_pages
+        self.prune_history = prune_history
+        self.progress = None
+        self._thread = None
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the deletion job table"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS deletion_jobs (
+                id INTEGER PRIMARY KEY,
+                experiment_id INTEGER NOT NULL,
+                experiment_code TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                total_rows INTEGER,
+                deleted_rows INTEGER DEFAULT 0,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def schedule_delete(self, experiment_id):
+        """Create a deletion job and hide the experiment; returns the job id"""
+        self.create_tables()
+        total = self.db.execute_query("""
+            SELECT COUNT(*) FROM measurements m
+            JOIN treatments t ON m.treatment_id = t.id
+            WHERE t.experiment_id = ?
+        """, (experiment_id,))[0][0]
+        code = self.db.execute_query(
+            "SELECT experiment_code FROM experiments WHERE id = ?", (experiment_id,))
+        with self.db.connection:
+            self.db.connection.execute(
+                "UPDATE experiments SET status = 'deleting' WHERE id = ?", (experiment_id,))
+            job_id = self.db.connection.execute("""
+                INSERT INTO deletion_jobs (experiment_id, experiment_code, status, total_rows)
+                VALUES (?, ?, 'pending', ?)
+            """, (experiment_id, code[0][0] if code else None, total)).lastrowid
+        return job_id
+
+    def pending_jobs(self):
+        """Ids of jobs not yet finished, oldest first"""
+        self.create_tables()
+        results = self.db.execute_query(
+            "SELECT id FROM deletion_jobs WHERE status != 'done' ORDER BY id")
+        return [row[0] for row in results or []]
+
+    def run_job(self, job_id, progress_callback=None):
+        """Carry a job to completion on a private connection; returns rows deleted by this call
+
+        Safe to call from a worker thread, and safe to call again for a job
+        that was interrupted.
+        """
+        conn = sqlite3.connect(self.db.db_file, timeout=30)
+        try:
+            conn.execute("PRAGMA foreign_keys = ON")
+            experiment_id, total, done = conn.execute(
+                "SELECT experiment_id, total_rows, deleted_rows FROM deletion_jobs WHERE id = ?",
+                (job_id,)).fetchone()
+            with conn:
+                conn.execute("UPDATE deletion_jobs SET status = 'running' WHERE id = ?", (job_id,))
+
+            deleted = 0
+            while True:
+                with conn:
+                    ids = json.dumps([row[0] for row in conn.execute("""
+                        SELECT m.id FROM measurements m
+                        JOIN treatments t ON m.treatment_id = t.id
+                        WHERE t.experiment_id = ?
+                        LIMIT ?
+                    """, (experiment_id, self.chunk_size))])
+                    count = conn.execute(
+                        "DELETE FROM measurements WHERE id IN (SELECT value FROM json_each(?))", (ids,)).rowcount
+                    if self.prune_history:
+                        self._prune_history(conn, 'measurements', ids)
+                    conn.execute("UPDATE deletion_jobs SET deleted_rows = deleted_rows + ? WHERE id = ?",
+                                 (count, job_id))
+                deleted += count
+                self.progress = (done + deleted, total)
+                if progress_callback:
+                    progress_callback(done + deleted, total)
+                if count < self.chunk_size:
+                    break
+
+            # Treatments and the experiment are small once their measurements are gone
+            with conn:
+                ids = json.dumps([row[0] for row in conn.execute(
+                    "SELECT id FROM treatments WHERE experiment_id = ?", (experiment_id,))])
+                conn.execute("DELETE FROM treatments WHERE experiment_id = ?", (experiment_id,))
+                if self.prune_history:
+                    self._prune_history(conn, 'treatments', ids)
+                conn.execute("DELETE FROM experiments WHERE id = ?", (experiment_id,))
+                conn.execute("""
+                    UPDATE deletion_jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, (job_id,))
+
+            if self.vacuum and conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                # Incremental mode: release free pages a batch at a time
+                while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+                    # execute() would step this row-less pragma once and free a single page
+                    conn.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})")
+                    time.sleep(0)
+            return deleted
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _prune_history(conn, table, ids):
+        """Drop every change_history entry, deletions included, of the rows of table in the JSON list ids"""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_history'").fetchone():
+            conn.execute(f"""
+                DELETE FROM change_history
+                WHERE table_name = '{table}' AND row_id IN (SELECT value FROM json_each(?))
+            """, (ids,))
+
+    def start_delete(self, experiment_id, on_done=None):
+        """Schedule a deletion and run it on a background thread"""
+        if self.is_running():
+            return None
+        job_id = self.schedule_delete(experiment_id)
+        self._start([job_id], on_done)
+        return job_id
+
+    def resume(self, on_done=None):
+        """Finish jobs interrupted by a crash or exit, in the background; returns their ids"""
+        jobs = self.pending_jobs()
+        if jobs and not self.is_running():
+            self._start(jobs, on_done)
+        return jobs
+
+    def _start(self, job_ids, on_done):
+        def run():
+            result = 0
+            try:
+                for job_id in job_ids:
+                    result += self.run_job(job_id)
+            except Exception as e:
+                result = e
+            self.progress = None
+            if on_done:
+                on_done(result)
+
+        self._thread = threading.Thread(target=run, name='chunked-delete', daemon=True)
+        self._thread.start()
+
+    def is_running(self):
+        return bool(self._thread and self._thread.is_alive())
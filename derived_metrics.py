@@ -0,0 +1,215 @@
+# derived_metrics.py - DECLARATIVE DERIVED-METRIC REGISTRY WITH INCREMENTAL RECOMPUTATION
+import numpy as np
+import pandas as pd
+
+def _ratio(numerator, denominator, scale=1.0):
+    """Element-wise numerator / denominator, NaN where the denominator is not positive"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, scale * numerator / denominator, np.nan)
+
+# Each metric lists the measurement columns it reads and a vectorised function of
+# those columns (NumPy arrays, in order). Bump 'version' when a formula changes so
+# stored values are recomputed. Names must not collide with measurement columns,
+# since the measurement_metrics view is often joined back onto measurements.
+DERIVED_METRICS = {
+    'derived_water_content': {
+        'inputs': ('biomass_fresh', 'biomass_dry'),
+        'compute': lambda fresh, dry: _ratio(fresh - dry, fresh, 100.0),
+        'units': '%',
+        'description': 'Tissue water content, (FW - DW) / FW',
+        'version': 1
+    },
+    'specific_leaf_area': {
+        'inputs': ('leaf_area', 'biomass_dry'),
+        'compute': lambda area, dry: _ratio(area, dry),
+        'units': 'cm²/g',
+        'description': 'Leaf area per unit dry biomass',
+        'version': 1
+    },
+    'root_shoot_ratio': {
+        'inputs': ('root_length', 'plant_height'),
+        'compute': lambda root, shoot: _ratio(root, shoot),
+        'units': 'ratio',
+        'description': 'Root length relative to shoot height',
+        'version': 1
+    },
+    'leaf_chlorophyll_index': {
+        'inputs': ('chlorophyll_content', 'leaf_area'),
+        'compute': lambda chlorophyll, area: np.where(area > 0, chlorophyll * area, np.nan),
+        'units': 'SPAD·cm²',
+        'description': 'Whole-leaf chlorophyll index, chlorophyll reading x leaf area',
+        'version': 1
+    },
+    'chlorophyll_per_biomass': {
+        'inputs': ('chlorophyll_content', 'biomass_dry'),
+        'compute': lambda chlorophyll, dry: _ratio(chlorophyll, dry),
+        'units': 'SPAD/g',
+        'description': 'Chlorophyll reading per unit dry biomass',
+        'version': 1
+    },
+    'intrinsic_wue': {
+        'inputs': ('photosynthesis_rate', 'stomatal_conductance'),
+        'compute': lambda a, gs: _ratio(a, gs),
+        'units': 'µmol/mol',
+        'description': 'Intrinsic water-use efficiency, A / gs',
+        'version': 1
+    }
+}
+
+class DerivedMetricEngine:
+    """Materialised derived metrics for every measurement, kept current incrementally.
+
+    Values live in derived_metrics (one row per measurement and metric), with a
+    measurement_metrics view that presents them as columns. Triggers on
+    measurements queue a row in derived_metric_queue whenever it is inserted or
+    one of the registry's input columns changes; recompute() evaluates only the
+    queued rows, vectorised, and writes them back in one transaction. Metrics
+    whose inputs are not columns of measurements are skipped.
+    """
+
+    def __init__(self, database, batch_size=50000):
+        self.db = database
+        self.batch_size = batch_size
+        self._tables_ready = False
+
+    def available_metrics(self):
+        """Registry metrics whose inputs all exist in the measurements table"""
+        columns = {row[1] for row in self.db.cursor.execute("PRAGMA table_info(measurements)")}
+        return {name: spec for name, spec in DERIVED_METRICS.items() if set(spec['inputs']) <= columns}
+
+    def create_tables(self):
+        """Create storage, change-tracking triggers and the wide view; queue metrics whose definition changed"""
+        if self._tables_ready:
+            return
+        metrics = self.available_metrics()
+        inputs = sorted({column for spec in metrics.values() for column in spec['inputs']})
+
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS derived_metrics (
+                measurement_id INTEGER NOT NULL,
+                metric TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (measurement_id, metric),
+                FOREIGN KEY (measurement_id) REFERENCES measurements (id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        """)
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS derived_metric_queue (
+                measurement_id INTEGER PRIMARY KEY
+            )
+        """)
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS derived_metric_versions (
+                metric TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        """)
+        self.db.cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS main.trg_derived_metrics_insert
+            AFTER INSERT ON measurements
+            BEGIN
+                INSERT OR IGNORE INTO derived_metric_queue (measurement_id) VALUES (NEW.id);
+            END
+        """)
+        # The update trigger's column list follows the registry, so rebuild it each time
+        self.db.cursor.execute("DROP TRIGGER IF EXISTS main.trg_derived_metrics_update")
+        self.db.cursor.execute(f"""
+            CREATE TRIGGER main.trg_derived_metrics_update
+            AFTER UPDATE OF {', '.join(inputs)} ON measurements
+            BEGIN
+                INSERT OR IGNORE INTO derived_metric_queue (measurement_id) VALUES (NEW.id);
+            END
+        """)
+        self.db.cursor.execute("DROP VIEW IF EXISTS main.measurement_metrics")
+        pivot = ',\n'.join(
+            f"MAX(CASE WHEN d.metric = '{name}' THEN d.value END) AS {name}" for name in metrics)
+        self.db.cursor.execute(f"""
+            CREATE VIEW main.measurement_metrics AS
+            SELECT m.id AS measurement_id, m.treatment_id, m.measurement_date,
+                   {pivot}
+            FROM measurements m
+            LEFT JOIN derived_metrics d ON d.measurement_id = m.id
+            GROUP BY m.id
+        """)
+
+        # New or changed metric definitions require a full pass
+        stored = dict(self.db.cursor.execute("SELECT metric, version FROM derived_metric_versions").fetchall())
+        if any(stored.get(name) != spec['version'] for name, spec in metrics.items()):
+            self.db.cursor.execute("INSERT OR IGNORE INTO derived_metric_queue (measurement_id) SELECT id FROM main.measurements")
+            self.db.cursor.executemany(
+                "INSERT OR REPLACE INTO derived_metric_versions (metric, version) VALUES (?, ?)",
+                [(name, spec['version']) for name, spec in metrics.items()])
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def evaluate(self, frame, metrics=None):
+        """Evaluate registry metrics on a DataFrame of measurement columns; returns a DataFrame"""
+        metrics = metrics or self.available_metrics()
+        result = pd.DataFrame(index=frame.index)
+        for name, spec in metrics.items():
+            arrays = [frame[column].to_numpy(dtype=float, na_value=np.nan) for column in spec['inputs']]
+            result[name] = spec['compute'](*arrays)
+        return result
+
+    def recompute(self, full=False):
+        """Recompute derived metrics for queued (or, with full=True, all) measurements; returns rows processed"""
+        try:
+            self.create_tables()
+            metrics = self.available_metrics()
+            inputs = sorted({column for spec in metrics.values() for column in spec['inputs']})
+            # main. keeps an attached archive partition (see partitions.py) out of the results
+            if full:
+                self.db.cursor.execute("INSERT OR IGNORE INTO derived_metric_queue (measurement_id) SELECT id FROM main.measurements")
+                self.db.connection.commit()
+
+            processed = 0
+            while True:
+                frame = pd.read_sql_query(f"""
+                    SELECT q.measurement_id, {', '.join('m.' + c for c in inputs)}
+                    FROM derived_metric_queue q
+                    LEFT JOIN main.measurements m ON m.id = q.measurement_id
+                    ORDER BY q.measurement_id
+                    LIMIT ?
+                """, self.db.connection, params=(self.batch_size,))
+                if frame.empty:
+                    break
+
+                ids = frame['measurement_id'].to_numpy()
+                values = self.evaluate(frame, metrics).to_numpy()
+                rows, cols = np.nonzero(np.isfinite(values))
+                names = list(metrics)
+                records = [(int(ids[r]), names[c], float(values[r, c])) for r, c in zip(rows, cols)]
+
+                id_params = [(int(i),) for i in ids]
+                with self.db.connection:
+                    self.db.connection.executemany(
+                        "DELETE FROM derived_metrics WHERE measurement_id = ?", id_params)
+                    self.db.connection.executemany(
+                        "INSERT INTO derived_metrics (measurement_id, metric, value) VALUES (?, ?, ?)", records)
+                    self.db.connection.executemany(
+                        "DELETE FROM derived_metric_queue WHERE measurement_id = ?", id_params)
+                processed += len(ids)
+            return processed
+
+        except Exception as e:
+            print(f"Error recomputing derived metrics: {e}")
+            return None
+
+    def get_metrics(self, experiment_id, metrics=None):
+        """Derived metrics for an experiment as a wide DataFrame, refreshing queued rows first"""
+        try:
+            self.recompute()
+            names = [name for name in (metrics or self.available_metrics()) if name in self.available_metrics()]
+            query = f"""
+                SELECT t.treatment_name, v.measurement_date, v.measurement_id, {', '.join('v.' + n for n in names)}
+                FROM measurement_metrics v
+                JOIN treatments t ON v.treatment_id = t.id
+                WHERE t.experiment_id = ?
+                ORDER BY t.treatment_name, v.measurement_date, v.measurement_id
+            """
+            df = pd.read_sql_query(query, self.db.connection, params=(experiment_id,))
+            return df.round(3) if not df.empty else None
+
+        except Exception as e:
+            print(f"Error loading derived metrics: {e}")
+            return None
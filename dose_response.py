@@ -0,0 +1,230 @@
+# dose_response.py - DOSE-RESPONSE CURVE FITTING OVER TREATMENT CONCENTRATION
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.optimize import least_squares
+
+from database_sqlite import MEASUREMENT_COLUMNS
+
+MODELS = ('ll4', 'weibull')
+
+# Solver settings; part of a cached fit's signature so changing them refits
+FIT_OPTIONS = {'method': 'trf', 'max_nfev': 400}
+
+def dose_response_curve(model, x, slope, lower, upper, log_ec):
+    """Evaluate a four-parameter model; x may be any array (0 = untreated)"""
+    x = np.asarray(x, dtype=float)
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        z = slope * (np.log(np.where(x > 0, x, np.nan)) - log_ec)
+        if model == 'll4':
+            # Log-logistic (LL.4): the upper asymptote is reached as x -> 0
+            value = lower + (upper - lower) / (1.0 + np.exp(z))
+        elif model == 'weibull':
+            # Weibull type 1 (W1.4)
+            value = lower + (upper - lower) * np.exp(-np.exp(z))
+        else:
+            raise ValueError(f"Unknown dose-response model '{model}'")
+    untreated = upper if slope > 0 else lower
+    return np.where(x > 0, value, untreated)
+
+def _fit_job(job):
+    """Fit one (experiment, metric, model) curve; module-level for process pools"""
+    key, model, x, y, start = job
+    scale = max(np.ptp(y), 1e-9)
+
+    def residuals(params):
+        return (dose_response_curve(model, x, *params) - y) / scale
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        fit = least_squares(residuals, start, **FIT_OPTIONS)
+    slope, lower, upper, log_ec = fit.x
+    if model == 'll4':
+        ec50 = np.exp(log_ec)
+    else:
+        ec50 = np.exp(log_ec + np.log(np.log(2.0)) / slope) if slope != 0 else np.nan
+    return key, {
+        'slope': slope, 'lower': lower, 'upper': upper, 'log_ec': log_ec,
+        'ec50': ec50, 'rss': float(((dose_response_curve(model, x, *fit.x) - y) ** 2).sum()),
+        'n': len(y), 'converged': bool(fit.success), 'evaluations': int(fit.nfev)
+    }
+
+class DoseResponseAnalyzer:
+    """Log-logistic/Weibull fits of each metric against treatments.concentration.
+
+    Fits are cached in dose_response_fits per experiment, metric and model,
+    together with the experiment's data version (see result_cache.py) and
+    the solver settings they were fitted with. A fit whose signature no
+    longer matches is refitted, warm-started from the cached parameters, so
+    small edits to an experiment converge in a few iterations.
+    """
+
+    def __init__(self, database, max_workers=None):
+        self.db = database
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the fitted-parameter cache table"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS dose_response_fits (
+                experiment_id INTEGER NOT NULL,
+                metric TEXT NOT NULL,
+                model TEXT NOT NULL,
+                data_signature TEXT NOT NULL,
+                slope REAL,
+                lower_asymptote REAL,
+                upper_asymptote REAL,
+                log_ec REAL,
+                ec50 REAL,
+                rss REAL,
+                n_observations INTEGER,
+                converged INTEGER,
+                fitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (experiment_id, metric, model),
+                FOREIGN KEY (experiment_id) REFERENCES experiments (id) ON DELETE CASCADE
+            )
+        """)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def load_observations(self, experiment_ids, metrics):
+        """All (concentration, value) pairs for the given experiments and metrics"""
+        placeholders = ', '.join('?' * len(experiment_ids))
+        query = f"""
+            SELECT t.experiment_id, t.concentration, {', '.join('m.' + c for c in metrics)}
+            FROM measurements m
+            JOIN treatments t ON m.treatment_id = t.id
+            WHERE t.experiment_id IN ({placeholders}) AND t.concentration IS NOT NULL
+        """
+        return pd.read_sql_query(query, self.db.connection, params=tuple(experiment_ids))
+
+    def data_signature(self, experiment_id):
+        """The experiment's data version and the solver settings a fit is made with"""
+        settings = ':'.join(f"{name}={value}" for name, value in sorted(FIT_OPTIONS.items()))
+        return f"{self.db.data_version(experiment_id)}:{settings}"
+
+    @staticmethod
+    def initial_guess(x, y):
+        """Heuristic starting point: asymptotes from the extreme doses, EC at the median dose"""
+        order = np.argsort(x)
+        low_dose, high_dose = y[order[:max(1, len(y) // 4)]], y[order[-max(1, len(y) // 4):]]
+        positive = x[x > 0]
+        log_ec = np.log(np.median(positive)) if len(positive) else 0.0
+        return np.array([1.0, high_dose.mean(), low_dose.mean(), log_ec])
+
+    def _cached_fits(self, experiment_ids):
+        placeholders = ', '.join('?' * len(experiment_ids))
+        rows = self.db.execute_query(f"""
+            SELECT experiment_id, metric, model, data_signature, slope, lower_asymptote,
+                   upper_asymptote, log_ec, ec50, rss, n_observations, converged
+            FROM dose_response_fits WHERE experiment_id IN ({placeholders})
+        """, tuple(experiment_ids)) or []
+        return {(r[0], r[1], r[2]): r[3:] for r in rows}
+
+    def fit_all(self, experiment_ids=None, metrics=None, models=MODELS, force=False):
+        """Fit every experiment x metric x model, reusing cached fits that are still valid"""
+        try:
+            self.create_tables()
+            metrics = list(metrics or MEASUREMENT_COLUMNS)
+            for name in metrics:
+                if name not in MEASUREMENT_COLUMNS:
+                    raise ValueError(f"Unknown metric '{name}'")
+            if experiment_ids is None:
+                experiment_ids = [r[0] for r in self.db.execute_query("SELECT id FROM experiments") or []]
+            if not experiment_ids:
+                return None
+
+            data = self.load_observations(experiment_ids, metrics)
+            cached = self._cached_fits(experiment_ids)
+            results, jobs, signatures = [], [], {}
+
+            for exp_id, group in data.groupby('experiment_id'):
+                x_all = group['concentration'].to_numpy(dtype=float)
+                signature = self.data_signature(int(exp_id))
+                for metric in metrics:
+                    y = group[metric].to_numpy(dtype=float)
+                    keep = ~np.isnan(y)
+                    x, y = x_all[keep], y[keep]
+                    if len(y) < 5 or len(np.unique(x)) < 3:
+                        continue
+                    for model in models:
+                        key = (int(exp_id), metric, model)
+                        previous = cached.get(key)
+                        if previous and previous[0] == signature and not force:
+                            results.append(self._row(key, previous[1:], cached=True))
+                            continue
+                        start = (np.array(previous[1:5], dtype=float)
+                                 if previous and None not in previous[1:5]
+                                 else self.initial_guess(x, y))
+                        jobs.append((key, model, x, y, start))
+                        signatures[key] = signature
+
+            if jobs:
+                if self.max_workers <= 1 or len(jobs) < 4:
+                    fitted = [_fit_job(job) for job in jobs]
+                else:
+                    with ProcessPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+                        fitted = list(pool.map(_fit_job, jobs, chunksize=max(1, len(jobs) // (4 * self.max_workers))))
+                self._store(fitted, signatures)
+                for key, fit in fitted:
+                    values = (fit['slope'], fit['lower'], fit['upper'], fit['log_ec'],
+                              fit['ec50'], fit['rss'], fit['n'], fit['converged'])
+                    results.append(self._row(key, values, cached=False))
+
+            if not results:
+                return None
+            return (pd.DataFrame(results)
+                      .sort_values(['experiment_id', 'metric', 'model'])
+                      .reset_index(drop=True))
+
+        except Exception as e:
+            print(f"Error fitting dose-response curves: {e}")
+            return None
+
+    @staticmethod
+    def _row(key, values, cached):
+        slope, lower, upper, log_ec, ec50, rss, n, converged = values
+        return {
+            'experiment_id': key[0], 'metric': key[1], 'model': key[2],
+            'ec50': ec50, 'slope': slope, 'lower_asymptote': lower, 'upper_asymptote': upper,
+            'rss': rss, 'n_observations': n, 'converged': bool(converged), 'cached': cached
+        }
+
+    def _store(self, fitted, signatures):
+        """Write new fits to the cache in one transaction"""
+        rows = [(key[0], key[1], key[2], signatures[key], fit['slope'], fit['lower'],
+                 fit['upper'], fit['log_ec'], fit['ec50'], fit['rss'], fit['n'], int(fit['converged']))
+                for key, fit in fitted]
+        with self.db.connection:
+            self.db.connection.executemany("""
+                INSERT OR REPLACE INTO dose_response_fits
+                (experiment_id, metric, model, data_signature, slope, lower_asymptote,
+                 upper_asymptote, log_ec, ec50, rss, n_observations, converged)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def fit_experiment(self, experiment_id, metrics=None, models=MODELS):
+        """Fits for a single experiment"""
+        return self.fit_all([experiment_id], metrics, models)
+
+    def predicted_curve(self, experiment_id, metric, model='ll4', points=100):
+        """Fitted curve over the observed concentration range, for plotting"""
+        fits = self.fit_all([experiment_id], [metric], (model,))
+        if fits is None or fits.empty:
+            return None
+        row = self._cached_fits([experiment_id])[(experiment_id, metric, model)]
+        slope, lower, upper, log_ec = row[1:5]
+        result = self.db.execute_query(
+            "SELECT MIN(concentration), MAX(concentration) FROM treatments "
+            "WHERE experiment_id = ? AND concentration > 0", (experiment_id,))
+        low, high = result[0] if result else (None, None)
+        if not low or not high:
+            return None
+        x = np.geomspace(low, high, points)
+        return pd.DataFrame({'concentration': x,
+                             'predicted': dose_response_curve(model, x, slope, lower, upper, log_ec)})
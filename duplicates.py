@@ -0,0 +1,192 @@
+# duplicates.py - DUPLICATE MEASUREMENT DETECTION AND MERGING
+import numpy as np
+import pandas as pd
+
+from database_sqlite import MEASUREMENT_COLUMNS
+
+def _union_find_groups(n, pairs):
+    """Connected components of n items given an (m x 2) array of linked index pairs"""
+    parent = np.arange(n)
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs:
+        ra, rb = root(a), root(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    return np.array([root(i) for i in range(n)])
+
+class DuplicateDetector:
+    """Find and merge measurements entered more than once.
+
+    Exact duplicates share a hash of (treatment, plant, date, values). Near
+    duplicates are found with a tolerance-bucketed key: each value is snapped
+    to a grid of width tolerance, on two grids offset by half a cell so that
+    values either side of a cell edge still meet, and rows sharing a key are
+    confirmed with an element-wise tolerance check. Only rows in the same
+    bucket are ever compared, so the cost grows with the table, not its square.
+
+    Replicate readings of one treatment on one day are legitimately close, so
+    a near duplicate must also be the same plant (rows without a plant_id are
+    never near duplicates), carry at least min_metrics values and have the
+    same notes, which keeps separately logged observations apart. Near groups
+    are for review only; merge_duplicates merges exact groups.
+    """
+
+    def __init__(self, database, relative_tolerance=0.01, min_metrics=2):
+        self.db = database
+        self.relative_tolerance = relative_tolerance
+        self.min_metrics = min_metrics
+
+    def load_measurements(self, experiment_id=None):
+        """Measurements with their keys and values as a DataFrame"""
+        columns = ', '.join(f"m.{c}" for c in MEASUREMENT_COLUMNS)
+        query = f"""
+            SELECT m.id, m.treatment_id, m.plant_id, m.measurement_date, {columns}, m.notes
+            FROM measurements m
+            JOIN treatments t ON m.treatment_id = t.id
+            WHERE (? IS NULL OR t.experiment_id = ?)
+            ORDER BY m.id
+        """
+        return pd.read_sql_query(query, self.db.connection, params=(experiment_id, experiment_id))
+
+    def tolerances(self, df):
+        """Absolute tolerance per metric: relative_tolerance x the metric's median magnitude"""
+        scale = df[list(MEASUREMENT_COLUMNS)].astype(float).abs().median().fillna(0)
+        return (scale * self.relative_tolerance).where(scale > 0, self.relative_tolerance)
+
+    def find_duplicates(self, experiment_id=None, near=True):
+        """Candidate duplicate groups; returns a DataFrame with group_id, kind and the rows' values"""
+        try:
+            df = self.load_measurements(experiment_id)
+            if len(df) < 2:
+                return None
+            keys = df[['treatment_id', 'plant_id', 'measurement_date']].astype(str)
+            values = df[list(MEASUREMENT_COLUMNS)].to_numpy(dtype=float)
+            missing = np.isnan(values)
+
+            exact = pd.util.hash_pandas_object(
+                pd.concat([keys, df[list(MEASUREMENT_COLUMNS)].round(6)], axis=1), index=False).to_numpy()
+            exact_group = _union_find_groups(len(df), self._pairs_with_equal_key(exact))
+            reports = [self._report(df, exact_group, 'exact')]
+
+            if near:
+                # Near matching runs on one row per exact group, so an exact group is reported
+                # once as exact and, if it has close neighbours, once more through its first row
+                tolerance = self.tolerances(df).to_numpy()
+                eligible = ((exact_group == np.arange(len(df))) & df['plant_id'].notna().to_numpy()
+                            & ((~missing).sum(axis=1) >= self.min_metrics))
+                notes = df['notes'].fillna('').str.strip().rename('notes')
+                pairs = []
+                for offset in (0.0, 0.5):
+                    cells = np.where(missing, -1, np.floor(values / tolerance + offset)).astype(np.int64)
+                    bucket = pd.util.hash_pandas_object(
+                        pd.concat([keys, notes, pd.DataFrame(cells)], axis=1), index=False).to_numpy()
+                    candidates = self._pairs_with_equal_key(bucket)
+                    candidates = candidates[eligible[candidates[:, 0]] & eligible[candidates[:, 1]]]
+                    if len(candidates):
+                        a, b = candidates[:, 0], candidates[:, 1]
+                        same_missing = (missing[a] == missing[b]).all(axis=1)
+                        close = (np.abs(np.nan_to_num(values[a] - values[b])) <= tolerance).all(axis=1)
+                        pairs.append(candidates[same_missing & close])
+                if pairs:
+                    reports.append(self._report(df, _union_find_groups(len(df), np.concatenate(pairs)), 'near'))
+
+            report = pd.concat(reports, ignore_index=True)
+            if report.empty:
+                return None
+            return report.sort_values(['group_id', 'kind', 'id']).reset_index(drop=True)
+
+        except Exception as e:
+            print(f"Error finding duplicate measurements: {e}")
+            return None
+
+    @staticmethod
+    def _report(df, group, kind):
+        """Rows of df in groups of two or more, labelled with the group's first id and kind"""
+        in_group = np.bincount(group, minlength=len(df))[group] > 1
+        report = df[in_group].copy()
+        report['group_id'] = df['id'].to_numpy()[group[in_group]]
+        report['kind'] = kind
+        return report
+
+    @staticmethod
+    def _pairs_with_equal_key(key):
+        """(i, j) pairs of positions sharing a key, chaining each row to the first of its key"""
+        order = np.argsort(key, kind='stable')
+        sorted_key = key[order]
+        starts = np.flatnonzero(np.r_[True, sorted_key[1:] != sorted_key[:-1]])
+        first = np.repeat(order[starts], np.diff(np.r_[starts, len(key)]))
+        linked = first != order
+        return np.column_stack([first[linked], order[linked]])
+
+    def merge_duplicates(self, groups, delete_only=False):
+        """Merge each group into its lowest id, or just delete the others; returns rows removed
+
+        groups is the DataFrame from find_duplicates (optionally filtered), of
+        which only the exact groups are merged, or a mapping of keep_id -> list
+        of duplicate ids chosen by the user. Unless delete_only is set,
+        values missing on the kept row are filled from its duplicates and notes
+        are concatenated. Rows referencing a removed measurement are repointed
+        to the kept one. Everything happens in a single transaction.
+        """
+        try:
+            if isinstance(groups, pd.DataFrame):
+                if 'kind' in groups:
+                    groups = groups[groups['kind'] == 'exact']
+                keep = groups.groupby('group_id')['id'].transform('min')
+                mapping = [(int(d), int(k)) for d, k in zip(groups['id'], keep) if d != k]
+            else:
+                mapping = [(int(d), int(k)) for k, dups in groups.items() for d in dups if d != k]
+            if not mapping:
+                return 0
+
+            references = []
+            for (table,) in self.db.cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall():
+                for fk in self.db.cursor.execute(f"PRAGMA foreign_key_list({table})").fetchall():
+                    if fk[2] == 'measurements':
+                        references.append((table, fk[3]))
+
+            with self.db.connection:
+                self.db.connection.execute("DROP TABLE IF EXISTS temp.duplicate_map")
+                self.db.connection.execute(
+                    "CREATE TEMP TABLE duplicate_map (duplicate_id INTEGER PRIMARY KEY, keep_id INTEGER NOT NULL)")
+                self.db.connection.executemany("INSERT INTO temp.duplicate_map VALUES (?, ?)", mapping)
+
+                if not delete_only:
+                    fills = ',\n'.join(
+                        f"{c} = COALESCE({c}, (SELECT m2.{c} FROM measurements m2 JOIN temp.duplicate_map d "
+                        f"ON m2.id = d.duplicate_id WHERE d.keep_id = measurements.id AND m2.{c} IS NOT NULL "
+                        f"ORDER BY m2.id LIMIT 1))"
+                        for c in (*MEASUREMENT_COLUMNS, 'plant_id'))
+                    self.db.connection.execute(f"""
+                        UPDATE measurements SET {fills},
+                            notes = (SELECT GROUP_CONCAT(n, ' | ') FROM (
+                                SELECT DISTINCT m2.notes AS n FROM measurements m2
+                                WHERE (m2.id = measurements.id OR m2.id IN
+                                       (SELECT duplicate_id FROM temp.duplicate_map WHERE keep_id = measurements.id))
+                                  AND m2.notes IS NOT NULL AND m2.notes != ''
+                                ORDER BY m2.id))
+                        WHERE id IN (SELECT keep_id FROM temp.duplicate_map)
+                    """)
+                    for table, column in references:
+                        # OR IGNORE: a row that would collide with the kept row's own is dropped by the cascade below
+                        self.db.connection.execute(f"""
+                            UPDATE OR IGNORE {table}
+                            SET {column} = (SELECT keep_id FROM temp.duplicate_map WHERE duplicate_id = {table}.{column})
+                            WHERE {column} IN (SELECT duplicate_id FROM temp.duplicate_map)
+                        """)
+
+                removed = self.db.connection.execute(
+                    "DELETE FROM measurements WHERE id IN (SELECT duplicate_id FROM temp.duplicate_map)").rowcount
+                self.db.connection.execute("DROP TABLE temp.duplicate_map")
+            return removed
+
+        except Exception as e:
+            print(f"❌ Error merging duplicate measurements: {e}")
+            return None
@@ -0,0 +1,300 @@
+# gas_exchange.py - GAS-EXCHANGE INSTRUMENT LOG IMPORT
+import os
+import hashlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Column names used by common portable photosynthesis systems for each value
+COLUMN_ALIASES = {
+    'photosynthesis_rate': ('A', 'Photo'),
+    'stomatal_conductance': ('gsw', 'Cond', 'gs'),
+    'obs': ('obs', 'Obs'),
+    'date': ('date', 'Date'),
+    'label': ('treatment', 'Treatment', 'plant', 'Plant', 'label', 'Label')
+}
+
+HEADER_DATE_FORMATS = ('%a %b %d %Y %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y%m%d %H:%M:%S', '%Y-%m-%d')
+
+def _parse_date(text):
+    """Return YYYY-MM-DD for a date/time string in any known instrument format"""
+    text = text.strip().strip('"')
+    # LI-6400 headers use three-letter day names that are not always English ("Thr")
+    candidates = [text, ' '.join(['Mon'] + text.split()[1:])]
+    for candidate in candidates:
+        for fmt in HEADER_DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, fmt).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+    return None
+
+def _find_column(names, key):
+    for alias in COLUMN_ALIASES[key]:
+        if alias in names:
+            return names.index(alias)
+    return None
+
+def parse_gas_exchange_log(path):
+    """Stream observations from a tab-delimited gas-exchange log
+
+    Yields one dict per logged observation with its photosynthesis (A) and
+    stomatal conductance (gs) values, the measurement date, the most recent
+    remark and any label column. The file is read line by line, so memory
+    use does not depend on file size. Header blocks, [section] markers,
+    units rows and remark lines are recognised and skipped.
+    """
+    header_date = None
+    columns = None
+    remark = None
+
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for raw in f:
+            line = raw.rstrip('\r\n')
+            if not line.strip():
+                continue
+            stripped = line.strip()
+
+            # Section markers ([Header], [Data]) and start-of-data markers
+            if (stripped.startswith('[') and stripped.endswith(']')) or stripped.startswith('$'):
+                continue
+
+            # Remarks: quoted lines, "Remark=" lines, or short rows inside the data block
+            fields = [field.strip().strip('"') for field in line.split('\t')]
+            if stripped.startswith('Remark='):
+                remark = stripped[len('Remark='):].strip().strip('"')
+                continue
+            if stripped.startswith('"') and len(fields) <= 2:
+                text = stripped.strip('"')
+                if header_date is None and columns is None:
+                    header_date = _parse_date(text)
+                    if header_date:
+                        continue
+                # LI-6400 remarks are "HH:MM:SS text"
+                parts = text.split(' ', 1)
+                remark = parts[1] if len(parts) == 2 and ':' in parts[0] else text
+                continue
+
+            if columns is None:
+                if header_date is None:
+                    header_date = _parse_date(fields[-1]) or _parse_date(stripped)
+                a_col = _find_column(fields, 'photosynthesis_rate')
+                gs_col = _find_column(fields, 'stomatal_conductance')
+                if a_col is not None and gs_col is not None:
+                    columns = {
+                        'a': a_col, 'gs': gs_col,
+                        'obs': _find_column(fields, 'obs'),
+                        'date': _find_column(fields, 'date'),
+                        'label': _find_column(fields, 'label'),
+                        'width': len(fields)
+                    }
+                continue
+
+            if len(fields) <= 2:
+                remark = fields[-1]
+                continue
+            if len(fields) <= max(columns['a'], columns['gs']):
+                continue
+            try:
+                a_value = float(fields[columns['a']])
+                gs_value = float(fields[columns['gs']])
+            except ValueError:
+                # Units row or a repeated header
+                continue
+
+            date = None
+            if columns['date'] is not None and columns['date'] < len(fields):
+                date = _parse_date(fields[columns['date']])
+            yield {
+                'obs': fields[columns['obs']] if columns['obs'] is not None else None,
+                'date': date or header_date,
+                'photosynthesis_rate': a_value,
+                'stomatal_conductance': gs_value,
+                'label': fields[columns['label']] if columns['label'] is not None and columns['label'] < len(fields) else None,
+                'remark': remark
+            }
+
+def _parse_file_job(path, label_map, default_treatment_id, fallback_date):
+    """Parse one file into compact measurement rows; module-level for process pools
+
+    An observation with a label column value goes to the treatment of that
+    name; an unknown label (e.g. a typo) is counted as unmapped rather than
+    sent to the default treatment. Remarks are free text, so one that names
+    a treatment is used and any other falls back to the default.
+    """
+    rows, unmapped, unknown_labels = [], 0, {}
+    name = os.path.basename(path)
+    for obs in parse_gas_exchange_log(path):
+        label = (obs['label'] or '').strip()
+        remark = (obs['remark'] or '').strip()
+        if label:
+            treatment_id = label_map.get(label.lower())
+            if treatment_id is None:
+                unknown_labels[label] = unknown_labels.get(label, 0) + 1
+        else:
+            treatment_id = label_map.get(remark.lower(), default_treatment_id)
+        if treatment_id is None:
+            unmapped += 1
+            continue
+        rows.append((treatment_id, obs['date'] or fallback_date,
+                     obs['photosynthesis_rate'], obs['stomatal_conductance'],
+                     f"Gas exchange: {name} obs {obs['obs'] or '?'}"))
+    return path, rows, unmapped, unknown_labels
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class GasExchangeImporter:
+    """Parse gas-exchange logs in parallel and bulk-load A and gs as measurements.
+
+    Observations are mapped to treatments by a label column or the latest
+    remark (matched case-insensitively against treatment names or an explicit
+    label map). Unlabelled observations fall back to a default treatment;
+    labels that match no treatment are reported as unmapped in the summary
+    (with counts per label in unknown_labels). Only max_in_flight files
+    are parsed at once, so memory stays bounded however many files are given;
+    each file is inserted in its own transaction and recorded in
+    instrument_imports per experiment, so unchanged files are skipped on
+    re-import into the same experiment. Files with the same content given
+    in one batch are imported once.
+    """
+
+    def __init__(self, database, max_workers=None, max_in_flight=None):
+        self.db = database
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.max_workers
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the imported-file registry"""
+        if self._tables_ready:
+            return
+        if self._hash_only_unique():
+            # Registries from before per-experiment keys: rebuild with the new constraint
+            self.db.cursor.execute("ALTER TABLE instrument_imports RENAME TO instrument_imports_old")
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS instrument_imports (
+                id INTEGER PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                experiment_id INTEGER,
+                rows_imported INTEGER,
+                rows_unmapped INTEGER,
+                imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(file_hash, experiment_id)
+            )
+        """)
+        if self.db.cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'instrument_imports_old'").fetchone():
+            self.db.cursor.execute("""
+                INSERT INTO instrument_imports
+                (id, file_hash, file_path, experiment_id, rows_imported, rows_unmapped, imported_at)
+                SELECT id, file_hash, file_path, experiment_id, rows_imported, rows_unmapped, imported_at
+                FROM instrument_imports_old
+            """)
+            self.db.cursor.execute("DROP TABLE instrument_imports_old")
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def _hash_only_unique(self):
+        """Whether instrument_imports has the old unique constraint on file_hash alone"""
+        indexes = self.db.cursor.execute("PRAGMA index_list(instrument_imports)").fetchall()
+        for _, name, unique, *_ in indexes:
+            columns = [row[2] for row in self.db.cursor.execute(f"PRAGMA index_info('{name}')").fetchall()]
+            if unique and columns == ['file_hash']:
+                return True
+        return False
+
+    def build_label_map(self, experiment_id, treatment_map=None):
+        """Lower-cased label -> treatment_id from treatment names plus explicit overrides"""
+        label_map = {}
+        results = self.db.execute_query(
+            "SELECT id, treatment_name FROM treatments WHERE experiment_id = ?", (experiment_id,))
+        for treatment_id, name in results or []:
+            label_map[name.strip().lower()] = treatment_id
+        for label, treatment_id in (treatment_map or {}).items():
+            label_map[str(label).strip().lower()] = treatment_id
+        return label_map
+
+    def import_files(self, paths, experiment_id, treatment_map=None, default_treatment_id=None,
+                     skip_imported=True, progress_callback=None):
+        """Import many log files; returns a summary dict"""
+        try:
+            self.create_tables()
+            label_map = self.build_label_map(experiment_id, treatment_map)
+            summary = {'files': 0, 'skipped': 0, 'rows': 0, 'unmapped': 0, 'unknown_labels': {}, 'errors': []}
+
+            pending_paths, batch = [], set()
+            for path in paths:
+                digest = file_digest(path)
+                # Identical files in one batch would otherwise all be inserted before any is registered
+                if digest in batch or (skip_imported and self.db.execute_query(
+                        "SELECT 1 FROM instrument_imports WHERE file_hash = ? AND experiment_id = ?",
+                        (digest, experiment_id))):
+                    summary['skipped'] += 1
+                    continue
+                batch.add(digest)
+                fallback_date = datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d')
+                pending_paths.append((path, digest, fallback_date))
+
+            digests = {path: digest for path, digest, _ in pending_paths}
+            if self.max_workers <= 1 or len(pending_paths) <= 1:
+                for path, _, fallback_date in pending_paths:
+                    try:
+                        self._store(_parse_file_job(path, label_map, default_treatment_id, fallback_date),
+                                    digests, experiment_id, summary, progress_callback, len(pending_paths))
+                    except Exception as e:
+                        summary['errors'].append(f"{path}: {e}")
+                return summary
+
+            queue = iter(pending_paths)
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                in_flight = set()
+                while True:
+                    while len(in_flight) < self.max_in_flight:
+                        job = next(queue, None)
+                        if job is None:
+                            break
+                        path, _, fallback_date = job
+                        in_flight.add(pool.submit(_parse_file_job, path, label_map,
+                                                  default_treatment_id, fallback_date))
+                    if not in_flight:
+                        break
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            self._store(future.result(), digests, experiment_id, summary,
+                                        progress_callback, len(pending_paths))
+                        except Exception as e:
+                            summary['errors'].append(str(e))
+            return summary
+
+        except Exception as e:
+            print(f"❌ Gas-exchange import error: {e}")
+            return None
+
+    def _store(self, parsed, digests, experiment_id, summary, progress_callback, total):
+        """Bulk-insert one parsed file and register it"""
+        path, rows, unmapped, unknown_labels = parsed
+        with self.db.connection:
+            self.db.connection.executemany("""
+                INSERT INTO measurements
+                (treatment_id, measurement_date, photosynthesis_rate, stomatal_conductance, notes)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+            self.db.connection.execute("""
+                INSERT OR REPLACE INTO instrument_imports
+                (file_hash, file_path, experiment_id, rows_imported, rows_unmapped)
+                VALUES (?, ?, ?, ?, ?)
+            """, (digests[path], path, experiment_id, len(rows), unmapped))
+        summary['files'] += 1
+        summary['rows'] += len(rows)
+        summary['unmapped'] += unmapped
+        for label, count in unknown_labels.items():
+            summary['unknown_labels'][label] = summary['unknown_labels'].get(label, 0) + count
+        if progress_callback:
+            progress_callback(summary['files'], total)
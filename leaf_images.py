@@ -0,0 +1,226 @@
+# leaf_images.py - LEAF IMAGE REFERENCES AND PARALLEL LEAF-AREA EXTRACTION
+import os
+import numpy as np
+import matplotlib.image as mpimg
+from concurrent.futures import ProcessPoolExecutor
+
+from gas_exchange import file_digest
+
+# Version of the segmentation method; bump when the algorithm changes so cached areas are recomputed
+SEGMENTATION_VERSION = 1
+
+# Images whose index spans less than this have no leaf/background contrast (e.g. blank scans)
+MIN_CONTRAST = 0.05
+
+def otsu_threshold(values, bins=256):
+    """Otsu threshold of a 1-D array from its histogram"""
+    hist, edges = np.histogram(values, bins=bins)
+    centres = (edges[:-1] + edges[1:]) / 2
+    weight_low = np.cumsum(hist)
+    weight_high = weight_low[-1] - weight_low
+    mean_low = np.cumsum(hist * centres) / np.maximum(weight_low, 1)
+    mean_high = (np.sum(hist * centres) - np.cumsum(hist * centres)) / np.maximum(weight_high, 1)
+    between = weight_low * weight_high * (mean_low - mean_high) ** 2
+    return centres[np.argmax(between)]
+
+def segment_leaf_pixels(image):
+    """Boolean leaf mask for a scanned leaf on a light background
+
+    Uses the excess-green index (2G - R - B) thresholded with Otsu's method,
+    falling back to darkness for grayscale scans.
+    """
+    image = np.asarray(image, dtype=np.float64)
+    if image.max() > 1.0:
+        image = image / 255.0
+    if image.ndim == 2 or image.shape[2] < 3:
+        gray = image if image.ndim == 2 else image[:, :, 0]
+        if np.ptp(gray) < MIN_CONTRAST:
+            return np.zeros(gray.shape, dtype=bool)
+        return gray < otsu_threshold(gray.ravel())
+    red, green, blue = image[:, :, 0], image[:, :, 1], image[:, :, 2]
+    excess_green = 2 * green - red - blue
+    if np.ptp(excess_green) < MIN_CONTRAST:
+        return np.zeros(excess_green.shape, dtype=bool)
+    mask = excess_green > otsu_threshold(excess_green.ravel())
+    if image.shape[2] == 4:
+        mask &= image[:, :, 3] > 0
+    return mask
+
+def _measure_image(path, dpi):
+    """Leaf pixel count and area (cm²) of one image; module-level for process pools"""
+    try:
+        mask = segment_leaf_pixels(mpimg.imread(path))
+        pixels = int(mask.sum())
+        return path, pixels, pixels / (dpi / 2.54) ** 2, None
+    except Exception as e:
+        return path, None, None, str(e)
+
+class LeafImageProcessor:
+    """Leaf-area extraction from scanned images referenced by path.
+
+    Images stay on disk; leaf_images only stores the path, content hash and
+    result for each image attached to a measurement. Segmentation runs in a
+    process pool, results are cached in leaf_area_cache by (hash, method),
+    so re-runs skip unchanged images, and the summed area per measurement is
+    written back to measurements.leaf_area in one transaction.
+    """
+
+    def __init__(self, database, max_workers=None, dpi=300):
+        self.db = database
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.dpi = dpi
+        self._tables_ready = False
+
+    @property
+    def method_key(self):
+        return f"exg-otsu-v{SEGMENTATION_VERSION}-{self.dpi}dpi"
+
+    def create_tables(self):
+        """Create image reference and area cache tables"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS leaf_images (
+                id INTEGER PRIMARY KEY,
+                measurement_id INTEGER NOT NULL,
+                file_path TEXT NOT NULL,
+                file_hash TEXT,
+                leaf_area REAL,
+                pixel_count INTEGER,
+                status TEXT DEFAULT 'pending',
+                processed_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (measurement_id) REFERENCES measurements (id) ON DELETE CASCADE,
+                UNIQUE(measurement_id, file_path)
+            )
+        """)
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS leaf_area_cache (
+                file_hash TEXT NOT NULL,
+                method TEXT NOT NULL,
+                pixel_count INTEGER NOT NULL,
+                leaf_area REAL NOT NULL,
+                PRIMARY KEY (file_hash, method)
+            ) WITHOUT ROWID
+        """)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def register_images(self, measurement_id, paths):
+        """Attach image files to a measurement; returns the number of new references"""
+        try:
+            self.create_tables()
+            rows = [(measurement_id, os.path.abspath(path)) for path in paths]
+            with self.db.connection:
+                before = self.db.connection.total_changes
+                self.db.connection.executemany(
+                    "INSERT OR IGNORE INTO leaf_images (measurement_id, file_path) VALUES (?, ?)", rows)
+                return self.db.connection.total_changes - before
+
+        except Exception as e:
+            print(f"❌ Error registering leaf images: {e}")
+            return None
+
+    def process_images(self, experiment_id=None, reprocess=False):
+        """Compute leaf area for all (or all changed) images and write it back to measurements"""
+        try:
+            self.create_tables()
+            query = """
+                SELECT li.id, li.measurement_id, li.file_path, li.file_hash, li.status
+                FROM leaf_images li
+                JOIN measurements m ON li.measurement_id = m.id
+                JOIN treatments t ON m.treatment_id = t.id
+                WHERE (? IS NULL OR t.experiment_id = ?)
+            """
+            images = self.db.execute_query(query, (experiment_id, experiment_id)) or []
+            summary = {'images': len(images), 'cached': 0, 'processed': 0, 'missing': 0, 'failed': 0}
+
+            # Hash every image; unchanged, already-processed images are skipped entirely
+            hashes, to_lookup = {}, []
+            for image_id, measurement_id, path, old_hash, status in images:
+                if not os.path.exists(path):
+                    hashes[image_id] = None
+                    summary['missing'] += 1
+                    continue
+                digest = file_digest(path)
+                hashes[image_id] = digest
+                if reprocess or digest != old_hash or status != 'done':
+                    to_lookup.append((image_id, measurement_id, path, digest))
+
+            cache = {}
+            digests = sorted({digest for _, _, _, digest in to_lookup})
+            for start in range(0, len(digests), 500):
+                batch = digests[start:start + 500]
+                rows = self.db.execute_query(f"""
+                    SELECT file_hash, pixel_count, leaf_area FROM leaf_area_cache
+                    WHERE method = ? AND file_hash IN ({', '.join('?' * len(batch))})
+                """, (self.method_key, *batch)) or []
+                cache.update({h: (pixels, area) for h, pixels, area in rows})
+
+            pending = {}
+            for image_id, measurement_id, path, digest in to_lookup:
+                if digest not in cache:
+                    pending.setdefault(digest, path)
+
+            if pending:
+                paths = list(pending.values())
+                if self.max_workers <= 1 or len(paths) < 4:
+                    results = [_measure_image(path, self.dpi) for path in paths]
+                else:
+                    with ProcessPoolExecutor(max_workers=min(self.max_workers, len(paths))) as pool:
+                        results = list(pool.map(_measure_image, paths, [self.dpi] * len(paths),
+                                                chunksize=max(1, len(paths) // (4 * self.max_workers))))
+                by_path = {path: (pixels, area, error) for path, pixels, area, error in results}
+                new_cache = []
+                for digest, path in pending.items():
+                    pixels, area, error = by_path[path]
+                    if error is None:
+                        cache[digest] = (pixels, area)
+                        new_cache.append((digest, self.method_key, pixels, area))
+                    else:
+                        print(f"❌ Leaf image error ({path}): {error}")
+                summary['processed'] = len(new_cache)
+                with self.db.connection:
+                    self.db.connection.executemany(
+                        "INSERT OR REPLACE INTO leaf_area_cache (file_hash, method, pixel_count, leaf_area) "
+                        "VALUES (?, ?, ?, ?)", new_cache)
+
+            updates, failed = [], []
+            for image_id, measurement_id, path, digest in to_lookup:
+                if digest in cache:
+                    pixels, area = cache[digest]
+                    updates.append((digest, area, pixels, image_id))
+                    if digest not in pending:
+                        summary['cached'] += 1
+                else:
+                    failed.append((digest, image_id))
+            summary['failed'] = len(failed)
+
+            with self.db.connection:
+                self.db.connection.executemany("""
+                    UPDATE leaf_images SET file_hash = ?, leaf_area = ?, pixel_count = ?,
+                           status = 'done', processed_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, updates)
+                self.db.connection.executemany(
+                    "UPDATE leaf_images SET file_hash = ?, status = 'failed' WHERE id = ?", failed)
+                self.db.connection.executemany(
+                    "UPDATE leaf_images SET status = 'missing' WHERE id = ?",
+                    [(image_id,) for image_id, digest in hashes.items() if digest is None])
+                # Total leaf area per measurement from all of its successfully processed images
+                changed = sorted({measurement_id for _, measurement_id, _, _ in to_lookup})
+                self.db.connection.executemany("""
+                    UPDATE measurements SET leaf_area = (
+                        SELECT ROUND(SUM(leaf_area), 3) FROM leaf_images
+                        WHERE measurement_id = ? AND status = 'done'
+                    )
+                    WHERE id = ? AND EXISTS (
+                        SELECT 1 FROM leaf_images WHERE measurement_id = ? AND status = 'done'
+                    )
+                """, [(m, m, m) for m in changed])
+            summary['measurements_updated'] = len(changed)
+            return summary
+
+        except Exception as e:
+            print(f"❌ Leaf image processing error: {e}")
+            return None
@@ -11,6 +11,16 @@ import json
 
 from database_sqlite import StressDatabase
 from analysis import StressAnalyzer
+from gas_exchange import GasExchangeImporter
+from leaf_images import LeafImageProcessor
+from duplicates import DuplicateDetector
+from db_merge import DatabaseMerger
+from backup import BackupManager
+from audit import ChangeHistory
+from deletion import ChunkedDeleter
+from maintenance import MaintenanceScheduler
+from compact_storage import CompactMeasurementLayout
+from partitions import PartitionManager
 
 class AdvancedStressApp:
     def __init__(self, root):
@@ -25,7 +35,10 @@ class AdvancedStressApp:
             messagebox.showerror("Database Error", "Failed to connect to database. Please check your SQLite setup.")
             return
         
-        self.analyzer = StressAnalyzer(self.db)
+        self.backups = BackupManager(self.db)
+        self.deleter = ChunkedDeleter(self.db)
+        self.maintenance = MaintenanceScheduler(self.db)
+        self.init_subsystems()
         self.current_experiment_id = None
         self.current_treatment_id = None
         self.current_measurement_id = None
@@ -33,6 +46,26 @@ class AdvancedStressApp:
         self.setup_styles()
         self.create_widgets()
         self.load_initial_data()
+        
+        # Finish experiment deletions interrupted by a crash or exit
+        if self.deleter.resume(on_done=self.deletion_finished):
+            self.root.after(200, self.poll_deletion)
+        
+        # Run due maintenance once the user has been idle for a while
+        self.root.bind_all('<Any-KeyPress>', self.maintenance.note_activity, add='+')
+        self.root.bind_all('<Any-ButtonPress>', self.maintenance.note_activity, add='+')
+        self.root.after(60000, self.check_idle_maintenance)
+    
+    def init_subsystems(self):
+        """Create the analysis and data-management helpers for the open database"""
+        self.analyzer = StressAnalyzer(self.db)
+        self.gas_exchange = GasExchangeImporter(self.db)
+        self.leaf_images = LeafImageProcessor(self.db)
+        self.duplicates = DuplicateDetector(self.db)
+        self.merger = DatabaseMerger(self.db)
+        self.history = ChangeHistory(self.db)
+        self.compact = CompactMeasurementLayout(self.db)
+        self.partitions = PartitionManager(self.db)
     
     def setup_styles(self):
         self.style = ttk.Style()
@@ -206,6 +239,11 @@ class AdvancedStressApp:
         ttk.Label(main_frame, text="Data Analysis - Select an experiment to analyze", 
                  font=('Arial', 12, 'bold')).pack(pady=10)
         
+        # Analyses, plots and exports can run on a consistent in-memory copy
+        self.snapshot_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(main_frame, text="Analyse an in-memory snapshot of the experiment",
+                        variable=self.snapshot_var, command=self.toggle_snapshot_mode).pack(anchor='w')
+        
         self.analysis_content = ttk.Frame(main_frame)
         self.analysis_content.pack(fill='both', expand=True)
     
@@ -255,6 +293,30 @@ class AdvancedStressApp:
         ttk.Button(format_frame, text="Excel", command=lambda: self.export_comprehensive_data('xlsx')).pack(side='left', padx=2)
         ttk.Button(format_frame, text="Text", command=lambda: self.export_comprehensive_data('txt')).pack(side='left', padx=2)
         ttk.Button(format_frame, text="JSON", command=lambda: self.export_comprehensive_data('json')).pack(side='left', padx=2)
+        
+        delta_frame = ttk.Frame(export_frame)
+        delta_frame.pack(fill='x', pady=5)
+        
+        self.delta_export_var = tk.BooleanVar(value=False)
+        self.export_destination_var = tk.StringVar(value="LIMS")
+        ttk.Checkbutton(delta_frame, text="Only changes since last export to:",
+                        variable=self.delta_export_var).pack(side='left')
+        ttk.Entry(delta_frame, textvariable=self.export_destination_var, width=20).pack(side='left', padx=5)
+        
+        # Database maintenance frame
+        data_frame = ttk.LabelFrame(report_frame, text="Data Management", padding=15)
+        data_frame.pack(fill='x', pady=15)
+        
+        self.data_btn_frame = ttk.Frame(data_frame)
+        self.data_btn_frame.pack(fill='x', pady=5)
+        
+        ttk.Button(self.data_btn_frame, text="🔀 Merge Lab Databases", command=self.merge_lab_databases).pack(side='left', padx=2)
+        ttk.Button(self.data_btn_frame, text="💾 Backup Now", command=self.backup_database).pack(side='left', padx=2)
+        ttk.Button(self.data_btn_frame, text="♻️ Restore Backup", command=self.restore_database).pack(side='left', padx=2)
+        ttk.Button(self.data_btn_frame, text="🛠 Maintenance", command=self.show_maintenance).pack(side='left', padx=2)
+        ttk.Button(self.data_btn_frame, text="🗜 Compact Copy", command=self.create_compact_copy).pack(side='left', padx=2)
+        ttk.Button(self.data_btn_frame, text="📦 Archive / Restore Experiment", command=self.toggle_experiment_archive).pack(side='left', padx=2)
+        ttk.Button(self.data_btn_frame, text="🗃 Analysis Cache", command=self.show_analysis_cache).pack(side='left', padx=2)
     
     def load_initial_data(self):
         self.load_experiments()
@@ -269,6 +331,7 @@ class AdvancedStressApp:
                 SELECT id, experiment_code, experiment_name, plant_species, 
                        researcher, stress_type, start_date, status 
                 FROM experiments 
+                WHERE status IS NOT 'deleting'
                 ORDER BY created_at DESC
             """
             results = self.db.execute_query(query)
@@ -335,6 +398,13 @@ class AdvancedStressApp:
             values = item['values']
             self.current_experiment_id = values[0]
             
+            # Archived experiments are read from their partition file
+            try:
+                archived = self.prepare_analysis(self.current_experiment_id)
+            except Exception as e:
+                messagebox.showerror("Error", f"Cannot open archived experiment: {str(e)}")
+                archived = False
+            
             # Load experiment details into form
             self.clear_experiment_form()
             self.experiment_widgets['code_entry'].insert(0, values[1])
@@ -345,7 +415,7 @@ class AdvancedStressApp:
             if values[6]:
                 self.experiment_widgets['start_date_entry'].insert(0, values[6])
             
-            self.status_var.set(f"Selected: {values[2]}")
+            self.status_var.set(f"Selected: {values[2]}" + (" (archived, read-only)" if archived else ""))
             
             # Update treatments and analysis tabs
             self.update_treatments_tab()
@@ -404,34 +474,53 @@ class AdvancedStressApp:
             messagebox.showwarning("Warning", "Please select an experiment to delete")
             return
 
+        if self.deleter.is_running():
+            messagebox.showwarning("Warning", "Please wait for the current deletion to finish")
+            return
+
         if messagebox.askyesno("Confirm Delete", 
                               "Are you sure you want to delete this experiment and all its associated treatments and measurements?"):
             try:
-                # First delete related treatments and measurements
-                delete_measurements_query = """
-                    DELETE FROM measurements 
-                    WHERE treatment_id IN (SELECT id FROM treatments WHERE experiment_id = ?)
-                """
-                self.db.execute_query(delete_measurements_query, (self.current_experiment_id,))
-                
-                delete_treatments_query = "DELETE FROM treatments WHERE experiment_id = ?"
-                self.db.execute_query(delete_treatments_query, (self.current_experiment_id,))
-                
-                # Then delete the experiment
-                query = "DELETE FROM experiments WHERE id = ?"
-                if self.db.execute_query(query, (self.current_experiment_id,)):
-                    messagebox.showinfo("Success", "Experiment deleted successfully!")
-                    self.clear_experiment_form()
-                    self.load_experiments()
-                    self.update_report_experiments()
-                    self.current_experiment_id = None
-                    self.status_var.set("Experiment deleted")
-                else:
+                # Measurements are removed in small batches in the background,
+                # so large experiments do not lock the database
+                self.deletion_result = None
+                self.partitions.discard_partition(self.current_experiment_id)
+                if self.deleter.start_delete(self.current_experiment_id, on_done=self.deletion_finished) is None:
                     messagebox.showerror("Error", "Failed to delete experiment")
+                    return
+                self.clear_experiment_form()
+                self.load_experiments()
+                self.update_report_experiments()
+                self.current_experiment_id = None
+                self.status_var.set("Deleting experiment...")
+                self.root.after(200, self.poll_deletion)
 
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to delete experiment: {str(e)}")
     
+    def deletion_finished(self, result):
+        """Called on the deletion thread; the GUI thread picks the result up in poll_deletion"""
+        self.deletion_result = result
+    
+    def poll_deletion(self):
+        """Report background deletion progress from the GUI thread"""
+        if self.deleter.is_running():
+            if self.deleter.progress:
+                done, total = self.deleter.progress
+                self.status_var.set(f"Deleting experiment... {done:,} of {total:,} measurements")
+            self.root.after(200, self.poll_deletion)
+            return
+        
+        result = getattr(self, 'deletion_result', None)
+        if isinstance(result, Exception):
+            messagebox.showerror("Error", f"Failed to delete experiment: {result}\n"
+                                          "The deletion will resume the next time the app starts.")
+            self.status_var.set("Experiment deletion interrupted")
+        else:
+            self.status_var.set("Experiment deleted")
+        self.load_experiments()
+        self.update_report_experiments()
+    
     def clear_experiment_form(self):
         """Clear the experiment form"""
         for key, widget in self.experiment_widgets.items():
@@ -459,17 +548,26 @@ class AdvancedStressApp:
             for item in self.experiments_tree.get_children():
                 self.experiments_tree.delete(item)
             
-            query = """
+            # Species, researcher and stress type are matched against the small lookup
+            # tables in memory, then filtered on their integer codes
+            code_filters = []
+            params = [f"%{search_term}%", f"%{search_term}%"]
+            for column, lookup in (('species_id', 'species'), ('researcher_id', 'researchers'),
+                                   ('stress_type_id', 'stress_types')):
+                codes = self.db.lookup_matches(lookup, search_term)
+                if codes:
+                    code_filters.append(f"OR {column} IN ({', '.join('?' * len(codes))})")
+                    params.extend(codes)
+            
+            query = f"""
                 SELECT id, experiment_code, experiment_name, plant_species, 
                        researcher, stress_type, start_date, status 
                 FROM experiments 
-                WHERE experiment_code LIKE ? OR experiment_name LIKE ? 
-                   OR plant_species LIKE ? OR researcher LIKE ?
-                   OR stress_type LIKE ?
+                WHERE (experiment_code LIKE ? OR experiment_name LIKE ? 
+                   {' '.join(code_filters)})
+                  AND status IS NOT 'deleting'
                 ORDER BY created_at DESC
             """
-            search_pattern = f"%{search_term}%"
-            params = (search_pattern, search_pattern, search_pattern, search_pattern, search_pattern)
             results = self.db.execute_query(query, params)
             
             if results:
@@ -1229,15 +1327,307 @@ class AdvancedStressApp:
             messagebox.showerror("Error", error_msg)
             print(f"Debug - Export error: {e}")  # For debugging
     
+    def merge_lab_databases(self):
+        """Merge experiments and measurements from other benches' database files"""
+        paths = filedialog.askopenfilenames(
+            title="Select Database Files to Merge",
+            filetypes=[("SQLite databases", "*.db *.sqlite"), ("All files", "*.*")]
+        )
+        if not paths:
+            return
+        
+        try:
+            self.status_var.set(f"Merging {len(paths)} database files...")
+            self.root.update_idletasks()
+            
+            summary = self.merger.merge_files(paths)
+            message = (f"Merged {summary['files']} files: {summary['experiments']} experiments, "
+                       f"{summary['treatments']} treatments, {summary['measurements']} measurements added")
+            if summary['conflicts']:
+                lines = [f"{c['kind']} {c['key']}: {c['field']} ours={c['ours']!r} theirs={c['theirs']!r}"
+                         for c in summary['conflicts'][:15]]
+                message += f"\n\n{len(summary['conflicts'])} conflicts (kept this database's values):\n" + "\n".join(lines)
+            if summary['skipped']:
+                message += "\n\nSkipped experiments being deleted or archived in their source file:\n" + ", ".join(summary['skipped'])
+            if summary['errors']:
+                message += f"\n\nFailed to merge:\n" + "\n".join(summary['errors'])
+            messagebox.showinfo("Merge Databases", message)
+            self.load_experiments()
+            self.update_report_experiments()
+            self.status_var.set(f"Merged {summary['measurements']} measurements from {summary['files']} files")
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to merge databases: {str(e)}")
+    
+    def backup_database(self):
+        """Take a compressed snapshot on a background thread while the app stays usable"""
+        self.backup_result = None
+        
+        def finished(result):
+            self.backup_result = result
+        
+        if not self.backups.start_snapshot(on_done=finished):
+            messagebox.showinfo("Backup", "A backup is already running")
+            return
+        self.status_var.set("Backing up database...")
+        self.root.after(200, self.poll_backup)
+    
+    def poll_backup(self):
+        """Report snapshot progress from the GUI thread"""
+        if self.backups.is_running():
+            if self.backups.progress:
+                done, total = self.backups.progress
+                self.status_var.set(f"Backing up database... {100 * done / max(total, 1):.0f}%")
+            self.root.after(200, self.poll_backup)
+            return
+        
+        result = self.backup_result
+        if isinstance(result, dict):
+            self.status_var.set(
+                f"Backup saved to {os.path.basename(result['snapshot_path'])} "
+                f"({result['database_bytes'] / 1e6:.1f} MB in {result['backup_seconds'] + result['compress_seconds']:.1f} s)")
+        else:
+            messagebox.showerror("Error", f"Backup failed: {result}")
+            self.status_var.set("Backup failed")
+    
+    def restore_database(self):
+        """Restore the database from a snapshot"""
+        if self.backups.is_running():
+            messagebox.showwarning("Warning", "Please wait for the running backup to finish")
+            return
+        if self.deleter.is_running() or self.maintenance.is_running():
+            messagebox.showwarning("Warning", "Please wait for the running deletion or maintenance to finish")
+            return
+        filename = filedialog.askopenfilename(
+            title="Select Backup Snapshot",
+            initialdir=self.backups.backup_dir if os.path.isdir(self.backups.backup_dir) else None,
+            filetypes=[("Database snapshots", "*.db.gz"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        if not messagebox.askyesno("Restore Backup",
+                                   f"Replace all current data with {os.path.basename(filename)}?\n"
+                                   "Changes made since that backup will be lost."):
+            return
+        
+        seconds = self.backups.restore_snapshot(filename)
+        if seconds is None:
+            messagebox.showerror("Error", "Failed to restore backup")
+            return
+        # Reopen so migrations run on the restored file and cached table state is dropped
+        self.analyzer.use_live()
+        self.analyzer.snapshots.release_all()
+        self.snapshot_var.set(False)
+        self.db.close_connection()
+        self.db.create_database()
+        self.init_subsystems()
+        self.current_experiment_id = None
+        self.current_treatment_id = None
+        self.current_measurement_id = None
+        self.load_experiments()
+        self.update_report_experiments()
+        self.status_var.set(f"Restored {os.path.basename(filename)} in {seconds:.1f} s")
+    
+    def check_idle_maintenance(self):
+        """Start due maintenance tasks in the background when the app is idle"""
+        if not self.deleter.is_running() and not self.backups.is_running():
+            if self.maintenance.start_if_idle():
+                self.status_var.set("Running database maintenance...")
+        self.check_snapshot_memory()
+        self.root.after(60000, self.check_idle_maintenance)
+    
+    def prepare_analysis(self, experiment_id):
+        """Make an experiment's data available to the analyzer; returns True if it is archived"""
+        archived = self.db.use_experiment(experiment_id)
+        if self.snapshot_var.get():
+            snapshot = self.analyzer.use_snapshot(experiment_id)
+            self.status_var.set(f"Analysing snapshot taken {snapshot.taken_at:%H:%M:%S} "
+                                f"({snapshot.size_bytes() / 1e6:.1f} MB in memory)")
+        return archived
+    
+    def toggle_snapshot_mode(self):
+        """Switch the analyzer between the database file and an in-memory snapshot"""
+        try:
+            if self.snapshot_var.get():
+                if self.current_experiment_id:
+                    self.prepare_analysis(self.current_experiment_id)
+            else:
+                self.analyzer.use_live()
+                self.analyzer.snapshots.release_all()
+                self.status_var.set("Analysing the database file")
+        
+        except Exception as e:
+            self.snapshot_var.set(False)
+            self.analyzer.use_live()
+            messagebox.showerror("Error", f"Failed to load snapshot: {str(e)}")
+    
+    def check_snapshot_memory(self):
+        """Release analysis snapshots when memory runs short"""
+        released = self.analyzer.snapshots.release_if_pressured()
+        if released:
+            if self.analyzer.db in released:
+                self.analyzer.use_live()
+                self.snapshot_var.set(False)
+            self.status_var.set(f"Released {len(released)} analysis snapshot(s) to free memory")
+    
+    def show_maintenance(self):
+        """Show database health and recent maintenance, and offer to run it now"""
+        try:
+            stats = self.maintenance.database_stats()
+            text = (f"File size: {stats['file_bytes'] / 1e6:.1f} MB ({stats['page_count']:,} pages of {stats['page_size']} bytes)\n"
+                    f"Free pages: {stats['free_pages']:,} ({100 * stats['free_fraction']:.1f}%)\n"
+                    f"Auto-vacuum: {stats['auto_vacuum']}\n")
+            if stats['unused_fraction'] is not None:
+                text += f"Unused space within pages: {100 * stats['unused_fraction']:.1f}%\n"
+            
+            log = self.maintenance.get_log(12)
+            if log:
+                text += "\nRecent maintenance:\n"
+                for task, started, seconds, result, *_ in log:
+                    text += f"{started}  {task:<18} {seconds:7.2f} s  {result}\n"
+            due = self.maintenance.due_tasks()
+            text += f"\nDue now: {', '.join(due) if due else 'nothing'}\n\nRun all maintenance tasks now?"
+            
+            if not messagebox.askyesno("Database Maintenance", text):
+                return
+            if stats['auto_vacuum'] != 'incremental' and messagebox.askyesno(
+                    "Database Maintenance",
+                    "This database cannot shrink in place. Rewrite it once to enable incremental vacuum?"):
+                self.maintenance.enable_incremental_vacuum()
+            
+            self.status_var.set("Running database maintenance...")
+            self.root.update_idletasks()
+            results = self.maintenance.run_tasks(list(self.maintenance.intervals))
+            summary = "\n".join(f"{task}: {result} ({seconds:.2f} s)" for task, seconds, result in results)
+            messagebox.showinfo("Database Maintenance", summary)
+            self.status_var.set("Database maintenance complete")
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"Maintenance failed: {str(e)}")
+    
+    def show_analysis_cache(self):
+        """Show analysis result cache statistics and offer to clear it"""
+        try:
+            cache = self.analyzer.results
+            stats = cache.stats()
+            total = sum(entry['bytes'] for entry in stats.values())
+            text = f"Stored results: {total / 1e6:.2f} MB of {cache.max_bytes / 1e6:.0f} MB\n\n"
+            for analysis, entry in stats.items():
+                rate = f"{100 * entry['hit_rate']:.0f}%" if entry['hit_rate'] is not None else "-"
+                text += (f"{analysis}: {entry['hits']} hits, {entry['misses']} misses ({rate}), "
+                         f"{entry['evictions']} evicted, {entry['entries']} stored\n")
+            if not stats:
+                text += "No analyses have been run yet.\n"
+            text += "\nClear all stored results?"
+            
+            if messagebox.askyesno("Analysis Cache", text):
+                cache.clear()
+                self.status_var.set("Analysis cache cleared")
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to read analysis cache: {str(e)}")
+    
+    def toggle_experiment_archive(self):
+        """Move the selected experiment to its own partition file, or restore an archived one"""
+        if not self.current_experiment_id:
+            messagebox.showwarning("Warning", "Please select an experiment first")
+            return
+        
+        try:
+            experiment_id = self.current_experiment_id
+            if self.db.partition_path(experiment_id):
+                if not messagebox.askyesno("Restore Experiment",
+                                           "Move this archived experiment back into the main database?"):
+                    return
+                result = self.partitions.restore_experiment(experiment_id)
+                if result is None:
+                    messagebox.showerror("Error", "Failed to restore experiment")
+                    return
+                message = f"Restored {result['measurements']:,} measurements"
+            else:
+                if not messagebox.askyesno("Archive Experiment",
+                                           "Move this experiment's treatments and measurements to their own file?\n"
+                                           "It stays listed and can be analysed, but becomes read-only until restored."):
+                    return
+                self.status_var.set("Archiving experiment...")
+                self.root.update_idletasks()
+                path = self.partitions.archive_experiment(experiment_id)
+                if path is None:
+                    messagebox.showerror("Error", "Failed to archive experiment")
+                    return
+                message = f"Archived to {path}"
+            
+            self.load_experiments()
+            self.update_report_experiments()
+            self.current_treatment_id = None
+            self.prepare_analysis(experiment_id)
+            self.update_treatments_tab()
+            self.update_analysis_tab()
+            self.status_var.set(message)
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"Archive operation failed: {str(e)}")
+    
+    def create_compact_copy(self):
+        """Write a compact-layout copy of the database and compare it with the live file"""
+        filename = filedialog.asksaveasfilename(
+            title="Save Compact Copy As",
+            defaultextension=".db",
+            initialfile="plant_stress_compact.db",
+            filetypes=[("SQLite databases", "*.db"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        if os.path.abspath(filename) == os.path.abspath(self.db.db_file):
+            messagebox.showwarning("Warning", "Choose a file other than the open database")
+            return
+        
+        try:
+            self.status_var.set("Writing compact copy...")
+            self.root.update_idletasks()
+            result = self.compact.convert(filename)
+            self.status_var.set("Benchmarking storage layouts...")
+            self.root.update_idletasks()
+            bench = self.compact.benchmark(filename)
+            
+            text = (f"Compact copy of {result['rows']:,} measurements written in {result['seconds']:.1f} s\n\n"
+                    f"{'':<22}{'Standard':>14}{'Compact':>14}\n"
+                    f"{'File size (MB)':<22}{result['standard_bytes'] / 1e6:>14.1f}{result['compact_bytes'] / 1e6:>14.1f}\n")
+            if bench:
+                standard, compact = bench['standard'], bench['compact']
+                text += f"{'Range scans / s':<22}{standard['scans'] / standard['seconds']:>14.0f}{compact['scans'] / compact['seconds']:>14.0f}\n"
+                text += f"{'Rows / s':<22}{standard['rows_per_second']:>14,.0f}{compact['rows_per_second']:>14,.0f}\n"
+                if standard['page_reads'] is not None:
+                    text += f"{'Page reads':<22}{standard['page_reads']:>14,}{compact['page_reads']:>14,}\n"
+                if standard['cache_hit_rate'] is not None:
+                    text += (f"{'Cache hit rate (est.)':<22}{100 * standard['cache_hit_rate']:>13.1f}%"
+                             f"{100 * compact['cache_hit_rate']:>13.1f}%\n")
+            text += ("\nThe compact copy is for archiving and benchmarking only; expand it before opening it "
+                     "in this application. This database is unchanged.")
+            messagebox.showinfo("Compact Copy", text)
+            self.status_var.set(f"Compact copy saved to {os.path.basename(filename)}")
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to create compact copy: {str(e)}")
+    
     def export_comprehensive_data(self, format_type):
         """Export comprehensive data for all experiments"""
         try:
-            # Get all data
-            experiments = self.db.execute_query("SELECT * FROM experiments")
-            treatments = self.db.execute_query("SELECT * FROM treatments")
-            measurements = self.db.execute_query("SELECT * FROM measurements")
+            destination = self.export_destination_var.get().strip() if self.delta_export_var.get() else None
+            deleted = []
+            if destination:
+                # Only rows changed since the last export to this destination, plus deletions
+                frames, watermarks = self.db.get_delta(destination)
+                experiments, treatments, measurements, deleted = (
+                    list(frames[table].itertuples(index=False, name=None))
+                    for table in ('experiments', 'treatments', 'measurements', 'deleted_rows'))
+            else:
+                # Get all data
+                experiments = self.db.execute_query("SELECT * FROM experiments")
+                treatments = self.db.execute_query("SELECT * FROM main.treatments")
+                measurements = self.db.execute_query("SELECT * FROM main.measurements")
             
-            if not experiments and not treatments and not measurements:
+            if not experiments and not treatments and not measurements and not deleted:
                 messagebox.showinfo("Info", "No data available for export")
                 return
             
@@ -1255,14 +1645,16 @@ class AdvancedStressApp:
                     if experiments:
                         exp_df = pd.DataFrame(experiments, columns=[
                             'ID', 'Code', 'Name', 'Species', 'Stress Type', 'Researcher',
-                            'Start Date', 'End Date', 'Description', 'Status', 'Created', 'Updated'
+                            'Start Date', 'End Date', 'Description', 'Status', 'Created', 'Updated',
+                            'Species ID', 'Stress Type ID', 'Researcher ID'
                         ])
                         exp_df.to_csv(f"{base_name}_experiments.csv", index=False)
                     
                     if treatments:
                         treat_df = pd.DataFrame(treatments, columns=[
                             'ID', 'Experiment ID', 'Treatment Name', 'Type', 'Stress Level',
-                            'Concentration', 'Duration', 'Temperature', 'Description', 'Created', 'Updated'
+                            'Concentration', 'Duration', 'Temperature', 'Description', 'Created', 'Updated',
+                            'Type ID', 'Stress Level ID'
                         ])
                         treat_df.to_csv(f"{base_name}_treatments.csv", index=False)
                     
@@ -1270,10 +1662,14 @@ class AdvancedStressApp:
                         meas_df = pd.DataFrame(measurements, columns=[
                             'ID', 'Treatment ID', 'Date', 'Height', 'Leaf Area', 'Chlorophyll',
                             'Photosynthesis', 'Stomatal', 'Root Length', 'Biomass Fresh',
-                            'Biomass Dry', 'Water Content', 'Notes', 'Created'
+                            'Biomass Dry', 'Water Content', 'Notes', 'Created', 'Plant ID', 'Updated'
                         ])
                         meas_df.to_csv(f"{base_name}_measurements.csv", index=False)
                     
+                    if destination:
+                        deleted_df = pd.DataFrame(deleted, columns=['ID', 'Table', 'Row ID', 'Deleted'])
+                        deleted_df.to_csv(f"{base_name}_deleted.csv", index=False)
+                    
                     messagebox.showinfo("Success", f"Comprehensive data exported successfully to multiple CSV files")
                 
                 elif format_type == 'xlsx':
@@ -1281,14 +1677,16 @@ class AdvancedStressApp:
                         if experiments:
                             exp_df = pd.DataFrame(experiments, columns=[
                                 'ID', 'Code', 'Name', 'Species', 'Stress Type', 'Researcher',
-                                'Start Date', 'End Date', 'Description', 'Status', 'Created', 'Updated'
+                                'Start Date', 'End Date', 'Description', 'Status', 'Created', 'Updated',
+                                'Species ID', 'Stress Type ID', 'Researcher ID'
                             ])
                             exp_df.to_excel(writer, sheet_name='Experiments', index=False)
                         
                         if treatments:
                             treat_df = pd.DataFrame(treatments, columns=[
                                 'ID', 'Experiment ID', 'Treatment Name', 'Type', 'Stress Level',
-                                'Concentration', 'Duration', 'Temperature', 'Description', 'Created', 'Updated'
+                                'Concentration', 'Duration', 'Temperature', 'Description', 'Created', 'Updated',
+                                'Type ID', 'Stress Level ID'
                             ])
                             treat_df.to_excel(writer, sheet_name='Treatments', index=False)
                         
@@ -1296,9 +1694,13 @@ class AdvancedStressApp:
                             meas_df = pd.DataFrame(measurements, columns=[
                                 'ID', 'Treatment ID', 'Date', 'Height', 'Leaf Area', 'Chlorophyll',
                                 'Photosynthesis', 'Stomatal', 'Root Length', 'Biomass Fresh',
-                                'Biomass Dry', 'Water Content', 'Notes', 'Created'
+                                'Biomass Dry', 'Water Content', 'Notes', 'Created', 'Plant ID', 'Updated'
                             ])
                             meas_df.to_excel(writer, sheet_name='Measurements', index=False)
+                        
+                        if destination:
+                            deleted_df = pd.DataFrame(deleted, columns=['ID', 'Table', 'Row ID', 'Deleted'])
+                            deleted_df.to_excel(writer, sheet_name='Deleted', index=False)
                     
                     messagebox.showinfo("Success", f"Comprehensive data exported successfully to {filename}")
                 
@@ -1335,6 +1737,12 @@ class AdvancedStressApp:
                                 f.write(f"Chlorophyll: {meas[5]}, Photosynthesis: {meas[6]}\n")
                                 f.write(f"Water Content: {meas[11]}%, Notes: {meas[12]}\n")
                                 f.write("\n")
+                        
+                        if deleted:
+                            f.write("\nDELETED:\n")
+                            f.write("-" * 40 + "\n")
+                            for row in deleted:
+                                f.write(f"{row[1]} ID {row[2]} deleted at {row[3]}\n")
                     
                     messagebox.showinfo("Success", f"Comprehensive data exported successfully to {filename}")
                 
@@ -1344,6 +1752,10 @@ class AdvancedStressApp:
                         'treatments': [],
                         'measurements': []
                     }
+                    if destination:
+                        data['deleted'] = [
+                            {'table': row[1], 'id': row[2], 'deleted_at': row[3]} for row in deleted
+                        ]
                     
                     if experiments:
                         for exp in experiments:
@@ -1374,7 +1786,8 @@ class AdvancedStressApp:
                                 'photosynthesis_rate': meas[6], 'stomatal_conductance': meas[7],
                                 'root_length': meas[8], 'biomass_fresh': meas[9],
                                 'biomass_dry': meas[10], 'water_content': meas[11],
-                                'notes': meas[12], 'created_at': meas[13]
+                                'notes': meas[12], 'created_at': meas[13],
+                                'plant_id': meas[14], 'updated_at': meas[15]
                             })
                     
                     with open(filename, 'w', encoding='utf-8') as f:
@@ -1382,6 +1795,8 @@ class AdvancedStressApp:
                     
                     messagebox.showinfo("Success", f"Comprehensive data exported successfully to {filename}")
                 
+                if destination:
+                    self.db.save_export_watermarks(destination, watermarks)
                 self.status_var.set(f"Exported comprehensive data to {os.path.basename(filename)}")
             
         except Exception as e:
@@ -1425,6 +1840,7 @@ class AdvancedStressApp:
         # Measurement form fields
         fields = [
             ('Measurement Date:*', 'date_entry'),
+            ('Plant / Replicate:', 'plant_combo'),
             ('Plant Height (cm):', 'height_entry'),
             ('Leaf Area (cm²):', 'leaf_area_entry'),
             ('Chlorophyll Content:', 'chlorophyll_entry'),
@@ -1444,6 +1860,9 @@ class AdvancedStressApp:
             if 'date' in key:
                 widget = ttk.Entry(left_frame, width=25)
                 widget.insert(0, datetime.now().strftime('%Y-%m-%d'))
+            elif 'plant' in key:
+                widget = ttk.Combobox(left_frame, width=23,
+                                      values=self.get_plant_labels(self.current_treatment_id))
             elif 'notes' in key:
                 widget = tk.Text(left_frame, width=25, height=4, font=('Arial', 9))
             else:
@@ -1476,6 +1895,12 @@ class AdvancedStressApp:
                    command=self.calculate_water_content).pack(side='left', padx=2)
         ttk.Button(quick_actions_frame, text="📈 Growth Analysis", 
                    command=self.quick_growth_analysis).pack(side='left', padx=2)
+        ttk.Button(quick_actions_frame, text="📥 Import Gas Exchange", 
+                   command=self.import_gas_exchange_logs).pack(side='left', padx=2)
+        ttk.Button(quick_actions_frame, text="🍃 Leaf Area from Images", 
+                   command=self.add_leaf_images).pack(side='left', padx=2)
+        ttk.Button(quick_actions_frame, text="🕘 Change History", 
+                   command=self.show_measurement_history).pack(side='left', padx=2)
         
         # EXPORT BUTTONS FOR MEASUREMENTS - FIXED: Now properly visible
         export_frame = ttk.LabelFrame(left_frame, text="Export Measurements Data", padding=10)
@@ -1556,6 +1981,25 @@ class AdvancedStressApp:
         # Load measurements for current treatment
         self.load_measurements()
 
+    def get_plant_labels(self, treatment_id):
+        """Get labels of the plants recorded for a treatment"""
+        try:
+            query = "SELECT plant_label FROM plants WHERE treatment_id = ? ORDER BY replicate, plant_label"
+            result = self.db.execute_query(query, (treatment_id,))
+            return [row[0] for row in result] if result else []
+        except Exception as e:
+            print(f"Error getting plant labels: {e}")
+            return []
+    
+    def get_plant_id(self):
+        """Plant id for the label in the measurement form, creating the plant if new"""
+        label = self.measurement_widgets['plant_combo'].get().strip()
+        if not label:
+            return None
+        plant_id = self.db.get_or_create_plant(self.current_treatment_id, label)
+        self.measurement_widgets['plant_combo']['values'] = self.get_plant_labels(self.current_treatment_id)
+        return plant_id
+
     def get_treatment_details(self, treatment_id):
         """Get treatment details by ID"""
         try:
@@ -1691,15 +2135,22 @@ class AdvancedStressApp:
                 messagebox.showerror("Error", "Please enter at least one measurement value")
                 return
             
+            problems = self.analyzer.validator.check_values(measurement_data)
+            if problems and not messagebox.askyesno(
+                    "Check Values", "These values look implausible:\n\n" + "\n".join(problems) +
+                    "\n\nSave the measurement anyway?"):
+                return
+            
             query = """
                 INSERT INTO measurements 
-                (treatment_id, measurement_date, plant_height, leaf_area, 
+                (treatment_id, plant_id, measurement_date, plant_height, leaf_area, 
                  chlorophyll_content, photosynthesis_rate, stomatal_conductance,
                  root_length, biomass_fresh, biomass_dry, water_content, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
             params = (
                 self.current_treatment_id,
+                self.get_plant_id(),
                 date,
                 measurement_data['plant_height'],
                 measurement_data['leaf_area'],
@@ -1746,10 +2197,12 @@ class AdvancedStressApp:
         """Load complete measurement details into form"""
         try:
             query = """
-                SELECT measurement_date, plant_height, leaf_area, chlorophyll_content,
-                       photosynthesis_rate, stomatal_conductance, root_length,
-                       biomass_fresh, biomass_dry, water_content, notes
-                FROM measurements WHERE id = ?
+                SELECT m.measurement_date, m.plant_height, m.leaf_area, m.chlorophyll_content,
+                       m.photosynthesis_rate, m.stomatal_conductance, m.root_length,
+                       m.biomass_fresh, m.biomass_dry, m.water_content, m.notes, p.plant_label
+                FROM measurements m
+                LEFT JOIN plants p ON m.plant_id = p.id
+                WHERE m.id = ?
             """
             result = self.db.execute_query(query, (measurement_id,))
             
@@ -1769,6 +2222,7 @@ class AdvancedStressApp:
                 if data[8]: self.measurement_widgets['biomass_dry_entry'].insert(0, str(data[8]))
                 if data[9]: self.measurement_widgets['water_content_entry'].insert(0, str(data[9]))
                 if data[10]: self.measurement_widgets['notes_text'].insert('1.0', data[10])
+                if data[11]: self.measurement_widgets['plant_combo'].set(data[11])
         
         except Exception as e:
             print(f"Error loading measurement details: {e}")
@@ -1800,15 +2254,22 @@ class AdvancedStressApp:
                 'notes': self.measurement_widgets['notes_text'].get('1.0', 'end-1c').strip()
             }
             
+            problems = self.analyzer.validator.check_values(measurement_data)
+            if problems and not messagebox.askyesno(
+                    "Check Values", "These values look implausible:\n\n" + "\n".join(problems) +
+                    "\n\nSave the changes anyway?"):
+                return
+            
             query = """
                 UPDATE measurements 
-                SET measurement_date=?, plant_height=?, leaf_area=?, 
+                SET measurement_date=?, plant_id=?, plant_height=?, leaf_area=?, 
                     chlorophyll_content=?, photosynthesis_rate=?, stomatal_conductance=?,
                     root_length=?, biomass_fresh=?, biomass_dry=?, water_content=?, notes=?
                 WHERE id=?
             """
             params = (
                 date,
+                self.get_plant_id(),
                 measurement_data['plant_height'],
                 measurement_data['leaf_area'],
                 measurement_data['chlorophyll_content'],
@@ -1984,6 +2445,96 @@ class AdvancedStressApp:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to calculate water content: {str(e)}")
 
+    def import_gas_exchange_logs(self):
+        """Import photosynthesis and conductance from gas-exchange instrument logs"""
+        if not self.current_experiment_id or not self.current_treatment_id:
+            messagebox.showwarning("Warning", "Please select a treatment first")
+            return
+        
+        paths = filedialog.askopenfilenames(
+            title="Select Gas-Exchange Log Files",
+            filetypes=[("Instrument logs", "*.txt *.tsv *.log"), ("All files", "*.*")]
+        )
+        if not paths:
+            return
+        
+        try:
+            self.status_var.set(f"Importing {len(paths)} gas-exchange logs...")
+            self.root.update_idletasks()
+            
+            # Observations labelled with a treatment name go to that treatment,
+            # unlabelled ones to the currently selected one
+            summary = self.gas_exchange.import_files(
+                paths, self.current_experiment_id,
+                default_treatment_id=self.current_treatment_id
+            )
+            if summary is None:
+                messagebox.showerror("Error", "Failed to import gas-exchange logs")
+                return
+            
+            message = (f"Imported {summary['rows']} observations from {summary['files']} files\n"
+                       f"Skipped {summary['skipped']} previously imported files")
+            if summary['unmapped']:
+                labels = ", ".join(f"{label} ({count})" for label, count in
+                                   sorted(summary['unknown_labels'].items())[:10])
+                message += (f"\n{summary['unmapped']} observations were not imported: "
+                            f"their labels match no treatment" + (f":\n{labels}" if labels else ""))
+            if summary['errors']:
+                message += f"\n{len(summary['errors'])} files failed:\n" + "\n".join(summary['errors'][:5])
+            messagebox.showinfo("Gas Exchange Import", message)
+            self.load_measurements()
+            self.status_var.set(f"Imported {summary['rows']} gas-exchange observations")
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to import gas-exchange logs: {str(e)}")
+    
+    def add_leaf_images(self):
+        """Attach leaf scans to the selected measurement and extract leaf area for the experiment"""
+        if not self.current_measurement_id:
+            messagebox.showwarning("Warning", "Please select a measurement first")
+            return
+        
+        paths = filedialog.askopenfilenames(
+            title="Select Leaf Images",
+            filetypes=[("Images", "*.png *.jpg *.jpeg *.tif *.tiff"), ("All files", "*.*")]
+        )
+        if not paths:
+            return
+        
+        try:
+            self.status_var.set(f"Measuring leaf area in {len(paths)} images...")
+            self.root.update_idletasks()
+            
+            self.leaf_images.register_images(self.current_measurement_id, paths)
+            summary = self.leaf_images.process_images(self.current_experiment_id)
+            if summary is None:
+                messagebox.showerror("Error", "Failed to process leaf images")
+                return
+            
+            message = (f"Processed {summary['processed']} images "
+                       f"({summary['cached']} reused from cache)\n"
+                       f"Updated leaf area for {summary['measurements_updated']} measurements")
+            if summary['missing'] or summary['failed']:
+                message += f"\n{summary['missing']} missing and {summary['failed']} unreadable images"
+            messagebox.showinfo("Leaf Area", message)
+            self.load_measurements()
+            self.status_var.set(f"Leaf area updated for {summary['measurements_updated']} measurements")
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to process leaf images: {str(e)}")
+    
+    def show_measurement_history(self):
+        """Show every recorded edit of the selected measurement"""
+        if not self.current_measurement_id:
+            messagebox.showwarning("Warning", "Please select a measurement first")
+            return
+        
+        history = self.history.get_history('measurements', int(self.current_measurement_id))
+        if history is None:
+            messagebox.showinfo("Change History", "This measurement has not been edited")
+            return
+        messagebox.showinfo("Change History", history.to_string(index=False))
+    
     def quick_growth_analysis(self):
         """Quick growth analysis for the current treatment"""
         if not self.current_treatment_id:
@@ -2041,6 +2592,13 @@ class AdvancedStressApp:
         ttk.Button(btn_frame, text="Show Growth Rates", command=self.show_growth_rates).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Stress Impact Analysis", command=self.show_stress_impact).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Create Timeline Plot", command=self.create_timeline_plot).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Environment Plot", command=self.create_environment_plot).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="ANOVA / Tukey HSD", command=self.show_anova_results).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Stress Onset Dates", command=self.show_stress_onsets).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Detect Stress Onset", command=self.detect_stress_onsets).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Derived Metrics", command=self.show_derived_metrics).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Data Quality Flags", command=self.show_data_flags).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Find Duplicates", command=self.find_duplicate_measurements).pack(side='left', padx=5)
         
         # Export buttons for analysis
         export_frame = ttk.LabelFrame(self.analysis_content, text="Export Analysis Data", padding=15)
@@ -2056,7 +2614,10 @@ class AdvancedStressApp:
     def update_report_experiments(self):
         """Update the experiments list in reports tab"""
         try:
-            query = "SELECT id, experiment_code, experiment_name FROM experiments ORDER BY experiment_code"
+            query = """
+                SELECT id, experiment_code, experiment_name FROM experiments
+                WHERE status IS NOT 'deleting' ORDER BY experiment_code
+            """
             results = self.db.execute_query(query)
             
             if results:
@@ -2093,6 +2654,120 @@ class AdvancedStressApp:
         else:
             messagebox.showinfo("Info", "No data available for stress impact analysis")
     
+    def show_anova_results(self):
+        """Show one-way ANOVA and Tukey HSD results for all metrics"""
+        if not self.current_experiment_id:
+            messagebox.showwarning("Warning", "Please select an experiment first")
+            return
+        
+        anova = self.analyzer.anova.one_way_anova(self.current_experiment_id)
+        tukey = self.analyzer.anova.tukey_hsd(self.current_experiment_id)
+        if anova is None or anova.empty:
+            messagebox.showinfo("Info", "No data available for ANOVA")
+            return
+        
+        effects = anova[anova['term'] != 'Residual'][['metric', 'df', 'F', 'p_value']]
+        text = effects.round(4).to_string(index=False)
+        if tukey is not None and not tukey.empty:
+            significant = tukey[tukey['reject']]
+            text += f"\n\nTukey HSD: {len(significant)} of {len(tukey)} pairwise differences significant (alpha=0.05)"
+            if not significant.empty:
+                text += "\n" + significant[['metric', 'group1', 'group2', 'mean_diff', 'p_adj']].round(4).to_string(index=False)
+        messagebox.showinfo("ANOVA (treatment)", text)
+    
+    def show_derived_metrics(self):
+        """Show treatment means of the derived metrics, recomputing only changed measurements"""
+        if not self.current_experiment_id:
+            messagebox.showwarning("Warning", "Please select an experiment first")
+            return
+        
+        metrics = self.analyzer.derived.get_metrics(self.current_experiment_id)
+        if metrics is None:
+            messagebox.showinfo("Info", "No data available for derived metrics")
+            return
+        
+        summary = metrics.drop(columns=['measurement_date', 'measurement_id']).groupby('treatment_name').mean()
+        messagebox.showinfo("Derived Metrics (treatment means)", summary.round(3).T.to_string())
+    
+    def show_data_flags(self):
+        """Show range, consistency and outlier flags for the current experiment"""
+        if not self.current_experiment_id:
+            messagebox.showwarning("Warning", "Please select an experiment first")
+            return
+        
+        flags = self.analyzer.validator.get_flags(self.current_experiment_id)
+        if flags is None:
+            messagebox.showinfo("Data Quality", "No problems found in this experiment's measurements")
+            return
+        
+        counts = flags.groupby(['rule', 'metric']).size().rename('rows').reset_index()
+        text = f"{flags['measurement_id'].nunique()} measurements flagged\n\n" + counts.to_string(index=False)
+        problems = flags[flags['rule'] != 'outlier'].head(20)
+        if not problems.empty:
+            text += "\n\n" + problems[['measurement_id', 'treatment_name', 'measurement_date', 'metric', 'value']].to_string(index=False)
+        messagebox.showinfo("Data Quality Flags", text)
+    
+    def find_duplicate_measurements(self):
+        """Report duplicate measurements in the current experiment and offer to merge the exact ones"""
+        if not self.current_experiment_id:
+            messagebox.showwarning("Warning", "Please select an experiment first")
+            return
+        
+        groups = self.duplicates.find_duplicates(self.current_experiment_id)
+        if groups is None:
+            messagebox.showinfo("Duplicates", "No duplicate measurements found")
+            return
+        
+        kinds = groups.drop_duplicates(['group_id', 'kind'])['kind'].value_counts()
+        preview = groups[['group_id', 'id', 'measurement_date', 'kind']].head(30).to_string(index=False)
+        message = (f"Found {kinds.get('exact', 0)} exact and {kinds.get('near', 0)} near-duplicate groups\n\n"
+                   f"{preview}\n\nNear duplicates are listed for review only and are never merged.")
+        if not kinds.get('exact', 0):
+            messagebox.showinfo("Duplicate Measurements", message)
+            return
+        if messagebox.askyesno("Duplicate Measurements", message + "\n\nMerge each exact group into its earliest entry?"):
+            removed = self.duplicates.merge_duplicates(groups)
+            if removed is None:
+                messagebox.showerror("Error", "Failed to merge duplicate measurements")
+                return
+            self.load_measurements()
+            self.status_var.set(f"Merged duplicates: removed {removed} measurements")
+    
+    def show_stress_onsets(self):
+        """Show stored stress-onset dates, detecting them only if none are stored yet"""
+        if not self.current_experiment_id:
+            messagebox.showwarning("Warning", "Please select an experiment first")
+            return
+        
+        onsets = self.analyzer.changepoints.get_changepoints(self.current_experiment_id, onsets_only=True)
+        if onsets is None:
+            self.detect_stress_onsets()
+            return
+        
+        columns = ['treatment_name', 'metric', 'change_date', 'mean_before', 'mean_after']
+        messagebox.showinfo("Stress Onset Dates",
+                            onsets[columns].to_string(index=False) +
+                            f"\n\nDetected at: {onsets['detected_at'].max()}")
+    
+    def detect_stress_onsets(self):
+        """Re-run changepoint detection for the current experiment"""
+        if not self.current_experiment_id:
+            messagebox.showwarning("Warning", "Please select an experiment first")
+            return
+        
+        self.status_var.set("Detecting stress onset...")
+        self.root.update_idletasks()
+        changepoints = self.analyzer.changepoints.detect(self.current_experiment_id)
+        if changepoints is None or changepoints.empty:
+            messagebox.showinfo("Info", "No divergence from control detected (a 'control' treatment with measurements is required)")
+            self.status_var.set("No stress onset detected")
+            return
+        
+        onsets = changepoints[changepoints['is_onset'] == 1]
+        columns = ['treatment_name', 'metric', 'change_date', 'mean_before', 'mean_after']
+        messagebox.showinfo("Stress Onset Dates", onsets[columns].to_string(index=False))
+        self.status_var.set(f"Detected {len(onsets)} stress onsets")
+    
     def create_timeline_plot(self):
         if not self.current_experiment_id:
             messagebox.showwarning("Warning", "Please select an experiment first")
@@ -2103,6 +2778,16 @@ class AdvancedStressApp:
         else:
             messagebox.showerror("Error", "Failed to create timeline plot")
     
+    def create_environment_plot(self):
+        if not self.current_experiment_id:
+            messagebox.showwarning("Warning", "Please select an experiment first")
+            return
+        
+        if self.analyzer.create_environment_plot(self.current_experiment_id):
+            messagebox.showinfo("Success", "Environment plot created successfully as 'environment_plot.png'")
+        else:
+            messagebox.showerror("Error", "No temperature sensor data available for this experiment")
+    
     def generate_report(self):
         """Generate a report for selected experiment"""
         selected = self.report_exp_combo.get()
@@ -2113,6 +2798,7 @@ class AdvancedStressApp:
         try:
             # Extract experiment ID from selection
             exp_id = int(selected.split('(ID: ')[1].rstrip(')'))
+            self.prepare_analysis(exp_id)
             report_type = self.report_var.get()
             
             # Generate report based on type
@@ -2166,6 +2852,7 @@ class AdvancedStressApp:
         
         try:
             exp_id = int(selected.split('(ID: ')[1].rstrip(')'))
+            self.prepare_analysis(exp_id)
             
             # Create various charts
             self.create_growth_chart(exp_id)
@@ -2195,6 +2882,7 @@ class AdvancedStressApp:
         
         try:
             exp_id = int(selected.split('(ID: ')[1].rstrip(')'))
+            self.prepare_analysis(exp_id)
             
             if self.analyzer.export_experiment_data(exp_id):
                 messagebox.showinfo("Success", "Report exported to Excel successfully!")
@@ -0,0 +1,197 @@
+# maintenance.py - SCHEDULED DATABASE MAINTENANCE AND HEALTH STATISTICS
+import os
+import time
+import sqlite3
+import threading
+
+# Minimum hours between runs of each task
+TASK_INTERVALS = {
+    'optimize': 6,
+    'analyze': 24,
+    'incremental_vacuum': 24,
+    'quick_check': 24 * 7
+}
+
+class MaintenanceScheduler:
+    """Keep query plans fresh and the file compact without anyone remembering to.
+
+    Tasks (PRAGMA optimize, ANALYZE, incremental vacuum and quick_check) run
+    when their interval in TASK_INTERVALS has passed, typically when the GUI
+    has been idle for a while, on a private connection in a background
+    thread. Each run is logged in maintenance_log with its duration and the
+    file size and free-page count before and after, so the app can show how
+    the database is doing.
+    """
+
+    def __init__(self, database, intervals=None, idle_seconds=120):
+        self.db = database
+        self.intervals = dict(TASK_INTERVALS, **(intervals or {}))
+        self.idle_seconds = idle_seconds
+        self.last_activity = time.monotonic()
+        self.current_task = None
+        self._thread = None
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the maintenance log"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS maintenance_log (
+                id INTEGER PRIMARY KEY,
+                task TEXT NOT NULL,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                seconds REAL,
+                result TEXT,
+                file_bytes_before INTEGER,
+                file_bytes_after INTEGER,
+                free_pages_before INTEGER,
+                free_pages_after INTEGER
+            )
+        """)
+        self.db.cursor.execute("CREATE INDEX IF NOT EXISTS idx_maintenance_log_task ON maintenance_log (task, started_at)")
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def database_stats(self, conn=None):
+        """File size, page usage and fragmentation figures"""
+        conn = conn or self.db.connection
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        stats = {
+            'file_bytes': os.path.getsize(self.db.db_file) if os.path.exists(self.db.db_file) else None,
+            'page_size': page_size,
+            'page_count': page_count,
+            'free_pages': free_pages,
+            'free_fraction': free_pages / page_count if page_count else 0.0,
+            'auto_vacuum': ('none', 'full', 'incremental')[conn.execute("PRAGMA auto_vacuum").fetchone()[0]]
+        }
+        try:
+            # Requires SQLite built with the dbstat table; gives unused space inside used pages
+            unused, used = conn.execute(
+                "SELECT SUM(unused), SUM(pgsize) FROM dbstat WHERE aggregate = TRUE").fetchone()
+            stats['unused_fraction'] = unused / used if used else 0.0
+        except sqlite3.Error:
+            stats['unused_fraction'] = None
+        return stats
+
+    def due_tasks(self):
+        """Tasks whose interval has passed since they last ran"""
+        self.create_tables()
+        last = dict(self.db.cursor.execute(
+            "SELECT task, MAX(started_at) FROM maintenance_log GROUP BY task").fetchall())
+        due = []
+        for task, hours in self.intervals.items():
+            if last.get(task) is None:
+                due.append(task)
+                continue
+            age = self.db.cursor.execute(
+                "SELECT (julianday('now') - julianday(?)) * 24", (last[task],)).fetchone()[0]
+            if age >= hours:
+                due.append(task)
+        return due
+
+    def _run_task(self, conn, task):
+        if task == 'optimize':
+            conn.execute("PRAGMA optimize")
+            return 'ok'
+        if task == 'analyze':
+            conn.execute("ANALYZE")
+            return 'ok'
+        if task == 'incremental_vacuum':
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 'skipped: auto_vacuum is not incremental'
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # execute() steps this row-less pragma once, releasing a single page; a script runs it to the end
+            conn.executescript("PRAGMA incremental_vacuum")
+            return f"released {free - conn.execute('PRAGMA freelist_count').fetchone()[0]} pages"
+        if task == 'quick_check':
+            problems = [row[0] for row in conn.execute("PRAGMA quick_check").fetchall()]
+            return 'ok' if problems == ['ok'] else '; '.join(problems[:10])
+        raise ValueError(f"Unknown maintenance task '{task}'")
+
+    def run_tasks(self, tasks=None):
+        """Run tasks (default: those due) on a private connection; returns [(task, seconds, result)]"""
+        self.create_tables()
+        tasks = self.due_tasks() if tasks is None else tasks
+        conn = sqlite3.connect(self.db.db_file, timeout=30)
+        results = []
+        try:
+            for task in tasks:
+                self.current_task = task
+                before = self.database_stats(conn)
+                start = time.perf_counter()
+                try:
+                    result = self._run_task(conn, task)
+                except sqlite3.Error as e:
+                    result = f"error: {e}"
+                seconds = time.perf_counter() - start
+                after = self.database_stats(conn)
+                with conn:
+                    conn.execute("""
+                        INSERT INTO maintenance_log
+                        (task, seconds, result, file_bytes_before, file_bytes_after,
+                         free_pages_before, free_pages_after)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (task, seconds, result, before['file_bytes'], after['file_bytes'],
+                          before['free_pages'], after['free_pages']))
+                results.append((task, seconds, result))
+        finally:
+            self.current_task = None
+            conn.close()
+        return results
+
+    def enable_incremental_vacuum(self):
+        """Switch an existing database to incremental auto-vacuum (rewrites the file once)"""
+        try:
+            self.db.connection.commit()
+            self.db.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            start = time.perf_counter()
+            self.db.cursor.execute("VACUUM")
+            print(f"✅ Incremental vacuum enabled ({time.perf_counter() - start:.1f} s)")
+            return True
+
+        except Exception as e:
+            print(f"❌ Error enabling incremental vacuum: {e}")
+            return False
+
+    def note_activity(self, event=None):
+        """Record user activity; bound to GUI input events"""
+        self.last_activity = time.monotonic()
+
+    def is_idle(self):
+        return time.monotonic() - self.last_activity >= self.idle_seconds
+
+    def start_if_idle(self, on_done=None):
+        """Run due tasks on a background thread if the user is idle; returns True if started"""
+        if self.is_running() or not self.is_idle():
+            return False
+        # Decided here: the app's connection may only be used on the thread that opened it
+        tasks = self.due_tasks()
+        if not tasks:
+            return False
+
+        def run():
+            try:
+                result = self.run_tasks(tasks)
+            except Exception as e:
+                result = e
+            if on_done:
+                on_done(result)
+
+        self._thread = threading.Thread(target=run, name='maintenance', daemon=True)
+        self._thread.start()
+        return True
+
+    def is_running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def get_log(self, limit=20):
+        """Recent maintenance runs"""
+        self.create_tables()
+        return self.db.execute_query("""
+            SELECT task, started_at, seconds, result, file_bytes_before, file_bytes_after,
+                   free_pages_before, free_pages_after
+            FROM maintenance_log ORDER BY id DESC LIMIT ?
+        """, (limit,))
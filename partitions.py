@@ -0,0 +1,228 @@
+# partitions.py - ARCHIVING EXPERIMENTS INTO PER-EXPERIMENT PARTITION FILES
+import os
+import re
+import sqlite3
+
+from database_sqlite import PARTITIONED_TABLES, LOOKUP_COLUMNS, LOOKUP_CODE_COLUMNS, NOW_MS
+
+class PartitionManager:
+    """Move finished experiments out of the main database into their own files.
+
+    Archiving copies an experiment's treatments, plants and measurements,
+    with their change history, into partition_dir/<code>_<id>.db and
+    removes them from the main file. The experiment row itself stays behind
+    with status 'archived' and an entry in experiment_partitions, so the main
+    file doubles as the catalog and experiment ids are never reused; the
+    partitioned tables have AUTOINCREMENT ids, so the archived rows' ids are
+    not handed out again either. Archived experiments are then no longer
+    backed up, vacuumed or scanned with the day-to-day data;
+    StressDatabase.use_experiment() attaches a partition on demand for
+    analyses and reports. Restoring copies the rows back with their original
+    ids and their change history, stamped as updated now so the next delta
+    export carries them again. Derived metrics, validation flags and other
+    per-measurement side tables are not archived; they are rebuilt by their
+    triggers when an experiment is restored.
+    """
+
+    def __init__(self, database, partition_dir='partitions'):
+        self.db = database
+        self.partition_dir = partition_dir
+
+    def _schema(self, names):
+        """CREATE statements for tables (and their indexes) in names, in dependency-safe order"""
+        placeholders = ', '.join('?' * len(names))
+        return [row[0] for row in self.db.cursor.execute(f"""
+            SELECT sql FROM main.sqlite_master
+            WHERE type IN ('table', 'index') AND tbl_name IN ({placeholders}) AND sql IS NOT NULL
+            ORDER BY type = 'index', rowid
+        """, list(names)).fetchall()]
+
+    def _columns(self, schema, table):
+        return [row[1] for row in self.db.cursor.execute(f"PRAGMA {schema}.table_info({table})")]
+
+    def list_partitions(self):
+        """Archived experiments as (experiment_id, code, name, path, measurements, file_bytes, archived_at)"""
+        return self.db.execute_query("""
+            SELECT p.experiment_id, e.experiment_code, e.experiment_name, p.path,
+                   p.measurements, p.file_bytes, p.archived_at
+            FROM experiment_partitions p
+            JOIN experiments e ON e.id = p.experiment_id
+            ORDER BY p.archived_at DESC
+        """)
+
+    def archive_experiment(self, experiment_id):
+        """Move an experiment's rows to its own partition file; returns the file path"""
+        try:
+            if self.db.partition_path(experiment_id):
+                raise ValueError("experiment is already archived")
+            experiment = self.db.cursor.execute(
+                "SELECT experiment_code, status FROM experiments WHERE id = ?", (experiment_id,)).fetchone()
+            if experiment is None:
+                raise ValueError(f"no experiment with id {experiment_id}")
+            code, status = experiment
+            if status == 'deleting':
+                raise ValueError("experiment is being deleted")
+
+            os.makedirs(self.partition_dir, exist_ok=True)
+            safe_code = re.sub(r'[^A-Za-z0-9_.-]+', '_', code)
+            path = os.path.join(self.partition_dir, f"{safe_code}_{experiment_id}.db")
+            if os.path.exists(path):
+                raise FileExistsError(f"{path} already exists")
+
+            # Same table layout as the main file, without triggers: partitions are read-only archives
+            lookups = [lookup for specs in LOOKUP_COLUMNS.values() for _, lookup, _ in specs]
+            tables = ('experiments', *PARTITIONED_TABLES, *lookups, 'change_history')
+            partition = sqlite3.connect(path)
+            try:
+                with partition:
+                    for statement in self._schema(tables):
+                        partition.execute(statement)
+            finally:
+                partition.close()
+
+            self.db.detach_partition()
+            self.db.connection.commit()
+            self.db.cursor.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                counts = self._move_rows(experiment_id, lookups)
+            except Exception:
+                self.db.cursor.execute("DETACH DATABASE archive")
+                os.remove(path)
+                raise
+            self.db.cursor.execute("DETACH DATABASE archive")
+
+            with self.db.connection:
+                self.db.connection.execute("""
+                    INSERT INTO experiment_partitions
+                    (experiment_id, path, previous_status, treatments, measurements, file_bytes)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (experiment_id, path, status, counts['treatments'], counts['measurements'],
+                      os.path.getsize(path)))
+                self.db.connection.execute(
+                    "UPDATE experiments SET status = 'archived' WHERE id = ?", (experiment_id,))
+            print(f"✅ Archived {code}: {counts['measurements']} measurements moved to {path}")
+            return path
+
+        except Exception as e:
+            print(f"❌ Archive error: {e}")
+            return None
+
+    def _move_rows(self, experiment_id, lookups):
+        """Copy the experiment into the attached archive, then delete it from main in one transaction"""
+        conn = self.db.connection
+        conn.execute("DROP TABLE IF EXISTS temp.archive_rows")
+        conn.execute("CREATE TEMP TABLE archive_rows (table_name TEXT, row_id INTEGER, PRIMARY KEY (table_name, row_id))")
+        selections = {
+            'experiments': "SELECT id FROM main.experiments WHERE id = ?",
+            'treatments': "SELECT id FROM main.treatments WHERE experiment_id = ?",
+            'plants': """SELECT p.id FROM main.plants p
+                         JOIN main.treatments t ON p.treatment_id = t.id WHERE t.experiment_id = ?""",
+            'measurements': """SELECT m.id FROM main.measurements m
+                               JOIN main.treatments t ON m.treatment_id = t.id WHERE t.experiment_id = ?"""
+        }
+        counts = {}
+        with conn:
+            # Lookup tables first: experiments and treatments reference them
+            for lookup in lookups:
+                conn.execute(f"INSERT INTO archive.{lookup} SELECT * FROM main.{lookup}")
+            for table, selection in selections.items():
+                conn.execute(f"INSERT INTO temp.archive_rows SELECT '{table}', id FROM ({selection})",
+                             (experiment_id,))
+                columns = ', '.join(self._columns('archive', table))
+                counts[table] = conn.execute(f"""
+                    INSERT INTO archive.{table} ({columns})
+                    SELECT {columns} FROM main.{table}
+                    WHERE id IN (SELECT row_id FROM temp.archive_rows WHERE table_name = '{table}')
+                """).rowcount
+            conn.execute("""
+                INSERT INTO archive.change_history (table_name, row_id, operation, changed_at, old_values)
+                SELECT h.table_name, h.row_id, h.operation, h.changed_at, h.old_values
+                FROM main.change_history h
+                JOIN temp.archive_rows a ON a.table_name = h.table_name AND a.row_id = h.row_id
+                WHERE h.table_name != 'experiments'
+            """)
+
+            # Treatments cascade to plants, measurements and their side tables
+            conn.execute("DELETE FROM main.treatments WHERE experiment_id = ?", (experiment_id,))
+            # Archiving is not deletion: keep it out of the audit trail and delta-export tombstones
+            conn.execute("""
+                DELETE FROM main.change_history WHERE table_name != 'experiments' AND id IN (
+                    SELECT h.id FROM main.change_history h
+                    JOIN temp.archive_rows a ON a.table_name = h.table_name AND a.row_id = h.row_id)
+            """)
+            conn.execute("""
+                DELETE FROM main.deleted_rows WHERE id IN (
+                    SELECT d.id FROM main.deleted_rows d
+                    JOIN temp.archive_rows a ON a.table_name = d.table_name AND a.row_id = d.row_id)
+            """)
+        conn.execute("DROP TABLE temp.archive_rows")
+        return counts
+
+    def restore_experiment(self, experiment_id):
+        """Copy an archived experiment back into the main file and delete its partition; returns counts"""
+        try:
+            path = self.db.partition_path(experiment_id)
+            if path is None:
+                raise ValueError("experiment is not archived")
+            self.db.detach_partition()
+            self.db.connection.commit()
+            self.db.cursor.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                counts = self._restore_rows(experiment_id)
+            finally:
+                self.db.cursor.execute("DETACH DATABASE archive")
+            os.remove(path)
+            print(f"✅ Restored {counts['measurements']} measurements from {path}")
+            return counts
+
+        except Exception as e:
+            print(f"❌ Restore error: {e}")
+            return None
+
+    def _restore_rows(self, experiment_id):
+        """Insert the attached archive's rows and history into main in one transaction"""
+        conn = self.db.connection
+        counts = {}
+        with conn:
+            for table in PARTITIONED_TABLES:
+                # Ids are never reused, so every row goes back under its original id;
+                # lookup codes are re-derived by the insert triggers and updated_at is now
+                main_columns = self._columns('main', table)
+                columns = [c for c in self._columns('archive', table)
+                           if c in main_columns and c != 'updated_at' and c not in LOOKUP_CODE_COLUMNS]
+                targets, values = list(columns), [f"a.{c}" for c in columns]
+                if 'updated_at' in main_columns:
+                    targets.append('updated_at')
+                    values.append(NOW_MS)
+                counts[table] = conn.execute(f"""
+                    INSERT INTO main.{table} ({', '.join(targets)})
+                    SELECT {', '.join(values)} FROM archive.{table} a ORDER BY a.id
+                """).rowcount
+                conn.execute(f"""
+                    INSERT INTO main.change_history (table_name, row_id, operation, changed_at, old_values)
+                    SELECT table_name, row_id, operation, changed_at, old_values
+                    FROM archive.change_history WHERE table_name = '{table}'
+                    ORDER BY id
+                """)
+
+            conn.execute("""
+                UPDATE experiments SET status = COALESCE(
+                    (SELECT previous_status FROM experiment_partitions WHERE experiment_id = ?), 'active')
+                WHERE id = ?
+            """, (experiment_id, experiment_id))
+            conn.execute("DELETE FROM experiment_partitions WHERE experiment_id = ?", (experiment_id,))
+        return counts
+
+    def discard_partition(self, experiment_id):
+        """Delete an archived experiment's partition file (when the experiment itself is deleted)"""
+        path = self.db.partition_path(experiment_id)
+        if path is None:
+            return False
+        if self.db.attached_partition == experiment_id:
+            self.db.detach_partition()
+        with self.db.connection:
+            self.db.connection.execute(
+                "DELETE FROM experiment_partitions WHERE experiment_id = ?", (experiment_id,))
+        if os.path.exists(path):
+            os.remove(path)
+        return True
@@ -0,0 +1,348 @@
+# response_curves.py - BATCH A/Ci AND LIGHT-RESPONSE CURVE FITTING
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Photosynthetic constants at 25 °C (Bernacchi et al. 2001), µmol mol⁻¹ / mmol mol⁻¹
+GAMMA_STAR = 42.75
+KC = 404.9
+KO = 278.4
+OXYGEN = 210.0
+
+def aci_model(ci, params):
+    """Farquhar-von Caemmerer-Berry A/Ci model; params columns are (Vcmax, J, Rd)
+
+    A/Ci curves are measured at saturating light, so the fitted J is
+    reported as Jmax.
+    """
+    vcmax, j, rd = params[:, 0:1], params[:, 1:2], params[:, 2:3]
+    wc = vcmax * (ci - GAMMA_STAR) / (ci + KC * (1.0 + OXYGEN / KO))
+    wj = j * (ci - GAMMA_STAR) / (4.0 * ci + 8.0 * GAMMA_STAR)
+    return np.minimum(wc, wj) - rd
+
+def light_model(par, params):
+    """Non-rectangular hyperbola; params columns are (quantum yield, Amax, theta, Rd)"""
+    phi, amax, theta, rd = (params[:, k:k + 1] for k in range(4))
+    s = phi * par + amax
+    theta = np.clip(theta, 1e-6, 0.999)
+    return (s - np.sqrt(np.maximum(s ** 2 - 4.0 * theta * phi * par * amax, 0.0))) / (2.0 * theta) - rd
+
+CURVE_MODELS = {
+    'aci': {
+        'model': aci_model,
+        'params': ('vcmax', 'jmax', 'rd'),
+        'lower': np.array([1.0, 1.0, 0.0]),
+        'upper': np.array([500.0, 1000.0, 20.0])
+    },
+    'light': {
+        'model': light_model,
+        'params': ('quantum_yield', 'amax', 'theta', 'rd'),
+        'lower': np.array([0.0, 0.0, 0.0, 0.0]),
+        'upper': np.array([0.2, 100.0, 0.999, 20.0])
+    }
+}
+
+def initial_parameters(curve_type, x, y, mask):
+    """Vectorised starting points for a padded batch of curves"""
+    y_masked = np.where(mask, y, np.nan)
+    a_max = np.nanmax(y_masked, axis=1)
+    lowest = np.take_along_axis(y, np.argmin(np.where(mask, x, np.inf), axis=1)[:, None], 1)[:, 0]
+    if curve_type == 'aci':
+        rd = np.full(len(x), 1.0)
+        # Rubisco-limited region: invert Wc on the low-Ci points
+        with np.errstate(divide='ignore', invalid='ignore'):
+            implied = (y + rd[:, None]) * (x + KC * (1 + OXYGEN / KO)) / (x - GAMMA_STAR)
+        low_ci = mask & (x > GAMMA_STAR + 20) & (x < 250)
+        vcmax = np.nanmedian(np.where(low_ci, implied, np.nan), axis=1)
+        vcmax = np.where(np.isfinite(vcmax), vcmax, 60.0)
+        j = 4.0 * (a_max + rd)
+        return np.column_stack([vcmax, j, rd])
+    rd = np.clip(-lowest, 0.1, None)
+    return np.column_stack([np.full(len(x), 0.05), a_max + rd, np.full(len(x), 0.7), rd])
+
+def batched_least_squares(curve_type, x, y, mask, params, iterations=200, tol=1e-9):
+    """Levenberg-Marquardt over a whole batch of padded curves at once
+
+    x, y and mask are (curves x points); params is (curves x parameters).
+    Model evaluation, finite-difference Jacobians and the damped normal
+    equations are all batched, so the cost per iteration is a handful of
+    NumPy calls regardless of the number of curves.
+    """
+    spec = CURVE_MODELS[curve_type]
+    model, lower, upper = spec['model'], spec['lower'], spec['upper']
+    params = np.clip(params, lower, upper)
+    n_params = params.shape[1]
+    damping = np.full(len(params), 1e-2)
+
+    def cost_of(p):
+        residual = np.where(mask, model(x, p) - y, 0.0)
+        return residual, (residual ** 2).sum(axis=1)
+
+    residual, cost = cost_of(params)
+    # A fit that cannot improve on a (near) exact match of the data has converged
+    exact = tol * (np.where(mask, y, 0.0) ** 2).sum(axis=1)
+    converged = np.zeros(len(params), dtype=bool)
+    # Curves whose steps keep failing however hard they are damped; reported as not converged
+    stalled = np.zeros(len(params), dtype=bool)
+    for _ in range(iterations):
+        active = ~converged & ~stalled
+        if not active.any():
+            break
+        step_sizes = 1e-6 * np.maximum(np.abs(params), 1e-3)
+        jac = np.empty(x.shape + (n_params,))
+        for k in range(n_params):
+            shifted = params.copy()
+            shifted[:, k] += step_sizes[:, k]
+            jac[:, :, k] = np.where(mask, (model(x, shifted) - model(x, params)) / step_sizes[:, k:k + 1], 0.0)
+
+        jtj = np.einsum('cnp,cnq->cpq', jac, jac)
+        jtr = np.einsum('cnp,cn->cp', jac, residual)
+        diag = np.einsum('cpp->cp', jtj)
+        system = jtj + (damping[:, None] * np.maximum(diag, 1e-12))[:, :, None] * np.eye(n_params)
+        try:
+            delta = np.linalg.solve(system, -jtr[:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            delta = -np.einsum('cpq,cq->cp', np.linalg.pinv(system), jtr)
+
+        candidate = np.clip(params + delta, lower, upper)
+        new_residual, new_cost = cost_of(candidate)
+        improved = (new_cost < cost) & active
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.where(cost > 0, (cost - new_cost) / cost, 0.0)
+        converged |= improved & (relative < tol)
+        stuck = active & ~improved & (damping > 1e8)
+        converged |= stuck & (cost <= exact)
+        stalled |= stuck & (cost > exact)
+
+        params = np.where(improved[:, None], candidate, params)
+        residual = np.where(improved[:, None], new_residual, residual)
+        cost = np.where(improved, new_cost, cost)
+        damping = np.where(improved, damping / 3.0, damping * 4.0)
+
+    return params, cost, converged
+
+def _fit_batch(curve_type, x, y, mask):
+    """Fit one padded batch; module-level so it can run in a worker process"""
+    start = initial_parameters(curve_type, x, y, mask)
+    return batched_least_squares(curve_type, x, y, mask, start)
+
+class ResponseCurveFitter:
+    """Storage and batched fitting of A/Ci and light-response curves.
+
+    Curves are stored point-by-point in response_curve_points, linked to a
+    measurements row through response_curves. Fitting pads all stale curves
+    of one type into arrays and fits them together (chunks of batch_size run
+    in a process pool); fitted parameters are cached in curve_fits with a
+    signature of the points so unchanged curves are never refitted.
+    """
+
+    def __init__(self, database, max_workers=None, batch_size=2000):
+        self.db = database
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create curve storage and fitted-parameter cache tables"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS response_curves (
+                id INTEGER PRIMARY KEY,
+                measurement_id INTEGER NOT NULL,
+                curve_type TEXT NOT NULL CHECK (curve_type IN ('aci', 'light')),
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (measurement_id) REFERENCES measurements (id) ON DELETE CASCADE
+            )
+        """)
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS response_curve_points (
+                curve_id INTEGER NOT NULL,
+                point_index INTEGER NOT NULL,
+                x_value REAL NOT NULL,
+                assimilation REAL NOT NULL,
+                PRIMARY KEY (curve_id, point_index),
+                FOREIGN KEY (curve_id) REFERENCES response_curves (id) ON DELETE CASCADE
+            )
+        """)
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS curve_fits (
+                curve_id INTEGER PRIMARY KEY,
+                curve_type TEXT NOT NULL,
+                data_signature TEXT NOT NULL,
+                vcmax REAL,
+                jmax REAL,
+                amax REAL,
+                quantum_yield REAL,
+                theta REAL,
+                rd REAL,
+                rss REAL,
+                converged INTEGER,
+                fitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (curve_id) REFERENCES response_curves (id) ON DELETE CASCADE
+            )
+        """)
+        self.db.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_response_curves_measurement
+            ON response_curves (measurement_id)
+        """)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def add_curve(self, measurement_id, curve_type, points, notes=None):
+        """Store one curve given as [(Ci or PAR, A), ...]; returns the curve id"""
+        return self.add_curves([(measurement_id, curve_type, points, notes)])[0]
+
+    def add_curves(self, curves):
+        """Bulk-store many (measurement_id, curve_type, points, notes) curves in one transaction"""
+        try:
+            self.create_tables()
+            curve_ids = []
+            with self.db.connection:
+                for measurement_id, curve_type, points, notes in curves:
+                    if curve_type not in CURVE_MODELS:
+                        raise ValueError(f"Unknown curve type '{curve_type}'")
+                    cursor = self.db.connection.execute(
+                        "INSERT INTO response_curves (measurement_id, curve_type, notes) VALUES (?, ?, ?)",
+                        (measurement_id, curve_type, notes))
+                    curve_id = cursor.lastrowid
+                    self.db.connection.executemany(
+                        "INSERT INTO response_curve_points (curve_id, point_index, x_value, assimilation) "
+                        "VALUES (?, ?, ?, ?)",
+                        [(curve_id, i, float(x), float(a)) for i, (x, a) in enumerate(points)])
+                    curve_ids.append(curve_id)
+            return curve_ids
+
+        except Exception as e:
+            print(f"❌ Error storing response curves: {e}")
+            return None
+
+    def _stale_curves(self, curve_type, experiment_id=None):
+        """Points of curves whose cached fit is missing or out of date"""
+        query = """
+            WITH signatures AS (
+                SELECT p.curve_id,
+                       COUNT(*) || ':' || printf('%.9g', TOTAL(p.x_value)) || ':' ||
+                       printf('%.9g', TOTAL(p.assimilation)) || ':' ||
+                       printf('%.9g', TOTAL(p.x_value * p.assimilation)) AS signature
+                FROM response_curve_points p
+                JOIN response_curves c ON p.curve_id = c.id
+                JOIN measurements m ON c.measurement_id = m.id
+                JOIN treatments t ON m.treatment_id = t.id
+                WHERE c.curve_type = ? AND (? IS NULL OR t.experiment_id = ?)
+                GROUP BY p.curve_id
+            )
+            SELECT s.curve_id, s.signature, p.x_value, p.assimilation
+            FROM signatures s
+            JOIN response_curve_points p ON p.curve_id = s.curve_id
+            LEFT JOIN curve_fits f ON f.curve_id = s.curve_id
+            WHERE f.curve_id IS NULL OR f.data_signature != s.signature
+            ORDER BY s.curve_id, p.point_index
+        """
+        return pd.read_sql_query(query, self.db.connection,
+                                 params=(curve_type, experiment_id, experiment_id))
+
+    @staticmethod
+    def pad_curves(points):
+        """Turn long-format points into padded (curves x max_points) arrays"""
+        curve_ids, first = np.unique(points['curve_id'].to_numpy(), return_index=True)
+        counts = np.diff(np.r_[first, len(points)])
+        width = counts.max()
+        row = np.repeat(np.arange(len(curve_ids)), counts)
+        col = np.arange(len(points)) - np.repeat(first, counts)
+        x = np.zeros((len(curve_ids), width))
+        y = np.zeros_like(x)
+        mask = np.zeros_like(x, dtype=bool)
+        x[row, col] = points['x_value'].to_numpy()
+        y[row, col] = points['assimilation'].to_numpy()
+        mask[row, col] = True
+        return curve_ids, x, y, mask
+
+    def fit_curves(self, curve_type, experiment_id=None):
+        """Fit all stale curves of one type; returns the number of curves fitted"""
+        try:
+            self.create_tables()
+            if curve_type not in CURVE_MODELS:
+                raise ValueError(f"Unknown curve type '{curve_type}'")
+            points = self._stale_curves(curve_type, experiment_id)
+            if points.empty:
+                return 0
+
+            signatures = points.groupby('curve_id')['signature'].first()
+            curve_ids, x, y, mask = self.pad_curves(points)
+            batches = [slice(i, i + self.batch_size) for i in range(0, len(curve_ids), self.batch_size)]
+            jobs = [(curve_type, x[b], y[b], mask[b]) for b in batches]
+
+            if self.max_workers <= 1 or len(jobs) == 1:
+                fitted = [_fit_batch(*job) for job in jobs]
+            else:
+                with ProcessPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+                    fitted = list(pool.map(_fit_batch, *zip(*jobs)))
+            params = np.vstack([f[0] for f in fitted])
+            rss = np.concatenate([f[1] for f in fitted])
+            converged = np.concatenate([f[2] for f in fitted])
+
+            names = CURVE_MODELS[curve_type]['params']
+            rows = []
+            for i, curve_id in enumerate(curve_ids):
+                values = dict(zip(names, params[i]))
+                rows.append((int(curve_id), curve_type, signatures[curve_id],
+                             values.get('vcmax'), values.get('jmax'), values.get('amax'),
+                             values.get('quantum_yield'), values.get('theta'), values.get('rd'),
+                             float(rss[i]), int(converged[i])))
+            with self.db.connection:
+                self.db.connection.executemany("""
+                    INSERT OR REPLACE INTO curve_fits
+                    (curve_id, curve_type, data_signature, vcmax, jmax, amax,
+                     quantum_yield, theta, rd, rss, converged)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+            return len(rows)
+
+        except Exception as e:
+            print(f"Error fitting response curves: {e}")
+            return None
+
+    def curve_parameter_summary(self, experiment_id):
+        """Per-treatment averages of fitted curve parameters (refits stale curves first)"""
+        try:
+            for curve_type in CURVE_MODELS:
+                self.fit_curves(curve_type, experiment_id)
+            query = """
+                SELECT t.treatment_name, t.treatment_type_id, t.stress_level_id,
+                       AVG(f.vcmax) as avg_vcmax,
+                       AVG(f.jmax) as avg_jmax,
+                       AVG(CASE WHEN f.curve_type = 'aci' THEN f.rd END) as avg_rd_aci,
+                       AVG(f.amax) as avg_amax,
+                       AVG(f.quantum_yield) as avg_quantum_yield,
+                       SUM(f.curve_type = 'aci') as aci_curves,
+                       SUM(f.curve_type = 'light') as light_curves
+                FROM treatments t
+                JOIN measurements m ON m.treatment_id = t.id
+                JOIN response_curves c ON c.measurement_id = m.id
+                JOIN curve_fits f ON f.curve_id = c.id
+                WHERE t.experiment_id = ?
+                GROUP BY t.id
+                ORDER BY t.id
+            """
+            results = self.db.execute_query(query, (experiment_id,))
+            if results:
+                df = pd.DataFrame(results, columns=[
+                    'treatment_name', 'treatment_type', 'stress_level', 'avg_vcmax', 'avg_jmax',
+                    'avg_rd', 'avg_amax', 'avg_quantum_yield', 'aci_curves', 'light_curves'
+                ])
+                # Decode the lookup codes through the cached id -> name maps
+                for column, lookup in (('treatment_type', 'treatment_types'), ('stress_level', 'stress_levels')):
+                    df[column] = df[column].map(self.db.lookup_names(lookup, df[column].dropna().tolist()))
+                # Sort on the decoded names so reports keep their alphabetical order
+                df = df.sort_values(['treatment_type', 'stress_level'], kind='mergesort',
+                                    na_position='first', ignore_index=True)
+                return df.round(3)
+            return None
+
+        except Exception as e:
+            print(f"Error in curve parameter summary: {e}")
+            return None
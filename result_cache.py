@@ -0,0 +1,222 @@
+# result_cache.py - PERSISTENT CACHE OF ANALYSIS RESULTS KEYED BY EXPERIMENT DATA VERSION
+import json
+import time
+import functools
+
+import pandas as pd
+
+def cached_analysis(name):
+    """Serve a StressAnalyzer method from analyzer.results while its experiment is unchanged"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(analyzer, experiment_id, *args, **kwargs):
+            return analyzer.results.get_or_compute(
+                name, experiment_id, {'args': list(args), 'kwargs': kwargs},
+                lambda: method(analyzer, experiment_id, *args, **kwargs), source=analyzer.db)
+        return wrapper
+    return decorate
+
+def _encode_axis(axis):
+    if isinstance(axis, pd.RangeIndex) and axis.start == 0 and axis.step == 1:
+        return {'range': len(axis)}
+    return {'values': axis.tolist(), 'names': list(axis.names), 'dtype': str(axis.dtype)}
+
+def _decode_axis(stored):
+    if 'range' in stored:
+        return pd.RangeIndex(stored['range'])
+    if len(stored['names']) > 1:
+        return pd.MultiIndex.from_tuples([tuple(value) for value in stored['values']], names=stored['names'])
+    return pd.Index(stored['values'], name=stored['names'][0]).astype(stored['dtype'])
+
+def encode_result(result):
+    """JSON text for a result, or None if it is not a DataFrame or a plain JSON value
+
+    Results live in plant_stress.db, which is exchanged between labs, so
+    they are stored as data only: reading someone else's cache must never
+    execute code, as unpickling would.
+    """
+    try:
+        if isinstance(result, pd.DataFrame):
+            # Python's float repr round-trips exactly; dtypes restore dates and integer columns
+            return json.dumps({'frame': {
+                'index': _encode_axis(result.index),
+                'columns': _encode_axis(result.columns),
+                'dtypes': [str(dtype) for dtype in result.dtypes],
+                'data': result.values.tolist() if result.shape[1] else [[] for _ in range(len(result))]
+            }}, default=str)
+        return json.dumps({'value': result})
+    except (TypeError, ValueError):
+        return None
+
+def decode_result(text):
+    """Result stored by encode_result"""
+    stored = json.loads(text)
+    if 'frame' not in stored:
+        return stored['value']
+    frame = stored['frame']
+    df = pd.DataFrame(frame['data'], columns=range(len(frame['dtypes'])))
+    df = df.astype(dict(enumerate(frame['dtypes'])))
+    df.index = _decode_axis(frame['index'])
+    df.columns = _decode_axis(frame['columns'])
+    return df
+
+class AnalysisResultCache:
+    """Keep computed analysis results in the database so unchanged experiments are not recomputed.
+
+    Each result is stored as JSON (see encode_result) under (experiment,
+    analysis name, parameters) together with the experiment's data version
+    (see StressDatabase.install_data_version_triggers) at the time it was
+    computed. A lookup is a hit only when that version is still current, so
+    any write to the experiment's treatments, plants or measurements makes
+    its cached results stale without explicit invalidation. Stored results
+    are limited to max_bytes in total and evicted least recently used first;
+    hits, misses and evictions are counted per analysis. Results are read
+    back from the database this cache was created with, but versioned by the
+    database the analysis ran on, so snapshot results are cached correctly.
+    """
+
+    def __init__(self, database, max_bytes=64 * 1024 * 1024):
+        self.db = database
+        self.max_bytes = max_bytes
+        self.enabled = True
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the result and statistics tables"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_results (
+                id INTEGER PRIMARY KEY,
+                experiment_id INTEGER NOT NULL REFERENCES experiments (id) ON DELETE CASCADE,
+                analysis TEXT NOT NULL,
+                params TEXT NOT NULL,
+                data_version INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                compute_seconds REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at REAL NOT NULL,
+                UNIQUE (experiment_id, analysis, params)
+            )
+        """)
+        self.db.cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_results_used ON analysis_results (last_used_at)")
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache_stats (
+                analysis TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0,
+                evictions INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def _count(self, analysis, counter, n=1):
+        self.db.cursor.execute(f"""
+            INSERT INTO analysis_cache_stats (analysis, {counter}) VALUES (?, ?)
+            ON CONFLICT (analysis) DO UPDATE SET {counter} = {counter} + excluded.{counter}
+        """, (analysis, n))
+
+    def get_or_compute(self, analysis, experiment_id, params, compute, source=None):
+        """Cached result of compute() for this experiment version, computing and storing it on a miss
+
+        source is the database the analysis reads (the live file or a
+        snapshot); its data version decides whether a stored result is current.
+        """
+        if not self.enabled:
+            return compute()
+        try:
+            self.create_tables()
+            experiment_id = int(experiment_id)
+            key = json.dumps(params, sort_keys=True, default=str)
+            version = (source or self.db).data_version(experiment_id)
+            row = self.db.cursor.execute("""
+                SELECT id, data_version, result FROM analysis_results
+                WHERE experiment_id = ? AND analysis = ? AND params = ?
+            """, (experiment_id, analysis, key)).fetchone()
+            if row is not None and row[1] == version:
+                result = decode_result(row[2])
+                self.db.cursor.execute("UPDATE analysis_results SET last_used_at = ? WHERE id = ?",
+                                       (time.time(), row[0]))
+                self._count(analysis, 'hits')
+                self.db.connection.commit()
+                return result
+        except Exception as e:
+            self.db.connection.rollback()
+            print(f"❌ Analysis cache error: {e}")
+            return compute()
+
+        start = time.perf_counter()
+        result = compute()
+        seconds = time.perf_counter() - start
+        try:
+            self._count(analysis, 'misses')
+            # Failed or empty analyses return None; they are retried next time
+            if result is not None:
+                self._store(analysis, experiment_id, key, version, result, seconds)
+            self.db.connection.commit()
+        except Exception as e:
+            self.db.connection.rollback()
+            print(f"❌ Analysis cache error: {e}")
+        return result
+
+    def _store(self, analysis, experiment_id, key, version, result, seconds):
+        text = encode_result(result)
+        # Results JSON cannot hold are returned but not stored
+        if text is None or len(text.encode()) > self.max_bytes:
+            return
+        # One entry per key: a result for an older version can never be a hit again
+        self.db.cursor.execute("""
+            INSERT INTO analysis_results
+            (experiment_id, analysis, params, data_version, result, size_bytes, compute_seconds, last_used_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (experiment_id, analysis, params) DO UPDATE SET
+                data_version = excluded.data_version, result = excluded.result,
+                size_bytes = excluded.size_bytes, compute_seconds = excluded.compute_seconds,
+                created_at = CURRENT_TIMESTAMP, last_used_at = excluded.last_used_at
+        """, (experiment_id, analysis, key, version, text, len(text.encode()), seconds, time.time()))
+        self._evict()
+
+    def _evict(self, max_bytes=None):
+        """Drop least recently used results until they fit in max_bytes; returns the number dropped"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        total = self.db.cursor.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM analysis_results").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        victims = []
+        for row_id, analysis, size in self.db.cursor.execute(
+                "SELECT id, analysis, size_bytes FROM analysis_results ORDER BY last_used_at").fetchall():
+            if total <= max_bytes:
+                break
+            victims.append((row_id, analysis))
+            total -= size
+        self.db.cursor.executemany("DELETE FROM analysis_results WHERE id = ?", [(row_id,) for row_id, _ in victims])
+        for analysis in {analysis for _, analysis in victims}:
+            self._count(analysis, 'evictions', sum(1 for _, name in victims if name == analysis))
+        return len(victims)
+
+    def clear(self, experiment_id=None):
+        """Delete stored results (for one experiment, or all); statistics are kept"""
+        self.create_tables()
+        if experiment_id is None:
+            self.db.cursor.execute("DELETE FROM analysis_results")
+        else:
+            self.db.cursor.execute("DELETE FROM analysis_results WHERE experiment_id = ?", (int(experiment_id),))
+        self.db.connection.commit()
+
+    def stats(self):
+        """Per-analysis hits, misses, evictions, hit rate, stored entries and bytes"""
+        self.create_tables()
+        rows = self.db.cursor.execute("""
+            SELECT s.analysis, s.hits, s.misses, s.evictions,
+                   COUNT(r.id), COALESCE(SUM(r.size_bytes), 0)
+            FROM analysis_cache_stats s
+            LEFT JOIN analysis_results r ON r.analysis = s.analysis
+            GROUP BY s.analysis
+            ORDER BY s.analysis
+        """).fetchall()
+        return {analysis: {'hits': hits, 'misses': misses, 'evictions': evictions,
+                           'hit_rate': hits / (hits + misses) if hits + misses else None,
+                           'entries': entries, 'bytes': size}
+                for analysis, hits, misses, evictions, entries, size in rows}
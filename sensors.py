@@ -0,0 +1,357 @@
+# sensors.py - ENVIRONMENTAL SENSOR TIME-SERIES STORE WITH AS-OF JOINS
+import numpy as np
+import pandas as pd
+
+SENSOR_VARIABLES = ('temperature', 'humidity', 'soil_moisture', 'par', 'vpd')
+
+# Downsampling pyramid levels: (name, bucket seconds, alignment offset)
+# Weeks are aligned to Monday 1970-01-05 rather than the Thursday epoch.
+PYRAMID_LEVELS = (
+    ('hour', 3600, 0),
+    ('day', 86400, 0),
+    ('week', 604800, 345600)
+)
+
+def to_epoch_seconds(values):
+    """Convert dates/datetimes/strings (or epoch seconds) to int64 UNIX seconds"""
+    array = np.asarray(values)
+    if np.issubdtype(array.dtype, np.integer):
+        return array.astype(np.int64)
+    return pd.to_datetime(array).values.astype('datetime64[s]').astype(np.int64)
+
+class SensorStore:
+    """Compact store for minute-level logger data, chunked into array BLOBs.
+
+    Each series (one variable from one logger, attached to a treatment or to
+    a whole experiment) is split into fixed-length time chunks. A chunk row
+    holds int32 second offsets from the chunk start and float32 values as
+    raw BLOBs, so a day of minute data is ~11 KB in one row instead of 1440
+    rows. Measurements are joined to the series with prefix sums and
+    searchsorted, giving window averages and as-of values for every
+    measurement of a series in one vectorised pass.
+
+    Every ingest also refreshes hourly/daily/weekly min/max/mean buckets in
+    sensor_pyramid for the time range it touched, so long spans can be
+    queried and plotted at a resolution matching the output width.
+    """
+
+    def __init__(self, database, chunk_seconds=86400):
+        self.db = database
+        self.chunk_seconds = chunk_seconds
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the series catalogue and chunk tables"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sensor_series (
+                id INTEGER PRIMARY KEY,
+                experiment_id INTEGER NOT NULL,
+                treatment_id INTEGER,
+                variable TEXT NOT NULL,
+                unit TEXT,
+                logger_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (experiment_id) REFERENCES experiments (id) ON DELETE CASCADE,
+                FOREIGN KEY (treatment_id) REFERENCES treatments (id) ON DELETE CASCADE,
+                UNIQUE(experiment_id, treatment_id, variable, logger_id)
+            )
+        """)
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sensor_chunks (
+                series_id INTEGER NOT NULL,
+                chunk_start INTEGER NOT NULL,
+                chunk_end INTEGER NOT NULL,
+                n_points INTEGER NOT NULL,
+                offsets BLOB NOT NULL,
+                vals BLOB NOT NULL,
+                PRIMARY KEY (series_id, chunk_start),
+                FOREIGN KEY (series_id) REFERENCES sensor_series (id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        """)
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sensor_pyramid (
+                series_id INTEGER NOT NULL,
+                level TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                n_points INTEGER NOT NULL,
+                min_value REAL,
+                max_value REAL,
+                sum_value REAL,
+                PRIMARY KEY (series_id, level, bucket_start),
+                FOREIGN KEY (series_id) REFERENCES sensor_series (id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        """)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def get_or_create_series(self, experiment_id, variable, treatment_id=None, logger_id=None, unit=None):
+        """Return the id of a series, creating it if needed"""
+        self.create_tables()
+        existing = self.db.execute_query("""
+            SELECT id FROM sensor_series
+            WHERE experiment_id = ? AND treatment_id IS ? AND variable = ? AND logger_id IS ?
+        """, (experiment_id, treatment_id, variable, logger_id))
+        if existing:
+            return existing[0][0]
+        cursor = self.db.connection.execute("""
+            INSERT INTO sensor_series (experiment_id, treatment_id, variable, unit, logger_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (experiment_id, treatment_id, variable, unit, logger_id))
+        self.db.connection.commit()
+        return cursor.lastrowid
+
+    def _read_chunks(self, series_id, start=None, end=None):
+        """Concatenated (timestamps, values) for chunks overlapping [start, end)"""
+        rows = self.db.execute_query("""
+            SELECT chunk_start, offsets, vals FROM sensor_chunks
+            WHERE series_id = ? AND chunk_end >= ? AND chunk_start < ?
+            ORDER BY chunk_start
+        """, (series_id, start if start is not None else -2 ** 62,
+              end if end is not None else 2 ** 62)) or []
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        times = np.concatenate([chunk_start + np.frombuffer(offsets, dtype=np.int32).astype(np.int64)
+                                for chunk_start, offsets, _ in rows])
+        values = np.concatenate([np.frombuffer(vals, dtype=np.float32) for _, _, vals in rows])
+        return times, values.astype(np.float64)
+
+    def ingest(self, series_id, timestamps, values):
+        """Bulk-insert readings; overlapping chunks are merged (later readings win)"""
+        try:
+            self.create_tables()
+            times = to_epoch_seconds(timestamps)
+            values = np.asarray(values, dtype=np.float64)
+            keep = ~np.isnan(values)
+            times, values = times[keep], values[keep]
+            if len(times) == 0:
+                return 0
+
+            chunk_ids = times // self.chunk_seconds
+            affected = np.unique(chunk_ids)
+            first = int(affected[0]) * self.chunk_seconds
+            last = (int(affected[-1]) + 1) * self.chunk_seconds
+            old_times, old_values = self._read_chunks(series_id, first, last)
+            old_keep = np.isin(old_times // self.chunk_seconds, affected)
+
+            # New readings first so a stable unique keeps them over stored duplicates
+            all_times = np.concatenate([times, old_times[old_keep]])
+            all_values = np.concatenate([values, old_values[old_keep]])
+            order = np.argsort(all_times, kind='stable')
+            all_times, all_values = all_times[order], all_values[order]
+            unique_times, first_index = np.unique(all_times, return_index=True)
+            all_values = all_values[first_index]
+
+            chunk_ids = unique_times // self.chunk_seconds
+            bounds = np.flatnonzero(np.r_[True, chunk_ids[1:] != chunk_ids[:-1], True])
+            rows = []
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                chunk_start = int(chunk_ids[lo] * self.chunk_seconds)
+                rows.append((series_id, chunk_start, int(unique_times[hi - 1]), int(hi - lo),
+                             (unique_times[lo:hi] - chunk_start).astype(np.int32).tobytes(),
+                             all_values[lo:hi].astype(np.float32).tobytes()))
+            with self.db.connection:
+                self.db.connection.executemany("""
+                    INSERT OR REPLACE INTO sensor_chunks
+                    (series_id, chunk_start, chunk_end, n_points, offsets, vals)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, rows)
+            self.update_pyramid(series_id, int(unique_times[0]), int(unique_times[-1]))
+            return len(times)
+
+        except Exception as e:
+            print(f"❌ Sensor ingest error: {e}")
+            return None
+
+    @staticmethod
+    def bucket_starts(times, size, offset):
+        """Start of the pyramid bucket containing each timestamp"""
+        return (times - offset) // size * size + offset
+
+    def update_pyramid(self, series_id, first, last):
+        """Recompute every pyramid bucket overlapping [first, last] from raw readings"""
+        # Widen to whole coarsest buckets so each level is rebuilt from complete data
+        _, size, offset = PYRAMID_LEVELS[-1]
+        start = int(self.bucket_starts(np.array([first]), size, offset)[0])
+        end = int(self.bucket_starts(np.array([last]), size, offset)[0]) + size
+        times, values = self._read_chunks(series_id, start, end)
+        keep = (times >= start) & (times < end)
+        times, values = times[keep], values[keep]
+
+        rows = []
+        for level, size, offset in PYRAMID_LEVELS:
+            if len(times) == 0:
+                break
+            buckets = self.bucket_starts(times, size, offset)
+            bounds = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            counts = np.diff(np.r_[bounds, len(times)])
+            mins = np.minimum.reduceat(values, bounds)
+            maxs = np.maximum.reduceat(values, bounds)
+            sums = np.add.reduceat(values, bounds)
+            rows.extend(zip([series_id] * len(bounds), [level] * len(bounds),
+                            buckets[bounds].tolist(), counts.tolist(),
+                            mins.tolist(), maxs.tolist(), sums.tolist()))
+        with self.db.connection:
+            self.db.connection.execute("""
+                DELETE FROM sensor_pyramid
+                WHERE series_id = ? AND bucket_start >= ? AND bucket_start < ?
+            """, (series_id, start, end))
+            self.db.connection.executemany("""
+                INSERT INTO sensor_pyramid
+                (series_id, level, bucket_start, n_points, min_value, max_value, sum_value)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def rebuild_pyramid(self, series_id):
+        """Rebuild all pyramid levels of a series (e.g. for data stored before pyramids existed)"""
+        self.create_tables()
+        result = self.db.execute_query(
+            "SELECT MIN(chunk_start), MAX(chunk_end) FROM sensor_chunks WHERE series_id = ?", (series_id,))
+        if result and result[0][0] is not None:
+            self.update_pyramid(series_id, result[0][0], result[0][1])
+
+    def choose_level(self, series_id, start, end, max_points):
+        """Finest resolution ('raw' or a pyramid level) with at most max_points points in [start, end)"""
+        result = self.db.execute_query("""
+            SELECT COALESCE(SUM(n_points), 0) FROM sensor_chunks
+            WHERE series_id = ? AND chunk_end >= ? AND chunk_start < ?
+        """, (series_id, start, end))
+        if result and result[0][0] <= max_points:
+            return 'raw'
+        for level, size, _ in PYRAMID_LEVELS:
+            if (end - start) / size <= max_points:
+                return level
+        return PYRAMID_LEVELS[-1][0]
+
+    def query_series(self, series_id, start=None, end=None, pixel_width=1000, level=None):
+        """Readings for plotting: raw or pyramid buckets sized to the pixel width
+
+        Returns timestamp, mean, min, max and n columns; with min/max drawn per
+        bucket a line plot needs about two points per pixel, so the level is
+        chosen to keep at most 2 * pixel_width rows.
+        """
+        try:
+            self.create_tables()
+            if start is None or end is None:
+                bounds = self.db.execute_query(
+                    "SELECT MIN(chunk_start), MAX(chunk_end) FROM sensor_chunks WHERE series_id = ?",
+                    (series_id,))
+                if not bounds or bounds[0][0] is None:
+                    return None
+            start_s = int(to_epoch_seconds([start])[0]) if start is not None else bounds[0][0]
+            end_s = int(to_epoch_seconds([end])[0]) if end is not None else bounds[0][1] + 1
+            level = level or self.choose_level(series_id, start_s, end_s, 2 * pixel_width)
+
+            if level == 'raw':
+                raw = self.load_series(series_id, pd.to_datetime(start_s, unit='s'),
+                                       pd.to_datetime(end_s, unit='s'))
+                df = pd.DataFrame({'timestamp': raw['timestamp'], 'mean': raw['value'],
+                                   'min': raw['value'], 'max': raw['value'], 'n': 1})
+            else:
+                df = pd.read_sql_query("""
+                    SELECT bucket_start, sum_value / n_points AS mean, min_value AS min,
+                           max_value AS max, n_points AS n
+                    FROM sensor_pyramid
+                    WHERE series_id = ? AND level = ? AND bucket_start >= ? AND bucket_start < ?
+                    ORDER BY bucket_start
+                """, self.db.connection, params=(series_id, level, start_s, end_s))
+                df.insert(0, 'timestamp', pd.to_datetime(df.pop('bucket_start'), unit='s'))
+            df.attrs['level'] = level
+            return df
+
+        except Exception as e:
+            print(f"Error querying sensor series: {e}")
+            return None
+
+    def ingest_csv(self, path, series_id, time_column='timestamp', value_column='value', chunksize=500000):
+        """Stream a logger CSV export into a series in bounded-size pieces"""
+        total = 0
+        for piece in pd.read_csv(path, usecols=[time_column, value_column], chunksize=chunksize):
+            inserted = self.ingest(series_id, piece[time_column].to_numpy(), piece[value_column].to_numpy())
+            if inserted is None:
+                return None
+            total += inserted
+        return total
+
+    def load_series(self, series_id, start=None, end=None):
+        """Readings of one series between start and end as a DataFrame"""
+        start_s = int(to_epoch_seconds([start])[0]) if start is not None else None
+        end_s = int(to_epoch_seconds([end])[0]) if end is not None else None
+        times, values = self._read_chunks(series_id, start_s, end_s)
+        keep = np.ones(len(times), dtype=bool)
+        if start_s is not None:
+            keep &= times >= start_s
+        if end_s is not None:
+            keep &= times < end_s
+        return pd.DataFrame({'timestamp': pd.to_datetime(times[keep], unit='s'), 'value': values[keep]})
+
+    def attach_to_measurements(self, experiment_id, variables=None, window_hours=24,
+                               anchor_hour=12, asof_tolerance_hours=6):
+        """Window averages and as-of values of each sensor variable for every measurement
+
+        A measurement is anchored at anchor_hour on its measurement_date. For
+        each variable it gets the mean and count of readings in the
+        window_hours before the anchor and the last reading at or before the
+        anchor (if within the tolerance). Treatment-level series are used when
+        present, otherwise the experiment-wide series.
+        """
+        try:
+            self.create_tables()
+            measurements = pd.read_sql_query("""
+                SELECT m.id AS measurement_id, m.treatment_id, m.measurement_date
+                FROM measurements m
+                JOIN treatments t ON m.treatment_id = t.id
+                WHERE t.experiment_id = ?
+            """, self.db.connection, params=(experiment_id,))
+            if measurements.empty:
+                return None
+            series = pd.read_sql_query("""
+                SELECT id, treatment_id, variable FROM sensor_series WHERE experiment_id = ?
+            """, self.db.connection, params=(experiment_id,))
+            variables = list(variables or series['variable'].unique())
+
+            anchors = to_epoch_seconds(measurements['measurement_date']) + anchor_hour * 3600
+            window = int(window_hours * 3600)
+            tolerance = int(asof_tolerance_hours * 3600)
+            result = measurements.copy()
+
+            for variable in variables:
+                mean = np.full(len(result), np.nan)
+                count = np.zeros(len(result), dtype=np.int64)
+                asof = np.full(len(result), np.nan)
+                candidates = series[series['variable'] == variable]
+                by_treatment = dict(zip(candidates['treatment_id'], candidates['id']))
+                shared = candidates.loc[candidates['treatment_id'].isna(), 'id']
+                fallback = int(shared.iloc[0]) if not shared.empty else None
+
+                series_for_row = result['treatment_id'].map(by_treatment)
+                if fallback is not None:
+                    series_for_row = series_for_row.fillna(fallback)
+
+                for series_id, rows in series_for_row.dropna().groupby(series_for_row.dropna()).groups.items():
+                    idx = result.index.get_indexer(rows)
+                    row_anchors = anchors[idx]
+                    times, values = self._read_chunks(int(series_id), int(row_anchors.min()) - max(window, tolerance),
+                                                      int(row_anchors.max()) + 1)
+                    if len(times) == 0:
+                        continue
+                    prefix = np.r_[0.0, np.cumsum(values)]
+                    lo = np.searchsorted(times, row_anchors - window, side='left')
+                    hi = np.searchsorted(times, row_anchors, side='right')
+                    n = hi - lo
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        mean[idx] = np.where(n > 0, (prefix[hi] - prefix[lo]) / n, np.nan)
+                    count[idx] = n
+                    last = hi - 1
+                    valid = (last >= 0) & (row_anchors - times[np.maximum(last, 0)] <= tolerance)
+                    asof[idx] = np.where(valid, values[np.maximum(last, 0)], np.nan)
+
+                result[f'{variable}_mean'] = np.round(mean, 3)
+                result[f'{variable}_n'] = count
+                result[f'{variable}_asof'] = np.round(asof, 3)
+            return result
+
+        except Exception as e:
+            print(f"Error attaching sensor data: {e}")
+            return None
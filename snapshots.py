@@ -0,0 +1,199 @@
+# snapshots.py - IN-MEMORY ANALYSIS SNAPSHOTS OF ONE EXPERIMENT OR THE WHOLE DATABASE
+import time
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime
+
+from database_sqlite import StressDatabase, CHANGE_TRACKED_TABLES
+
+# Bookkeeping tables analyses never read; an experiment snapshot gets them empty
+SNAPSHOT_SKIP_TABLES = (
+    'change_history', 'deleted_rows', 'export_watermarks', 'backup_history', 'maintenance_log',
+    'deletion_jobs', 'database_merges', 'experiment_partitions', 'derived_metric_queue', 'validation_group_queue',
+    'analysis_results', 'analysis_cache_stats'
+)
+
+def available_memory_bytes():
+    """MemAvailable from /proc/meminfo, or None where the OS does not report it"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+class AnalysisSnapshot(StressDatabase):
+    """A read-mostly, in-memory copy of the database that analyses can use in place of it.
+
+    It is a StressDatabase whose connection is an in-memory SQLite database,
+    so every analysis subsystem works on it unchanged. Its contents are fixed
+    at the moment it was taken; writes (e.g. cached fits) stay in memory.
+    """
+
+    def __init__(self, source_file, connection, experiment_id=None, version=None):
+        super().__init__()
+        self.db_file = source_file
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.experiment_id = experiment_id
+        self.version = version
+        self.taken_at = datetime.now()
+        self.released = False
+
+    def size_bytes(self):
+        page_size = self.cursor.execute("PRAGMA page_size").fetchone()[0]
+        return page_size * self.cursor.execute("PRAGMA page_count").fetchone()[0]
+
+    def use_experiment(self, experiment_id):
+        # An experiment snapshot already holds its rows, wherever they were stored
+        return False
+
+    def close_connection(self):
+        if self.connection and not self.released:
+            self.connection.close()
+            self.released = True
+
+class SnapshotManager:
+    """Take, reuse and release in-memory snapshots for StressAnalyzer.
+
+    load(experiment_id) copies just that experiment (its rows in every table
+    that reaches it through foreign keys, plus small shared tables) in one
+    read transaction, from its partition file if it is archived (taking the
+    experiment's data version from the main file); load(None)
+    copies the whole file with the backup API. Snapshots are reused until the
+    source data changes and are dropped least recently used first when they
+    exceed max_bytes together, or when the machine's available memory falls
+    below min_available_bytes.
+    """
+
+    def __init__(self, database, max_bytes=512 * 1024 * 1024, min_available_bytes=256 * 1024 * 1024):
+        self.db = database
+        self.max_bytes = max_bytes
+        self.min_available_bytes = min_available_bytes
+        self.snapshots = OrderedDict()
+
+    def source_version(self, experiment_id=None):
+        """Changes whenever data a snapshot could contain has changed"""
+        path = self.db.partition_path(experiment_id) if experiment_id is not None else None
+        if path:
+            # Partitions are read-only until restored
+            return ('partition', path)
+        version = [self.db.cursor.execute(f"SELECT MAX(updated_at) FROM main.{table}").fetchone()[0]
+                   for table in CHANGE_TRACKED_TABLES]
+        version.append(self.db.cursor.execute("SELECT MAX(id) FROM main.deleted_rows").fetchone()[0])
+        return tuple(version)
+
+    def load(self, experiment_id=None):
+        """A current snapshot of one experiment (or the whole database), reusing a cached one"""
+        self.db.connection.commit()
+        version = self.source_version(experiment_id)
+        snapshot = self.snapshots.get(experiment_id)
+        if snapshot is not None and snapshot.version == version and not snapshot.released:
+            self.snapshots.move_to_end(experiment_id)
+            return snapshot
+        if snapshot is not None:
+            self.release(experiment_id)
+
+        start = time.perf_counter()
+        memory = sqlite3.connect(':memory:')
+        if experiment_id is None:
+            self.db.connection.backup(memory)
+        else:
+            partition = self.db.partition_path(experiment_id)
+            self._copy_experiment(memory, partition or self.db.db_file, experiment_id)
+            if partition:
+                self._copy_data_version(memory, experiment_id)
+        snapshot = AnalysisSnapshot(self.db.db_file, memory, experiment_id, version)
+        self.snapshots[experiment_id] = snapshot
+        label = 'database' if experiment_id is None else f"experiment {experiment_id}"
+        print(f"✅ Snapshot of {label} loaded into memory "
+              f"({snapshot.size_bytes() / 1e6:.1f} MB, {time.perf_counter() - start:.2f} s)")
+        self.release_if_pressured(keep=(experiment_id,))
+        return snapshot
+
+    def _copy_experiment(self, memory, path, experiment_id):
+        """Copy schema and the experiment's rows from path into memory in one read transaction"""
+        memory.execute("ATTACH DATABASE ? AS source", (path,))
+        try:
+            objects = memory.execute("""
+                SELECT type, name, sql FROM source.sqlite_master
+                WHERE type IN ('table', 'index', 'view') AND sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+                ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END, rowid
+            """).fetchall()
+            tables = [name for kind, name, _ in objects if kind == 'table']
+            foreign_keys = {table: [(row[2], row[3], row[4] or 'id') for row in
+                                    memory.execute(f"PRAGMA source.foreign_key_list({table})")]
+                            for table in tables}
+
+            with memory:
+                for _, _, sql in objects:
+                    memory.execute(sql)
+
+                # Tables reach the experiment through foreign keys; walk them parents first
+                scoped = {'experiments'}
+                memory.execute("INSERT INTO main.experiments SELECT * FROM source.experiments WHERE id = ?",
+                               (experiment_id,))
+                pending = [t for t in tables if t != 'experiments' and t not in SNAPSHOT_SKIP_TABLES]
+                while pending:
+                    progressed = False
+                    for table in list(pending):
+                        parents = [fk for fk in foreign_keys[table]
+                                   if fk[0] != table and (fk[0] in scoped or fk[0] in pending)]
+                        if any(parent in pending for parent, _, _ in parents):
+                            continue
+                        if parents:
+                            # Every scoped reference must be empty or in the snapshot, and one must be set
+                            inside = ' AND '.join(
+                                f"(s.{column} IS NULL OR s.{column} IN (SELECT {target} FROM main.{parent}))"
+                                for parent, column, target in parents)
+                            any_set = ' OR '.join(f"s.{column} IS NOT NULL" for _, column, _ in parents)
+                            memory.execute(f"INSERT INTO main.{table} SELECT s.* FROM source.{table} s "
+                                           f"WHERE {inside} AND ({any_set})")
+                            scoped.add(table)
+                        else:
+                            memory.execute(f"INSERT INTO main.{table} SELECT * FROM source.{table}")
+                        pending.remove(table)
+                        progressed = True
+                    if not progressed:
+                        raise ValueError(f"circular foreign keys between {', '.join(pending)}")
+        finally:
+            memory.execute("DETACH DATABASE source")
+
+    def _copy_data_version(self, memory, experiment_id):
+        """Give a snapshot taken from a partition the experiment's data version from the main file"""
+        # Partition files hold no experiment_data_versions; the version is frozen there while archived
+        schema = self.db.cursor.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'experiment_data_versions'").fetchone()
+        with memory:
+            memory.execute(schema[0])
+            memory.execute("INSERT INTO experiment_data_versions (experiment_id, version) VALUES (?, ?)",
+                           (experiment_id, self.db.data_version(experiment_id)))
+
+    def total_bytes(self):
+        return sum(snapshot.size_bytes() for snapshot in self.snapshots.values())
+
+    def release(self, experiment_id=None):
+        """Drop one snapshot and free its memory"""
+        snapshot = self.snapshots.pop(experiment_id, None)
+        if snapshot is not None:
+            snapshot.close_connection()
+        return snapshot
+
+    def release_all(self):
+        for key in list(self.snapshots):
+            self.release(key)
+
+    def release_if_pressured(self, keep=()):
+        """Drop least recently used snapshots while over budget or short of memory; returns those dropped"""
+        released = []
+        for key in list(self.snapshots):
+            available = available_memory_bytes()
+            short = available is not None and available < self.min_available_bytes
+            if not short and self.total_bytes() <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            released.append(self.release(key))
+        return released
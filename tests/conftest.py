@@ -0,0 +1,106 @@
+# conftest.py - SHARED FIXTURES: A FRESH DATABASE FILE AND A SEEDED EXPERIMENT
+import os
+import sys
+import random
+import sqlite3
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use('Agg')
+
+from database_sqlite import StressDatabase, MEASUREMENT_COLUMNS
+
+CONCENTRATIONS = [0, 10, 50, 100, 200, 400]
+
+# Schema of databases written before plants, change tracking and lookup codes existed
+LEGACY_SCHEMA = """
+    CREATE TABLE experiments (
+        id INTEGER PRIMARY KEY, experiment_code TEXT UNIQUE NOT NULL, experiment_name TEXT NOT NULL,
+        plant_species TEXT NOT NULL, stress_type TEXT NOT NULL, researcher TEXT, start_date TEXT,
+        end_date TEXT, description TEXT, status TEXT DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE treatments (
+        id INTEGER PRIMARY KEY, experiment_id INTEGER NOT NULL, treatment_name TEXT NOT NULL,
+        treatment_type TEXT NOT NULL, stress_level TEXT, concentration REAL, duration_days INTEGER,
+        temperature REAL, description TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (experiment_id) REFERENCES experiments (id) ON DELETE CASCADE,
+        UNIQUE(experiment_id, treatment_name)
+    );
+    CREATE TABLE measurements (
+        id INTEGER PRIMARY KEY, treatment_id INTEGER NOT NULL, measurement_date TEXT NOT NULL,
+        plant_height REAL, leaf_area REAL, chlorophyll_content REAL, photosynthesis_rate REAL,
+        stomatal_conductance REAL, root_length REAL, biomass_fresh REAL, biomass_dry REAL,
+        water_content REAL, notes TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (treatment_id) REFERENCES treatments (id) ON DELETE CASCADE
+    );
+"""
+
+def write_legacy_file(path):
+    """A pre-migration database file with two treatments measured in triplicate on two dates"""
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("""
+        INSERT INTO experiments (experiment_code, experiment_name, plant_species, stress_type, researcher)
+        VALUES ('OLD', 'Legacy trial', 'Maize', 'heat', 'Bo')
+    """)
+    conn.execute("INSERT INTO treatments (experiment_id, treatment_name, treatment_type) VALUES (1, 'A', 'control')")
+    conn.execute("INSERT INTO treatments (experiment_id, treatment_name, treatment_type, stress_level) "
+                 "VALUES (1, 'B', 'heat', '40C')")
+    for treatment_id in (1, 2):
+        for date in ('2023-06-01', '2023-06-08'):
+            for replicate in range(3):
+                conn.execute("INSERT INTO measurements (treatment_id, measurement_date, plant_height) "
+                             "VALUES (?, ?, ?)", (treatment_id, date, 10.0 * treatment_id + replicate))
+    conn.commit()
+    conn.close()
+
+def open_database(path):
+    db = StressDatabase()
+    db.db_file = str(path)
+    assert db.create_database()
+    return db
+
+def seed_experiment(db, code='E1', n_treatments=4, days=30, replicates=3, seed=1):
+    """Experiment with a control (T0) and stressed treatments whose growth and water content fall with stress"""
+    rng = random.Random(seed)
+    conn = db.connection
+    experiment_id = conn.execute("""
+        INSERT INTO experiments (experiment_code, experiment_name, plant_species, stress_type, researcher)
+        VALUES (?, 'Drought trial', 'Wheat', 'drought', 'Ann')
+    """, (code,)).lastrowid
+    for t in range(n_treatments):
+        treatment_id = conn.execute("""
+            INSERT INTO treatments (experiment_id, treatment_name, treatment_type, stress_level, concentration, temperature)
+            VALUES (?, ?, ?, ?, ?, 25)
+        """, (experiment_id, f"T{t}", 'control' if t == 0 else 'drought', 'control' if t == 0 else 'high',
+              CONCENTRATIONS[t % len(CONCENTRATIONS)])).lastrowid
+        for day in range(days):
+            for r in range(replicates):
+                fresh = 10 + rng.random()
+                values = [10 + day * (1 - t * 0.2) + rng.gauss(0, 1), 50 + rng.gauss(0, 5), 40 + rng.gauss(0, 3),
+                          20 - (t * day * 0.1 if day > 10 else 0) + rng.gauss(0, 1), 0.3 + rng.gauss(0, 0.02),
+                          15 + rng.random(), fresh, fresh * 0.2,
+                          80 - (t * (day - 15) * 0.5 if day > 15 else 0) + rng.gauss(0, 1)]
+                conn.execute(f"""
+                    INSERT INTO measurements (treatment_id, measurement_date, {', '.join(MEASUREMENT_COLUMNS)})
+                    VALUES (?, date('2024-01-01', ?), {', '.join('?' * len(MEASUREMENT_COLUMNS))})
+                """, (treatment_id, f'+{day} days', *values))
+    conn.commit()
+    return experiment_id
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """An empty database in its own directory (the working directory, for files written next to it)"""
+    monkeypatch.chdir(tmp_path)
+    database = open_database(tmp_path / 'plant_stress.db')
+    yield database
+    database.close_connection()
+
+@pytest.fixture
+def experiment_id(db):
+    return seed_experiment(db)
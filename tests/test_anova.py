@@ -0,0 +1,73 @@
+# test_anova.py - BATCHED ANOVA AND TUKEY HSD AGAINST SCIPY
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from anova import AnovaEngine
+from database_sqlite import MEASUREMENT_COLUMNS
+
+@pytest.fixture
+def engine(db, experiment_id):
+    # Missing values must be masked per metric, not dropped row-wise
+    db.connection.execute("UPDATE measurements SET leaf_area = NULL WHERE id % 7 = 0")
+    db.connection.execute("UPDATE measurements SET root_length = NULL WHERE id % 5 = 0")
+    db.connection.commit()
+    return AnovaEngine(db)
+
+def groups(db, experiment_id, metric, factor='t.treatment_name'):
+    df = pd.read_sql_query(f"""
+        SELECT {factor} AS level, m.{metric} AS value FROM measurements m
+        JOIN treatments t ON t.id = m.treatment_id
+        WHERE t.experiment_id = ? AND m.{metric} IS NOT NULL
+    """, db.connection, params=(experiment_id,))
+    return [g['value'].to_numpy() for _, g in df.groupby('level', sort=True)]
+
+def test_one_way_matches_scipy(db, engine, experiment_id):
+    table = engine.one_way_anova(experiment_id)
+    effects = table[table.term == 'treatment'].set_index('metric')
+    for metric in MEASUREMENT_COLUMNS:
+        expected = stats.f_oneway(*groups(db, experiment_id, metric))
+        assert effects.loc[metric, 'F'] == pytest.approx(expected.statistic, rel=1e-6)
+        assert effects.loc[metric, 'p_value'] == pytest.approx(expected.pvalue, rel=1e-5, abs=1e-300)
+
+def test_tukey_matches_scipy(db, engine, experiment_id):
+    result = engine.tukey_hsd(experiment_id, metrics=['plant_height', 'leaf_area'])
+    for metric in ('plant_height', 'leaf_area'):
+        expected = stats.tukey_hsd(*groups(db, experiment_id, metric))
+        ci = expected.confidence_interval(0.95)
+        rows = result[result.metric == metric]
+        assert len(rows) == 6
+        for row in rows.itertuples():
+            i, j = int(row.group1[1:]), int(row.group2[1:])
+            # scipy reports mean(i) - mean(j); the engine reports mean(j) - mean(i)
+            assert row.mean_diff == pytest.approx(-expected.statistic[i, j], rel=1e-6)
+            assert row.p_adj == pytest.approx(expected.pvalue[i, j], abs=1e-4)
+            assert row.ci_lower == pytest.approx(-ci.high[i, j], rel=1e-4)
+            assert row.ci_upper == pytest.approx(-ci.low[i, j], rel=1e-4)
+
+def test_two_way_matches_least_squares(db, engine, experiment_id):
+    table = engine.two_way_anova(experiment_id, 'treatment', 'date', metrics=['plant_height'])
+    df = pd.read_sql_query("""
+        SELECT t.treatment_name AS a, m.measurement_date AS b, m.plant_height AS y
+        FROM measurements m JOIN treatments t ON t.id = m.treatment_id WHERE t.experiment_id = ?
+    """, db.connection, params=(experiment_id,))
+
+    def rss(columns):
+        design = np.column_stack([np.ones(len(df))] + columns)
+        beta, *_ = np.linalg.lstsq(design, df['y'], rcond=None)
+        return ((df['y'] - design @ beta) ** 2).sum()
+
+    dummies_a = [pd.get_dummies(df['a'], drop_first=True, dtype=float).to_numpy()]
+    dummies_b = [pd.get_dummies(df['b'], drop_first=True, dtype=float).to_numpy()]
+    additive = rss(dummies_a + dummies_b)
+    rows = table.set_index('term')
+    assert rows.loc['treatment', 'sum_sq'] == pytest.approx(rss(dummies_b) - additive, rel=1e-6)
+    assert rows.loc['date', 'sum_sq'] == pytest.approx(rss(dummies_a) - additive, rel=1e-6)
+    assert rows.loc['treatment', 'df'] == 3
+    assert rows.loc['date', 'df'] == 29
+    assert rows.loc['treatment:date', 'df'] == 3 * 29
+
+def test_lookup_factor_levels_are_named(engine, experiment_id):
+    table = engine.tukey_hsd(experiment_id, factor='treatment_type', metrics=['plant_height'])
+    assert set(table['group1']) | set(table['group2']) == {'control', 'drought'}
@@ -0,0 +1,68 @@
+# test_audit.py - CHANGE HISTORY TRIGGERS AND "AS OF" RECONSTRUCTION
+import json
+import time
+
+import pytest
+
+from audit import ChangeHistory
+from database_sqlite import NOW_MS
+
+def _now(db):
+    stamp = db.connection.execute(f"SELECT {NOW_MS}").fetchone()[0]
+    time.sleep(0.01)
+    return stamp
+
+def _first_measurement(db):
+    return db.connection.execute(
+        "SELECT id, plant_height, leaf_area FROM measurements ORDER BY id LIMIT 1").fetchone()
+
+def test_updates_record_only_changed_columns(db, experiment_id):
+    measurement_id, height, _ = _first_measurement(db)
+    db.connection.execute("UPDATE measurements SET plant_height = 99 WHERE id = ?", (measurement_id,))
+    # Touching only updated_at is not a change
+    db.connection.execute("UPDATE measurements SET updated_at = '2030-01-01' WHERE id = ?", (measurement_id,))
+    db.connection.commit()
+    entries = db.connection.execute(
+        "SELECT operation, old_values FROM change_history WHERE row_id = ?", (measurement_id,)).fetchall()
+    assert len(entries) == 1
+    assert entries[0][0] == 'U'
+    # SQLite's JSON keeps 15 significant digits
+    assert json.loads(entries[0][1]) == {'plant_height': pytest.approx(height)}
+
+def test_row_as_of_undoes_later_changes(db, experiment_id):
+    measurement_id, height, area = _first_measurement(db)
+    before = _now(db)
+    db.connection.execute("UPDATE measurements SET plant_height = 99 WHERE id = ?", (measurement_id,))
+    db.connection.commit()
+    middle = _now(db)
+    db.connection.execute("UPDATE measurements SET leaf_area = 1, plant_height = 98 WHERE id = ?", (measurement_id,))
+    db.connection.commit()
+
+    history = ChangeHistory(db)
+    assert history.row_as_of('measurements', measurement_id, before)['plant_height'] == pytest.approx(height)
+    at_middle = history.row_as_of('measurements', measurement_id, middle)
+    assert (at_middle['plant_height'], at_middle['leaf_area']) == pytest.approx((99, area))
+
+    changes = history.get_history('measurements', measurement_id)
+    assert changes['column'].tolist() == ['plant_height', 'leaf_area', 'plant_height']
+    assert changes['old_value'].tolist() == pytest.approx([height, area, 99])
+    assert changes['new_value'].tolist() == pytest.approx([99, 1, 98])
+
+def test_deleted_measurements_come_back_as_of_earlier(db, experiment_id):
+    history = ChangeHistory(db)
+    before = _now(db)
+    snapshot = history.measurements_as_of(experiment_id, before)
+    treatment_id = db.connection.execute("SELECT id FROM treatments WHERE treatment_name = 'T1'").fetchone()[0]
+    db.connection.execute("DELETE FROM measurements WHERE treatment_id = ?", (treatment_id,))
+    db.connection.execute("UPDATE measurements SET plant_height = plant_height + 1")
+    db.connection.commit()
+
+    restored = history.measurements_as_of(experiment_id, before)
+    assert len(restored) == len(snapshot) == 4 * 30 * 3
+    assert restored['plant_height'].tolist() == pytest.approx(snapshot['plant_height'].tolist())
+    assert history.get_history('measurements', int(snapshot.loc[snapshot['treatment_id'] == treatment_id, 'id'].iloc[0]))[
+        'operation'].tolist() == ['delete']
+
+def test_untracked_tables_are_rejected(db):
+    with pytest.raises(ValueError):
+        ChangeHistory(db).rows_as_of('plants', '2024-01-01')
@@ -0,0 +1,44 @@
+# test_backup.py - COMPRESSED SNAPSHOTS, ROTATION AND RESTORE
+import gzip
+import os
+
+from backup import BackupManager
+
+def _count(db):
+    return db.connection.execute("SELECT COUNT(*) FROM measurements").fetchone()[0]
+
+def test_snapshot_restore_round_trip(db, experiment_id, tmp_path):
+    backups = BackupManager(db, backup_dir=str(tmp_path / 'backups'), pages_per_step=8, step_sleep=0)
+    stats = backups.create_snapshot()
+    assert os.path.exists(stats['snapshot_path'])
+    assert stats['snapshot_bytes'] < stats['database_bytes']
+    assert backups.get_history()[0][0] == stats['snapshot_path']
+
+    before = _count(db)
+    db.connection.execute("DELETE FROM measurements WHERE id % 2 = 0")
+    db.connection.commit()
+    assert _count(db) < before
+    assert backups.restore_snapshot(stats['snapshot_path']) is not None
+    assert _count(db) == before
+
+def test_rotation_keeps_the_newest_snapshots(db, experiment_id, tmp_path):
+    backups = BackupManager(db, backup_dir=str(tmp_path / 'backups'), keep=2)
+    paths = [backups.create_snapshot()['snapshot_path'] for _ in range(3)]
+    assert backups.list_snapshots() == paths[:0:-1]
+
+def test_background_snapshot_reports_when_done(db, experiment_id, tmp_path):
+    backups = BackupManager(db, backup_dir=str(tmp_path / 'backups'))
+    results = []
+    assert backups.start_snapshot(on_done=results.append)
+    backups._thread.join(30)
+    assert not backups.is_running()
+    assert isinstance(results[0], dict)
+
+def test_corrupt_snapshot_leaves_the_database_untouched(db, experiment_id, tmp_path):
+    path = tmp_path / 'broken.db.gz'
+    with gzip.open(path, 'wb') as packed:
+        packed.write(b'SQLite format 3\x00' + b'\xff' * 4096)
+    before = _count(db)
+    assert BackupManager(db).restore_snapshot(str(path)) is None
+    assert _count(db) == before
+    assert not os.path.exists(str(path) + '.restore')
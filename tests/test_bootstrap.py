@@ -0,0 +1,50 @@
+# test_bootstrap.py - BOOTSTRAP CONFIDENCE INTERVALS
+import numpy as np
+import pytest
+from scipy import stats
+
+from bootstrap import BootstrapAnalyzer
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(3)
+    treated = np.column_stack([rng.normal(12, 2, 40), rng.exponential(3, 40)])
+    control = np.column_stack([rng.normal(10, 2, 35), rng.exponential(2, 35)])
+    treated[::9, 1] = np.nan
+    return treated, control
+
+def test_worker_count_does_not_change_results(samples):
+    treated, control = samples
+    # A tiny memory limit forces many chunks, each with its own seed
+    serial = BootstrapAnalyzer(None, max_workers=1, memory_limit_mb=0.01)
+    parallel = BootstrapAnalyzer(None, max_workers=3, memory_limit_mb=0.01)
+    assert serial.chunk_size(len(treated), len(control), 2) < 500
+    first = serial.bootstrap_distribution(treated, control, 500, seed=7)
+    assert first.shape == (500, 2)
+    assert np.array_equal(parallel.bootstrap_distribution(treated, control, 500, seed=7), first, equal_nan=True)
+
+@pytest.mark.parametrize('method', ['percentile', 'bca'])
+def test_intervals_agree_with_scipy(samples, method):
+    treated, control = samples
+    analyzer = BootstrapAnalyzer(None, max_workers=1)
+    estimate, lower, upper = analyzer.confidence_intervals(treated, control, 4000, method=method, seed=0)
+    for k in range(treated.shape[1]):
+        t, c = treated[:, k], control[:, k]
+        t, c = t[~np.isnan(t)], c[~np.isnan(c)]
+        assert estimate[k] == pytest.approx(t.mean() - c.mean())
+        expected = stats.bootstrap((t, c), lambda a, b, axis: a.mean(axis) - b.mean(axis),
+                                   n_resamples=4000, method=method, random_state=1).confidence_interval
+        # Different random streams: agree to within Monte Carlo error
+        width = expected.high - expected.low
+        assert lower[k] == pytest.approx(expected.low, abs=0.1 * width)
+        assert upper[k] == pytest.approx(expected.high, abs=0.1 * width)
+
+def test_treatment_effects_against_control(db, experiment_id):
+    effects = BootstrapAnalyzer(db, max_workers=1).treatment_effects(
+        experiment_id, metrics=['water_content'], n_resamples=400)
+    assert set(effects['treatment_name']) == {'T1', 'T2', 'T3'}
+    assert (effects['control_name'] == 'T0').all()
+    assert (effects['ci_lower'] <= effects['mean_difference']).all()
+    assert (effects['mean_difference'] <= effects['ci_upper']).all()
+    # Water content falls with stress, so every stressed treatment is clearly below control
+    assert (effects['ci_upper'] < 0).all()
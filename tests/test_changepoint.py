@@ -0,0 +1,29 @@
+# test_changepoint.py - STRESS-ONSET DETECTION
+import numpy as np
+
+from changepoint import ChangepointDetector
+
+def test_segment_finds_steps_in_every_row():
+    rng = np.random.default_rng(0)
+    series = rng.normal(0, 0.2, (3, 40))
+    series[0, 12:] += 3.0
+    series[1, 25:] -= 2.0
+    detector = ChangepointDetector(None)
+    mask = detector.segment(series)
+    assert mask[0, 12] and mask[1, 25]
+    assert (mask.sum(axis=1) <= 1 + detector.max_changepoints).all()
+    # A series without a step stays one segment
+    assert np.flatnonzero(mask[2]).tolist() == [0]
+
+def test_detect_persists_onsets_after_divergence(db, experiment_id):
+    detector = ChangepointDetector(db)
+    detected = detector.detect(experiment_id, metrics=('water_content',))
+    onsets = detected[detected.is_onset == 1].set_index('treatment_name')
+    # The strongest treatment's water content falls steadily from day 16 (2024-01-17)
+    assert '2024-01-15' <= onsets.loc['T3', 'change_date'] <= '2024-01-25'
+    assert onsets.loc['T3', 'mean_after'] < onsets.loc['T3', 'mean_before']
+    assert 'T0' not in onsets.index
+
+    stored = ChangepointDetector(db).get_changepoints(experiment_id, onsets_only=True)
+    assert stored[['treatment_name', 'change_date']].values.tolist() == \
+        detected[detected.is_onset == 1][['treatment_name', 'change_date']].values.tolist()
@@ -0,0 +1,50 @@
+# test_compact_storage.py - COMPACT MEASUREMENT LAYOUT ROUND TRIP AND BENCHMARK
+import sqlite3
+
+import pytest
+
+from compact_storage import CompactMeasurementLayout
+
+def _measurements(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT * FROM measurements ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+def test_convert_and_expand_round_trip(db, experiment_id, tmp_path):
+    db.connection.execute("UPDATE measurements SET notes = 'wilted' WHERE id % 7 = 0")
+    db.connection.commit()
+    layout = CompactMeasurementLayout(db)
+    compact = str(tmp_path / 'compact.db')
+    result = layout.convert(compact)
+    assert result['rows'] == 4 * 30 * 3
+    assert layout.layout_of(compact) == 'compact'
+    assert layout.layout_of(db.db_file) == 'standard'
+    # The view presents the same rows as the live table
+    assert _measurements(compact) == _measurements(db.db_file)
+
+    expanded = str(tmp_path / 'expanded.db')
+    assert layout.expand(compact, expanded) == 4 * 30 * 3
+    assert layout.layout_of(expanded) == 'standard'
+    assert _measurements(expanded) == _measurements(db.db_file)
+
+def test_dates_with_times_are_refused(db, experiment_id, tmp_path):
+    db.connection.execute("UPDATE measurements SET measurement_date = measurement_date || ' 10:00' WHERE id = 1")
+    db.connection.commit()
+    with pytest.raises(ValueError):
+        CompactMeasurementLayout(db).convert(str(tmp_path / 'compact.db'))
+    assert not (tmp_path / 'compact.db').exists()
+    assert not (tmp_path / 'compact.db.partial').exists()
+
+def test_expanding_a_standard_file_is_refused(db, tmp_path):
+    with pytest.raises(ValueError):
+        CompactMeasurementLayout(db).expand(db.db_file, str(tmp_path / 'expanded.db'))
+
+def test_benchmark_scans_the_same_rows(db, experiment_id, tmp_path):
+    layout = CompactMeasurementLayout(db)
+    compact = str(tmp_path / 'compact.db')
+    layout.convert(compact)
+    results = layout.benchmark(compact, scans=50)
+    assert results['standard']['rows'] == results['compact']['rows'] > 0
+    assert results['compact']['file_bytes'] < results['standard']['file_bytes']
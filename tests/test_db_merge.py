@@ -0,0 +1,53 @@
+# test_db_merge.py - MERGING OTHER LAB DATABASE FILES
+from db_merge import DatabaseMerger
+from conftest import open_database, seed_experiment, write_legacy_file
+
+def _source(tmp_path, name='bench.db', **kwargs):
+    source = open_database(tmp_path / name)
+    seed_experiment(source, **kwargs)
+    source.close_connection()
+    return str(tmp_path / name)
+
+def _count(db, table):
+    return db.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_merge_copies_experiments_treatments_and_measurements(db, tmp_path):
+    path = _source(tmp_path, code='B1', n_treatments=2, days=5)
+    result = DatabaseMerger(db).merge_file(path)
+    assert (result['experiments'], result['treatments'], result['measurements']) == (1, 2, 2 * 5 * 3)
+    assert result['conflicts'] == []
+    # Lookup codes are re-derived for this file
+    assert db.connection.execute("""
+        SELECT DISTINCT treatment_type FROM treatments ORDER BY treatment_type
+    """).fetchall() == [('control',), ('drought',)]
+
+def test_merging_twice_adds_nothing(db, tmp_path):
+    path = _source(tmp_path, code='B1', n_treatments=2, days=5)
+    merger = DatabaseMerger(db)
+    merger.merge_file(path)
+    again = merger.merge_file(path)
+    assert (again['experiments'], again['treatments'], again['measurements']) == (0, 0, 0)
+    assert _count(db, 'measurements') == 2 * 5 * 3
+    assert _count(db, 'database_merges') == 2
+
+def test_matched_experiments_report_conflicts_and_keep_ours(db, tmp_path, experiment_id):
+    path = _source(tmp_path, code='E1', n_treatments=2, days=5, seed=2)
+    db.connection.execute("UPDATE experiments SET researcher = 'Local' WHERE id = ?", (experiment_id,))
+    db.connection.commit()
+    result = DatabaseMerger(db).merge_file(path)
+    assert result['experiments'] == 0 and result['treatments'] == 0
+    assert {'kind': 'experiment', 'key': 'E1', 'field': 'researcher',
+            'ours': 'Local', 'theirs': 'Ann'} in result['conflicts']
+    # Different values and entry times make the source's rows new measurements of our treatments
+    assert result['measurements'] == 2 * 5 * 3
+    assert db.connection.execute("SELECT researcher FROM experiments").fetchone()[0] == 'Local'
+
+def test_legacy_file_without_plants_merges(db, tmp_path):
+    write_legacy_file(tmp_path / 'legacy.db')
+    summary = DatabaseMerger(db).merge_files([str(tmp_path / 'legacy.db'), str(tmp_path / 'missing' / 'x.db')])
+    assert summary['files'] == 1 and len(summary['errors']) == 1
+    assert summary['measurements'] == 12
+    assert db.connection.execute("SELECT COUNT(*) FROM measurements WHERE plant_id IS NULL").fetchone()[0] == 12
+
+def test_merging_into_itself_is_refused(db):
+    assert DatabaseMerger(db).merge_file(db.db_file) is None
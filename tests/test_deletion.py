@@ -0,0 +1,96 @@
+# test_deletion.py - CHUNKED, RESUMABLE EXPERIMENT DELETION
+import time
+
+import pandas as pd
+
+from audit import ChangeHistory
+from database_sqlite import NOW_MS
+from deletion import ChunkedDeleter
+from conftest import seed_experiment
+
+def _now(db):
+    stamp = db.connection.execute(f"SELECT {NOW_MS}").fetchone()[0]
+    time.sleep(0.01)
+    return stamp
+
+def _used_pages(db):
+    pages = db.connection.execute("PRAGMA page_count").fetchone()[0]
+    return pages - db.connection.execute("PRAGMA freelist_count").fetchone()[0]
+
+def _count(db, table, where='1'):
+    return db.connection.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}").fetchone()[0]
+
+def test_deleted_experiment_stays_in_the_audit_trail(db, experiment_id):
+    keep = seed_experiment(db, code='KEEP', days=5)
+    history = ChangeHistory(db)
+    before = _now(db)
+    snapshot = history.measurements_as_of(experiment_id, before)
+    assert len(snapshot) == 4 * 30 * 3
+    frames, watermarks = db.get_delta('lab')
+    db.save_export_watermarks('lab', watermarks)
+
+    deleter = ChunkedDeleter(db, chunk_size=100)
+    assert deleter.run_job(deleter.schedule_delete(experiment_id)) == 4 * 30 * 3
+    assert db.connection.execute("SELECT id FROM experiments").fetchall() == [(keep,)]
+    # New databases use incremental auto-vacuum, so the freed pages go back to the file system
+    assert db.connection.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+    # SQLite's JSON keeps 15 significant digits, so values are compared approximately
+    after = history.measurements_as_of(experiment_id, before)
+    pd.testing.assert_frame_equal(after, snapshot, check_dtype=False)
+    # Every row has its own tombstone, so a destination applying them row by row keeps no orphans
+    frames, _ = db.get_delta('lab')
+    tombstones = frames['deleted_rows'].groupby('table_name')['row_id'].count().to_dict()
+    assert tombstones == {'experiments': 1, 'treatments': 4, 'measurements': 4 * 30 * 3}
+
+def test_pruned_delete_does_not_grow_the_file(db):
+    keep = seed_experiment(db, code='KEEP', days=5)
+    doomed = seed_experiment(db, code='BIG', days=200, replicates=5, seed=2)
+    db.connection.execute("""
+        UPDATE measurements SET notes = 'edited'
+        WHERE treatment_id IN (SELECT id FROM treatments WHERE experiment_id = ?)
+    """, (doomed,))
+    db.connection.commit()
+    history, tombstones = _count(db, 'change_history'), _count(db, 'deleted_rows')
+    used = _used_pages(db)
+
+    deleter = ChunkedDeleter(db, chunk_size=700, vacuum_pages=100, prune_history=True)
+    job_id = deleter.schedule_delete(doomed)
+    progress = []
+    assert deleter.run_job(job_id, lambda done, total: progress.append(done)) == 4 * 200 * 5
+    assert progress[-1] == 4 * 200 * 5 and len(progress) > 1
+
+    assert _used_pages(db) <= used
+    assert db.connection.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    # The rows' history, edits and deletions alike, is gone; the experiment's own entries remain
+    assert db.connection.execute("SELECT table_name, row_id, operation FROM change_history").fetchall()[
+        history - 4 * 200 * 5:] == [('experiments', doomed, 'U'), ('experiments', doomed, 'D')]
+    assert _count(db, 'deleted_rows') - tombstones == 4 * 200 * 5 + 4 + 1
+    assert _count(db, 'measurements') == 4 * 5 * 3
+    assert db.connection.execute("SELECT id FROM experiments").fetchall() == [(keep,)]
+    assert db.connection.execute("SELECT status FROM deletion_jobs WHERE id = ?", (job_id,)).fetchone()[0] == 'done'
+
+def test_single_row_deletes_are_still_recorded(db, experiment_id):
+    measurement_id = db.connection.execute("SELECT MIN(id) FROM measurements").fetchone()[0]
+    db.connection.execute("DELETE FROM measurements WHERE id = ?", (measurement_id,))
+    db.connection.commit()
+    assert _count(db, 'change_history', f"operation = 'D' AND row_id = {measurement_id}") == 1
+    assert _count(db, 'deleted_rows', f"table_name = 'measurements' AND row_id = {measurement_id}") == 1
+
+def test_interrupted_jobs_resume(db, experiment_id):
+    deleter = ChunkedDeleter(db, chunk_size=100)
+    job_id = deleter.schedule_delete(experiment_id)
+    assert db.connection.execute("SELECT status FROM experiments").fetchone()[0] == 'deleting'
+    # Simulate a crash after the first chunk
+    db.connection.execute("""
+        DELETE FROM measurements WHERE id IN (SELECT id FROM measurements ORDER BY id LIMIT 100)
+    """)
+    db.connection.execute("UPDATE deletion_jobs SET status = 'running', deleted_rows = 100 WHERE id = ?", (job_id,))
+    db.connection.commit()
+
+    results = []
+    assert deleter.resume(on_done=results.append) == [job_id]
+    deleter._thread.join(30)
+    assert results == [4 * 30 * 3 - 100]
+    assert _count(db, 'experiments') == 0
+    assert deleter.pending_jobs() == []
@@ -0,0 +1,56 @@
+# test_delta_export.py - UPDATED_AT WATERMARKS, TOMBSTONES AND MERGED ROWS
+from db_merge import DatabaseMerger
+from conftest import open_database, seed_experiment
+
+def _export(db, destination='lab'):
+    frames, watermarks = db.get_delta(destination)
+    db.save_export_watermarks(destination, watermarks)
+    return frames
+
+def test_only_changes_since_the_last_export_are_returned(db, experiment_id):
+    first = _export(db)
+    assert len(first['measurements']) == 4 * 30 * 3
+    measurement_id = int(first['measurements']['id'].min())
+    db.connection.execute("UPDATE measurements SET notes = 'rechecked' WHERE id = ?", (measurement_id,))
+    db.connection.execute("DELETE FROM measurements WHERE id = ?", (measurement_id + 1,))
+    db.connection.commit()
+
+    delta = _export(db)
+    # Rows stamped in the same millisecond as the watermark come back; the edited one must
+    assert measurement_id in set(delta['measurements']['id'])
+    assert len(delta['measurements']) < len(first['measurements'])
+    assert delta['deleted_rows'][['table_name', 'row_id']].values.tolist() == [['measurements', measurement_id + 1]]
+
+def test_merged_rows_are_in_the_next_delta(db, tmp_path, experiment_id):
+    _export(db)
+    source = open_database(tmp_path / 'bench.db')
+    seed_experiment(source, code='B1', n_treatments=2, days=5)
+    # The source's rows carry older timestamps than our watermark
+    source.connection.execute("UPDATE experiments SET updated_at = '2000-01-01 00:00:00.000'")
+    source.connection.execute("UPDATE treatments SET updated_at = '2000-01-01 00:00:00.000'")
+    source.connection.execute("UPDATE measurements SET updated_at = '2000-01-01 00:00:00.000'")
+    source.connection.commit()
+    source.close_connection()
+
+    DatabaseMerger(db).merge_file(str(tmp_path / 'bench.db'))
+    delta = _export(db)
+    assert 'B1' in set(delta['experiments']['experiment_code'])
+    merged = db.connection.execute("""
+        SELECT m.id FROM measurements m JOIN treatments t ON t.id = m.treatment_id
+        JOIN experiments e ON e.id = t.experiment_id WHERE e.experiment_code = 'B1'
+    """).fetchall()
+    assert {row[0] for row in merged} <= set(delta['measurements']['id'])
+    assert len(merged) == 2 * 5 * 3
+
+def test_experiments_being_deleted_in_the_source_are_skipped(db, tmp_path):
+    source = open_database(tmp_path / 'bench.db')
+    seed_experiment(source, code='B1', n_treatments=2, days=2)
+    seed_experiment(source, code='B2', n_treatments=2, days=2)
+    source.connection.execute("UPDATE experiments SET status = 'deleting' WHERE experiment_code = 'B2'")
+    source.connection.commit()
+    source.close_connection()
+
+    summary = DatabaseMerger(db).merge_files([str(tmp_path / 'bench.db')])
+    assert summary['skipped'] == ['B2']
+    assert db.connection.execute("SELECT experiment_code, status FROM experiments").fetchall() == [('B1', 'active')]
+    assert summary['measurements'] == 2 * 2 * 3
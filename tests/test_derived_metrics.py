@@ -0,0 +1,52 @@
+# test_derived_metrics.py - DERIVED-METRIC REGISTRY AND INCREMENTAL RECOMPUTATION
+import pytest
+
+from database_sqlite import MEASUREMENT_COLUMNS
+from derived_metrics import DerivedMetricEngine, DERIVED_METRICS
+
+def test_registry_names_do_not_shadow_measurement_columns():
+    assert not set(DERIVED_METRICS) & set(MEASUREMENT_COLUMNS)
+
+def test_every_registry_metric_is_computable(db):
+    engine = DerivedMetricEngine(db)
+    assert set(engine.available_metrics()) == set(DERIVED_METRICS)
+
+def test_metrics_match_formulas(db, experiment_id):
+    engine = DerivedMetricEngine(db)
+    metrics = engine.get_metrics(experiment_id)
+    raw = db.connection.execute("""
+        SELECT m.id, m.biomass_fresh, m.biomass_dry, m.leaf_area, m.photosynthesis_rate, m.stomatal_conductance
+        FROM measurements m ORDER BY m.id
+    """).fetchall()
+    assert len(metrics) == len(raw)
+    row = metrics.set_index('measurement_id').loc[raw[0][0]]
+    _, fresh, dry, area, a, gs = raw[0]
+    assert row['derived_water_content'] == pytest.approx(100 * (fresh - dry) / fresh, abs=1e-3)
+    assert row['specific_leaf_area'] == pytest.approx(area / dry, abs=1e-3)
+    assert row['intrinsic_wue'] == pytest.approx(a / gs, abs=1e-3)
+
+def test_view_keeps_raw_water_content_distinct(db, experiment_id):
+    engine = DerivedMetricEngine(db)
+    engine.recompute()
+    raw, derived = db.connection.execute("""
+        SELECT m.water_content, v.derived_water_content
+        FROM measurements m JOIN measurement_metrics v ON v.measurement_id = m.id
+        ORDER BY m.id LIMIT 1
+    """).fetchone()
+    assert raw != pytest.approx(derived)
+
+def test_only_changed_rows_are_recomputed(db, experiment_id):
+    engine = DerivedMetricEngine(db)
+    assert engine.recompute() == 4 * 30 * 3
+    assert engine.recompute() == 0
+    measurement_id = db.connection.execute("SELECT MIN(id) FROM measurements").fetchone()[0]
+    db.connection.execute("UPDATE measurements SET notes = 'checked' WHERE id = ?", (measurement_id,))
+    assert engine.recompute() == 0
+    db.connection.execute("UPDATE measurements SET biomass_dry = 0 WHERE id = ?", (measurement_id,))
+    db.connection.commit()
+    assert engine.recompute() == 1
+    metrics = dict(db.connection.execute(
+        "SELECT metric, value FROM derived_metrics WHERE measurement_id = ?", (measurement_id,)).fetchall())
+    # A zero dry weight leaves the ratios undefined rather than infinite
+    assert 'specific_leaf_area' not in metrics
+    assert metrics['derived_water_content'] == pytest.approx(100.0)
@@ -0,0 +1,66 @@
+# test_dose_response.py - DOSE-RESPONSE FITS AND THEIR CACHE
+import numpy as np
+import pytest
+
+from dose_response import DoseResponseAnalyzer, dose_response_curve
+
+DOSES = [0, 1, 3, 10, 30, 100, 300]
+
+@pytest.fixture
+def dose_experiment(db):
+    """Plant height following LL.4 with EC50 = 20 (slope 1.5, 40 -> 10)"""
+    rng = np.random.default_rng(0)
+    conn = db.connection
+    experiment_id = conn.execute("""
+        INSERT INTO experiments (experiment_code, experiment_name, plant_species, stress_type)
+        VALUES ('DR', 'Salt series', 'Barley', 'salinity')
+    """).lastrowid
+    for dose in DOSES:
+        treatment_id = conn.execute("""
+            INSERT INTO treatments (experiment_id, treatment_name, treatment_type, concentration)
+            VALUES (?, ?, ?, ?)
+        """, (experiment_id, f"NaCl {dose}", 'control' if dose == 0 else 'salt', dose)).lastrowid
+        expected = dose_response_curve('ll4', [dose], 1.5, 10.0, 40.0, np.log(20.0))[0]
+        for height in expected + rng.normal(0, 0.3, 4):
+            conn.execute("""
+                INSERT INTO measurements (treatment_id, measurement_date, plant_height)
+                VALUES (?, '2024-03-01', ?)
+            """, (treatment_id, float(height)))
+    conn.commit()
+    return experiment_id
+
+def test_ll4_fit_recovers_parameters(db, dose_experiment):
+    fits = DoseResponseAnalyzer(db, max_workers=1).fit_experiment(dose_experiment, ['plant_height'], ('ll4',))
+    fit = fits.iloc[0]
+    assert fit.converged
+    assert fit.ec50 == pytest.approx(20.0, rel=0.1)
+    assert fit.slope == pytest.approx(1.5, rel=0.2)
+    assert fit.lower_asymptote == pytest.approx(10.0, abs=1.0)
+    assert fit.upper_asymptote == pytest.approx(40.0, abs=1.0)
+
+def test_fits_are_cached_until_data_changes(db, dose_experiment):
+    analyzer = DoseResponseAnalyzer(db, max_workers=1)
+    first = analyzer.fit_experiment(dose_experiment, ['plant_height'])
+    assert not first['cached'].any()
+    assert analyzer.fit_experiment(dose_experiment, ['plant_height'])['cached'].all()
+
+    db.connection.execute("UPDATE measurements SET plant_height = plant_height + 0.5 WHERE id = 1")
+    db.connection.commit()
+    refitted = analyzer.fit_experiment(dose_experiment, ['plant_height'])
+    assert not refitted['cached'].any()
+
+def test_changed_data_with_equal_sums_is_refitted(db, dose_experiment):
+    analyzer = DoseResponseAnalyzer(db, max_workers=1)
+    ids = [row[0] for row in db.connection.execute("SELECT id FROM measurements ORDER BY id LIMIT 3")]
+    # 1, 5, 6 and 2, 3, 7 share their count, sum and sum of squares at the same dose
+    for values in ((1.0, 5.0, 6.0), (2.0, 3.0, 7.0)):
+        db.connection.executemany("UPDATE measurements SET plant_height = ? WHERE id = ?", zip(values, ids))
+        db.connection.commit()
+        assert not analyzer.fit_experiment(dose_experiment, ['plant_height'])['cached'].any()
+    assert analyzer.fit_experiment(dose_experiment, ['plant_height'])['cached'].all()
+
+def test_predicted_curve_spans_positive_doses(db, dose_experiment):
+    curve = DoseResponseAnalyzer(db, max_workers=1).predicted_curve(dose_experiment, 'plant_height')
+    assert curve['concentration'].min() == pytest.approx(1)
+    assert curve['concentration'].max() == pytest.approx(300)
+    assert curve['predicted'].is_monotonic_decreasing
@@ -0,0 +1,73 @@
+# test_duplicates.py - EXACT AND NEAR DUPLICATE DETECTION AND MERGING
+from duplicates import DuplicateDetector
+
+def _treatment(db):
+    experiment_id = db.connection.execute("""
+        INSERT INTO experiments (experiment_code, experiment_name, plant_species, stress_type)
+        VALUES ('DUP', 'Duplicates', 'Wheat', 'drought')
+    """).lastrowid
+    treatment_id = db.connection.execute(
+        "INSERT INTO treatments (experiment_id, treatment_name, treatment_type) VALUES (?, 'T', 'drought')",
+        (experiment_id,)).lastrowid
+    return experiment_id, treatment_id
+
+def _insert(db, treatment_id, plant_id=None, a=None, gs=None, height=None, notes=None):
+    return db.connection.execute("""
+        INSERT INTO measurements (treatment_id, plant_id, measurement_date, photosynthesis_rate,
+                                  stomatal_conductance, plant_height, notes)
+        VALUES (?, ?, '2024-03-01', ?, ?, ?, ?)
+    """, (treatment_id, plant_id, a, gs, height, notes)).lastrowid
+
+def test_separate_gas_exchange_observations_are_not_duplicates(db):
+    experiment_id, treatment_id = _treatment(db)
+    for obs, (a, gs) in enumerate([(12.00, 0.300), (12.05, 0.301), (11.98, 0.2995)], start=1):
+        _insert(db, treatment_id, a=a, gs=gs, notes=f"Gas exchange: T obs {obs}")
+    db.connection.commit()
+    detector = DuplicateDetector(db)
+    assert detector.find_duplicates(experiment_id) is None
+
+    # Even with a shared plant, different observation notes keep the rows apart
+    plant_id = db.get_or_create_plant(treatment_id, 'P1')
+    db.connection.execute("UPDATE measurements SET plant_id = ?", (plant_id,))
+    db.connection.commit()
+    assert detector.find_duplicates(experiment_id) is None
+
+def test_near_duplicates_need_a_plant_and_enough_metrics(db):
+    experiment_id, treatment_id = _treatment(db)
+    plant_id = db.get_or_create_plant(treatment_id, 'P1')
+    first = _insert(db, treatment_id, plant_id, a=12.00, gs=0.300)
+    second = _insert(db, treatment_id, plant_id, a=12.05, gs=0.301)
+    # Single-metric rows and rows without a plant are never near duplicates
+    _insert(db, treatment_id, plant_id, height=20.0)
+    _insert(db, treatment_id, plant_id, height=20.1)
+    _insert(db, treatment_id, None, a=12.01, gs=0.300)
+    db.connection.commit()
+    groups = DuplicateDetector(db).find_duplicates(experiment_id)
+    assert groups['kind'].tolist() == ['near', 'near']
+    assert groups['id'].tolist() == [first, second]
+
+def test_only_exact_groups_are_merged(db):
+    experiment_id, treatment_id = _treatment(db)
+    plant_id = db.get_or_create_plant(treatment_id, 'P1')
+    keep = _insert(db, treatment_id, plant_id, a=12.0, gs=0.3, notes='entered twice')
+    copy = _insert(db, treatment_id, plant_id, a=12.0, gs=0.3)
+    near = _insert(db, treatment_id, plant_id, a=12.05, gs=0.301, notes='entered twice')
+    db.connection.commit()
+    detector = DuplicateDetector(db)
+    groups = detector.find_duplicates(experiment_id)
+    exact = groups[groups['kind'] == 'exact']
+    assert exact['id'].tolist() == [keep, copy]
+    # The exact group's first row also stands for it in the near group
+    assert set(groups.loc[groups['kind'] == 'near', 'id']) == {keep, near}
+
+    assert detector.merge_duplicates(groups) == 1
+    remaining = db.connection.execute("SELECT id, notes FROM measurements ORDER BY id").fetchall()
+    assert remaining == [(keep, 'entered twice'), (near, 'entered twice')]
+
+def test_merge_fills_missing_values_from_duplicates(db):
+    experiment_id, treatment_id = _treatment(db)
+    keep = _insert(db, treatment_id, None, a=12.0, gs=0.3, notes='first')
+    _insert(db, treatment_id, None, a=12.0, gs=0.3, notes='second')
+    db.connection.commit()
+    assert DuplicateDetector(db).merge_duplicates({keep: [keep + 1]}) == 1
+    assert db.connection.execute("SELECT notes FROM measurements").fetchall() == [('first | second',)]
@@ -0,0 +1,117 @@
+# test_gas_exchange.py - GAS-EXCHANGE LOG PARSING AND IMPORT
+import pytest
+
+from gas_exchange import GasExchangeImporter, file_digest, parse_gas_exchange_log
+from conftest import seed_experiment
+
+LI6400_LOG = '''"OPEN 6.2.4"
+"Thr Mar 14 2024 09:12:01"
+"Remark=   09:12:01 leak check"
+$STARTOFDATA$
+"Obs"\t"HHMMSS"\t"Photo"\t"Cond"\t"Ci"
+"09:15:00 T1"
+1\t"09:15:10"\t12.00\t0.300\t280
+2\t"09:15:40"\t12.05\t0.301\t281
+"09:20:00 leaf 4 again"
+3\t"09:20:10"\t11.98\t0.2995\t279
+'''
+
+LABELLED_LOG = '''[Header]
+Date\t2024-03-15
+[Data]
+obs\tdate\tlabel\tA\tgsw
+\t\t\tumol m-2 s-1\tmol m-2 s-1
+1\t2024-03-15 10:00:00\tT0\t15.1\t0.41
+2\t2024-03-15 10:01:00\tt2\t9.4\t0.22
+3\t2024-03-15 10:02:00\tT22\t9.9\t0.25
+4\t2024-03-15 10:03:00\t\t10.2\t0.27
+'''
+
+@pytest.fixture
+def logs(tmp_path):
+    paths = []
+    for name, text in (('li6400.txt', LI6400_LOG), ('li6800.txt', LABELLED_LOG)):
+        path = tmp_path / name
+        path.write_text(text)
+        paths.append(str(path))
+    return paths
+
+def imported(db):
+    return db.connection.execute("""
+        SELECT t.treatment_name, m.measurement_date, m.photosynthesis_rate, m.stomatal_conductance
+        FROM measurements m JOIN treatments t ON t.id = m.treatment_id
+        WHERE m.notes LIKE 'Gas exchange:%' ORDER BY m.notes
+    """).fetchall()
+
+def test_parser_reads_header_dates_remarks_and_skips_units(logs):
+    old, new = (list(parse_gas_exchange_log(path)) for path in logs)
+    assert [o['photosynthesis_rate'] for o in old] == [12.00, 12.05, 11.98]
+    assert {o['date'] for o in old} == {'2024-03-14'}
+    assert [o['remark'] for o in old] == ['T1', 'T1', 'leaf 4 again']
+    assert [o['label'] for o in new] == ['T0', 't2', 'T22', '']
+    assert len(new) == 4
+
+def test_labels_map_to_treatments_and_unknown_labels_are_reported(db, experiment_id, logs):
+    importer = GasExchangeImporter(db, max_workers=1)
+    summary = importer.import_files(logs, experiment_id, default_treatment_id=4)
+    rows = imported(db)
+    # Remark "T1" names a treatment; the free-text remark and the blank label fall back to T3
+    assert sorted(name for name, *_ in rows) == ['T0', 'T1', 'T1', 'T2', 'T3', 'T3']
+    # The typo "T22" is not silently filed under the default treatment
+    assert summary['unmapped'] == 1
+    assert summary['unknown_labels'] == {'T22': 1}
+    assert summary['rows'] == 6
+
+def test_reimport_skips_unchanged_files(db, experiment_id, logs):
+    importer = GasExchangeImporter(db, max_workers=1)
+    importer.import_files(logs, experiment_id, default_treatment_id=4)
+    summary = importer.import_files(logs, experiment_id, default_treatment_id=4)
+    assert summary['skipped'] == 2 and summary['rows'] == 0
+    assert len(imported(db)) == 6
+
+def test_parallel_import_matches_serial(db, experiment_id, logs, tmp_path):
+    copies = []
+    for i in range(3):
+        path = tmp_path / f"copy{i}.txt"
+        path.write_text(LABELLED_LOG.replace('15.1', f'15.{i + 2}'))
+        copies.append(str(path))
+    summary = GasExchangeImporter(db, max_workers=2, max_in_flight=2).import_files(
+        copies, experiment_id, default_treatment_id=4)
+    assert summary['files'] == 3 and summary['rows'] == 9 and summary['unmapped'] == 3
+    assert sorted(r[2] for r in imported(db) if r[0] == 'T0') == [15.2, 15.3, 15.4]
+
+def test_same_file_imports_into_another_experiment(db, experiment_id, logs):
+    other = seed_experiment(db, code='E2', n_treatments=4, days=1)
+    importer = GasExchangeImporter(db, max_workers=1)
+    importer.import_files(logs, experiment_id, default_treatment_id=4)
+    default = db.connection.execute(
+        "SELECT id FROM treatments WHERE experiment_id = ? AND treatment_name = 'T3'", (other,)).fetchone()[0]
+    summary = importer.import_files(logs, other, default_treatment_id=default)
+    assert summary['skipped'] == 0 and summary['rows'] == 6
+    assert db.connection.execute("SELECT COUNT(*) FROM instrument_imports").fetchone()[0] == 4
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_identical_files_in_one_batch_import_once(db, experiment_id, logs, tmp_path, workers):
+    copy = tmp_path / 'li6800 copy.txt'
+    copy.write_text(LABELLED_LOG)
+    summary = GasExchangeImporter(db, max_workers=workers).import_files(
+        [logs[1], str(copy), logs[1]], experiment_id, default_treatment_id=4)
+    assert summary['files'] == 1 and summary['skipped'] == 2
+    assert len(imported(db)) == 3
+
+def test_registry_keyed_on_file_hash_alone_is_migrated(db, experiment_id, logs):
+    db.connection.execute("""
+        CREATE TABLE instrument_imports (
+            id INTEGER PRIMARY KEY, file_hash TEXT UNIQUE NOT NULL, file_path TEXT NOT NULL,
+            experiment_id INTEGER, rows_imported INTEGER, rows_unmapped INTEGER,
+            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.connection.execute("INSERT INTO instrument_imports (file_hash, file_path, experiment_id) VALUES (?, ?, ?)",
+                          (file_digest(logs[0]), logs[0], experiment_id))
+    db.connection.commit()
+    other = seed_experiment(db, code='E2', n_treatments=2, days=1)
+    importer = GasExchangeImporter(db, max_workers=1)
+    assert importer.import_files(logs[:1], experiment_id)['skipped'] == 1
+    assert not importer._hash_only_unique()
+    assert importer.import_files(logs[:1], other, default_treatment_id=None)['skipped'] == 0
@@ -0,0 +1,54 @@
+# test_leaf_images.py - LEAF SEGMENTATION AND AREA EXTRACTION
+import shutil
+
+import matplotlib.image as mpimg
+import numpy as np
+import pytest
+
+from leaf_images import LeafImageProcessor, segment_leaf_pixels
+
+def leaf_scan(path, leaf_pixels, seed=0):
+    """A white scan with a green leaf covering exactly leaf_pixels pixels"""
+    rng = np.random.default_rng(seed)
+    image = np.clip(0.95 + rng.normal(0, 0.01, (100, 120, 3)), 0, 1)
+    rows, cols = divmod(leaf_pixels, 100)
+    image[10:10 + rows, 10:110] = (0.2, 0.6, 0.15)
+    image[10 + rows, 10:10 + cols] = (0.2, 0.6, 0.15)
+    mpimg.imsave(path, image)
+    return str(path)
+
+def test_segmentation_counts_leaf_pixels():
+    image = np.ones((50, 50, 3))
+    image[5:25, 5:35] = (0.1, 0.5, 0.1)
+    assert segment_leaf_pixels(image).sum() == 600
+    assert segment_leaf_pixels(np.ones((20, 20, 3))).sum() == 0
+
+def test_areas_are_written_back_and_cached(db, experiment_id, tmp_path):
+    processor = LeafImageProcessor(db, max_workers=1, dpi=254)
+    first = leaf_scan(tmp_path / 'a.png', 2000)
+    second = leaf_scan(tmp_path / 'b.png', 500, seed=1)
+    duplicate = tmp_path / 'a_copy.png'
+    shutil.copy(first, duplicate)
+    assert processor.register_images(1, [first, second]) == 2
+    assert processor.register_images(2, [str(duplicate), str(tmp_path / 'gone.png')]) == 2
+    assert processor.register_images(1, [first]) == 0
+
+    summary = processor.process_images(experiment_id)
+    # The copy has the same content hash, so it is measured once
+    assert summary['processed'] == 2 and summary['missing'] == 1
+    area = dict(db.connection.execute("SELECT id, leaf_area FROM measurements WHERE id IN (1, 2)").fetchall())
+    # 254 dpi is 100 pixels per cm
+    assert area[1] == pytest.approx(0.25)
+    assert area[2] == pytest.approx(0.20)
+
+    again = processor.process_images(experiment_id)
+    assert again['processed'] == 0 and again['cached'] == 0
+
+def test_changed_image_is_remeasured(db, experiment_id, tmp_path):
+    processor = LeafImageProcessor(db, max_workers=1, dpi=254)
+    path = leaf_scan(tmp_path / 'leaf.png', 1000)
+    processor.register_images(3, [path])
+    processor.process_images(experiment_id)
+    leaf_scan(tmp_path / 'leaf.png', 3000)
+    assert processor.process_images(experiment_id)['processed'] == 1
+    assert db.connection.execute("SELECT leaf_area FROM measurements WHERE id = 3").fetchone()[0] == pytest.approx(0.3)
@@ -0,0 +1,54 @@
+# test_lookups.py - DICTIONARY-ENCODED TEXT ATTRIBUTES
+from analysis import StressAnalyzer
+from conftest import open_database, write_legacy_file
+
+def test_legacy_text_columns_are_backfilled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_legacy_file(tmp_path / 'legacy.db')
+    db = open_database(tmp_path / 'legacy.db')
+    rows = db.connection.execute("""
+        SELECT t.treatment_name, tt.name, sl.name
+        FROM treatments t
+        JOIN treatment_types tt ON tt.id = t.treatment_type_id
+        LEFT JOIN stress_levels sl ON sl.id = t.stress_level_id
+        ORDER BY t.treatment_name
+    """).fetchall()
+    assert rows == [('A', 'control', None), ('B', 'heat', '40C')]
+    species, = db.connection.execute("""
+        SELECT s.name FROM experiments e JOIN species s ON s.id = e.species_id
+    """).fetchone()
+    assert species == 'Maize'
+    db.close_connection()
+
+def test_triggers_keep_codes_in_step_with_text(db, experiment_id):
+    first = db.connection.execute("SELECT id, treatment_type_id FROM treatments ORDER BY id").fetchone()
+    db.connection.execute("UPDATE treatments SET treatment_type = 'salinity' WHERE id = ?", (first[0],))
+    db.connection.commit()
+    code = db.connection.execute("SELECT treatment_type_id FROM treatments WHERE id = ?", (first[0],)).fetchone()[0]
+    assert code != first[1]
+    assert db.lookup_names('treatment_types', [code])[code] == 'salinity'
+    # Names stay registered once used
+    assert db.lookup_id('treatment_types', 'control') == first[1]
+    assert db.lookup_id('treatment_types', 'never used') is None
+
+def test_each_name_is_stored_once(db):
+    for code in ('A', 'B', 'C'):
+        db.connection.execute("""
+            INSERT INTO experiments (experiment_code, experiment_name, plant_species, stress_type, researcher)
+            VALUES (?, 'Trial', 'Wheat', 'drought', 'Ann')
+        """, (code,))
+    db.connection.commit()
+    assert db.connection.execute("SELECT COUNT(*) FROM species").fetchone()[0] == 1
+    assert db.connection.execute("SELECT COUNT(DISTINCT species_id) FROM experiments").fetchone()[0] == 1
+
+def test_lookup_matches_ignores_case(db, experiment_id):
+    codes = db.lookup_matches('treatment_types', 'DROUGHT')
+    assert [db.lookup_names('treatment_types')[code] for code in codes] == ['drought']
+
+def test_reports_are_ordered_by_name_not_code(db, experiment_id):
+    # 'biotic' is registered after 'drought', so its code sorts after it
+    db.connection.execute("UPDATE treatments SET treatment_type = 'biotic' WHERE treatment_name = 'T3'")
+    db.connection.commit()
+    report = StressAnalyzer(db).stress_impact_analysis(experiment_id)
+    assert report['treatment_type'].tolist() == ['biotic', 'control', 'drought', 'drought']
+    assert report['treatment_name'].tolist() == ['T3', 'T0', 'T1', 'T2']
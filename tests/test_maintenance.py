@@ -0,0 +1,44 @@
+# test_maintenance.py - SCHEDULED MAINTENANCE TASKS AND HEALTH STATISTICS
+from maintenance import MaintenanceScheduler, TASK_INTERVALS
+
+def test_all_tasks_are_due_on_a_new_database(db):
+    assert sorted(MaintenanceScheduler(db).due_tasks()) == sorted(TASK_INTERVALS)
+
+def test_run_tasks_logs_results_and_reschedules(db, experiment_id):
+    scheduler = MaintenanceScheduler(db)
+    results = dict((task, result) for task, _, result in scheduler.run_tasks())
+    assert results['optimize'] == results['analyze'] == results['quick_check'] == 'ok'
+    # New databases are created with incremental auto-vacuum
+    assert results['incremental_vacuum'].startswith('released')
+    assert scheduler.due_tasks() == []
+    assert len(scheduler.get_log()) == len(TASK_INTERVALS)
+    # ANALYZE leaves statistics for the planner
+    assert db.connection.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+
+def test_incremental_vacuum_releases_free_pages(db, experiment_id):
+    scheduler = MaintenanceScheduler(db)
+    assert scheduler.enable_incremental_vacuum()
+    assert scheduler.database_stats()['auto_vacuum'] == 'incremental'
+    # The history triggers would otherwise reuse the freed pages
+    for table in ('measurements', 'change_history', 'deleted_rows'):
+        db.connection.execute(f"DELETE FROM {table}")
+    db.connection.commit()
+    assert scheduler.database_stats()['free_pages'] > 0
+
+    (task, _, result), = scheduler.run_tasks(['incremental_vacuum'])
+    assert result.startswith('released')
+    stats = scheduler.database_stats()
+    assert stats['free_pages'] == 0
+    before, after = db.connection.execute(
+        "SELECT free_pages_before, free_pages_after FROM maintenance_log WHERE task = 'incremental_vacuum'").fetchone()
+    assert before > 0 and after == 0
+
+def test_background_run_waits_for_idle(db):
+    scheduler = MaintenanceScheduler(db, idle_seconds=3600)
+    assert not scheduler.start_if_idle()
+    scheduler.idle_seconds = 0
+    results = []
+    assert scheduler.start_if_idle(on_done=results.append)
+    scheduler._thread.join(30)
+    assert not scheduler.is_running()
+    assert sorted(task for task, _, _ in results[0]) == sorted(TASK_INTERVALS)
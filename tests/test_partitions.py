@@ -0,0 +1,94 @@
+# test_partitions.py - ARCHIVING EXPERIMENTS TO PARTITION FILES AND RESTORING THEM
+import os
+
+from audit import ChangeHistory
+from partitions import PartitionManager
+from conftest import open_database, seed_experiment, write_legacy_file
+
+def _rows(db, experiment_id):
+    return db.connection.execute("""
+        SELECT m.id, m.treatment_id, m.plant_id, m.measurement_date, m.plant_height, m.notes
+        FROM measurements m JOIN treatments t ON t.id = m.treatment_id
+        WHERE t.experiment_id = ? ORDER BY m.id
+    """, (experiment_id,)).fetchall()
+
+def _history(db):
+    return db.connection.execute("""
+        SELECT table_name, row_id, operation, changed_at, old_values FROM change_history
+        WHERE table_name != 'experiments' ORDER BY id
+    """).fetchall()
+
+def test_archived_experiment_is_readable_through_its_partition(db, experiment_id):
+    before = _rows(db, experiment_id)
+    path = PartitionManager(db).archive_experiment(experiment_id)
+    assert os.path.exists(path)
+    assert _rows(db, experiment_id) == []
+    assert db.connection.execute("SELECT status FROM experiments").fetchone()[0] == 'archived'
+    # Archiving is not deletion
+    assert db.connection.execute("SELECT COUNT(*) FROM deleted_rows").fetchone()[0] == 0
+
+    assert db.use_experiment(experiment_id)
+    assert _rows(db, experiment_id) == before
+    db.detach_partition()
+
+def test_restore_keeps_ids_and_history(db, experiment_id):
+    first = db.connection.execute("SELECT MIN(id) FROM measurements").fetchone()[0]
+    db.connection.execute("UPDATE measurements SET notes = 'leaf curl' WHERE id = ?", (first,))
+    db.connection.execute("UPDATE treatments SET description = 'moved bench' WHERE treatment_name = 'T2'")
+    db.connection.commit()
+    rows, history = _rows(db, experiment_id), _history(db)
+    frames, watermarks = db.get_delta('lab')
+    db.save_export_watermarks('lab', watermarks)
+
+    manager = PartitionManager(db)
+    path = manager.archive_experiment(experiment_id)
+    assert _history(db) == []
+    counts = manager.restore_experiment(experiment_id)
+    assert counts['measurements'] == len(rows)
+    assert not os.path.exists(path)
+    assert manager.list_partitions() == []
+
+    assert _rows(db, experiment_id) == rows
+    assert sorted(_history(db)) == sorted(history)
+    assert db.connection.execute("SELECT status FROM experiments").fetchone()[0] == 'active'
+    changes = ChangeHistory(db).get_history('measurements', first)
+    assert changes[['column', 'old_value', 'new_value']].values.tolist() == [['notes', None, 'leaf curl']]
+    # Restored rows are stamped now, so the next delta carries them again
+    frames, _ = db.get_delta('lab')
+    assert {row[0] for row in rows} <= set(frames['measurements']['id'])
+    # Lookup codes are derived again for the restored treatments
+    assert db.connection.execute("SELECT COUNT(*) FROM treatments WHERE treatment_type_id IS NULL").fetchone()[0] == 0
+
+def test_archived_ids_are_not_reused(db):
+    archived = seed_experiment(db, code='OLD', n_treatments=2, days=3)
+    rows = _rows(db, archived)
+    manager = PartitionManager(db)
+    manager.archive_experiment(archived)
+    # The archived rows held the largest ids; new rows must not take them
+    other = seed_experiment(db, code='NEW', n_treatments=1, days=2)
+    assert min(row[0] for row in _rows(db, other)) > max(row[0] for row in rows)
+    assert min(db.connection.execute(
+        "SELECT id FROM treatments WHERE experiment_id = ?", (other,)).fetchone()) > max(row[1] for row in rows)
+
+    manager.restore_experiment(archived)
+    assert _rows(db, archived) == rows
+
+def test_older_files_are_migrated_to_ids_that_are_not_reused(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_legacy_file(tmp_path / 'legacy.db')
+    db = open_database(tmp_path / 'legacy.db')
+    schema = dict(db.connection.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'").fetchall())
+    assert all('AUTOINCREMENT' in schema[table] for table in ('treatments', 'plants', 'measurements'))
+    # Rows, references and triggers survive the rebuild
+    assert db.connection.execute("SELECT COUNT(*) FROM measurements WHERE plant_id IS NOT NULL").fetchone()[0] == 12
+    db.connection.execute("DELETE FROM measurements WHERE id = 12")
+    db.connection.commit()
+    assert db.connection.execute("SELECT row_id FROM deleted_rows").fetchall() == [(12,)]
+    new = db.connection.execute(
+        "INSERT INTO measurements (treatment_id, measurement_date) VALUES (1, '2023-06-15')").lastrowid
+    db.connection.commit()
+    assert new == 13
+    db.close_connection()
+    db = open_database(tmp_path / 'legacy.db')
+    assert db.connection.execute("SELECT COUNT(*) FROM measurements").fetchone()[0] == 12
+    db.close_connection()
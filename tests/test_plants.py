@@ -0,0 +1,51 @@
+# test_plants.py - PER-PLANT RECORDS AND REPEATED-MEASURES QUERIES
+import pytest
+
+from analysis import StressAnalyzer
+from conftest import open_database, write_legacy_file
+
+def test_legacy_measurements_are_assigned_inferred_plants(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_legacy_file(tmp_path / 'legacy.db')
+    db = open_database(tmp_path / 'legacy.db')
+    plants = db.connection.execute("""
+        SELECT t.treatment_name, p.plant_label, COUNT(m.id)
+        FROM plants p JOIN treatments t ON t.id = p.treatment_id
+        LEFT JOIN measurements m ON m.plant_id = p.id
+        GROUP BY p.id ORDER BY t.treatment_name, p.plant_label
+    """).fetchall()
+    assert plants == [(name, f"R{r}", 2) for name in ('A', 'B') for r in (1, 2, 3)]
+    # Replicate n on each date is the same plant
+    heights = db.connection.execute("""
+        SELECT COUNT(DISTINCT plant_height) FROM measurements GROUP BY plant_id
+    """).fetchall()
+    assert heights == [(1,)] * 6
+    db.close_connection()
+
+def test_get_or_create_plant_is_idempotent(db, experiment_id):
+    first = db.get_or_create_plant(1, 'P1', replicate=1, block='B1')
+    assert db.get_or_create_plant(1, 'P1') == first
+    assert db.get_or_create_plant(2, 'P1') != first
+
+def test_per_plant_growth_rates(db):
+    experiment_id = db.connection.execute("""
+        INSERT INTO experiments (experiment_code, experiment_name, plant_species, stress_type)
+        VALUES ('GR', 'Growth', 'Rice', 'cold')
+    """).lastrowid
+    treatment_id = db.connection.execute(
+        "INSERT INTO treatments (experiment_id, treatment_name, treatment_type) VALUES (?, 'cold', 'cold')",
+        (experiment_id,)).lastrowid
+    for label, rate in (('P1', 1.0), ('P2', 2.0), ('P3', 3.0)):
+        plant_id = db.get_or_create_plant(treatment_id, label)
+        for day in range(10):
+            db.connection.execute("""
+                INSERT INTO measurements (treatment_id, plant_id, measurement_date, plant_height)
+                VALUES (?, ?, date('2024-05-01', ?), ?)
+            """, (treatment_id, plant_id, f'+{day} days', 5 + rate * day))
+    db.connection.commit()
+
+    summary, per_plant = StressAnalyzer(db).calculate_plant_growth_rates(experiment_id)
+    assert per_plant.set_index('plant_label')['growth_rate'].to_dict() == {'P1': 1.0, 'P2': 2.0, 'P3': 3.0}
+    assert summary.loc['cold', 'plants'] == 3
+    assert summary.loc['cold', 'mean_growth_rate'] == pytest.approx(2.0)
+    assert per_plant['n'].tolist() == [10, 10, 10]
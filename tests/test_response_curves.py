@@ -0,0 +1,54 @@
+# test_response_curves.py - BATCHED A/Ci AND LIGHT-RESPONSE FITTING
+import numpy as np
+import pytest
+
+from response_curves import (ResponseCurveFitter, aci_model, light_model,
+                             batched_least_squares, initial_parameters)
+
+CI = np.array([50, 100, 150, 200, 300, 400, 600, 800, 1000, 1200.0])
+PAR = np.array([0, 25, 50, 100, 200, 400, 800, 1200, 1600, 2000.0])
+
+def test_light_fits_recover_parameters_for_a_batch():
+    rng = np.random.default_rng(0)
+    true = np.column_stack([rng.uniform(0.03, 0.07, 40), rng.uniform(15, 30, 40),
+                            rng.uniform(0.5, 0.9, 40), rng.uniform(0.5, 2, 40)])
+    x = np.tile(PAR, (40, 1))
+    y = light_model(x, true) + rng.normal(0, 0.1, x.shape)
+    mask = np.ones_like(x, dtype=bool)
+    params, _, converged = batched_least_squares('light', x, y, mask, initial_parameters('light', x, y, mask))
+    assert converged.all()
+    assert params[:, 1] == pytest.approx(true[:, 1], abs=2.0)
+    assert params[:, 3] == pytest.approx(true[:, 3], abs=0.5)
+
+def test_exact_fit_is_converged_and_stalled_fit_is_not():
+    x = np.tile(PAR, (2, 1))
+    exact = np.array([[0.05, 20.0, 0.7, 1.0]])
+    # Row 0 is fitted from its true parameters; row 1 wants Rd beyond its bound
+    y = np.vstack([light_model(x[:1], exact), np.full(len(PAR), -50.0)])
+    mask = np.ones_like(x, dtype=bool)
+    start = np.vstack([exact, initial_parameters('light', x[1:], y[1:], mask[1:])])
+    _, cost, converged = batched_least_squares('light', x, y, mask, start)
+    assert converged.tolist() == [True, False]
+    assert cost[1] > 1000
+
+def test_summary_groups_on_lookup_codes_and_refits_only_stale_curves(db, experiment_id):
+    fitter = ResponseCurveFitter(db, max_workers=1)
+    measurement_ids = [row[0] for row in db.connection.execute(
+        "SELECT MIN(id) FROM measurements GROUP BY treatment_id ORDER BY treatment_id")]
+    for i, measurement_id in enumerate(measurement_ids):
+        params = np.array([[60.0 - 10 * i, 120.0 - 15 * i, 1.0]])
+        fitter.add_curve(measurement_id, 'aci', zip(CI, aci_model(CI[None, :], params)[0]))
+    assert fitter.fit_curves('aci', experiment_id) == 4
+    assert fitter.fit_curves('aci', experiment_id) == 0
+
+    summary = fitter.curve_parameter_summary(experiment_id)
+    assert summary['treatment_type'].tolist() == ['control', 'drought', 'drought', 'drought']
+    assert summary['stress_level'].tolist() == ['control', 'high', 'high', 'high']
+    assert summary['aci_curves'].tolist() == [1, 1, 1, 1]
+    assert summary['avg_vcmax'].is_monotonic_decreasing
+
+    # Edited attributes are decoded from their new lookup code
+    db.connection.execute("UPDATE treatments SET stress_level = 'severe' WHERE treatment_name = 'T3'")
+    db.connection.commit()
+    summary = fitter.curve_parameter_summary(experiment_id)
+    assert summary.set_index('treatment_name').loc['T3', 'stress_level'] == 'severe'
@@ -0,0 +1,98 @@
+# test_result_cache.py - ANALYSIS RESULTS CACHED BY EXPERIMENT DATA VERSION
+import pandas as pd
+
+from analysis import StressAnalyzer
+from result_cache import AnalysisResultCache, decode_result, encode_result
+from conftest import seed_experiment
+
+def _compute(calls, value):
+    def compute():
+        calls.append(value)
+        return value
+    return compute
+
+def test_writes_to_the_experiment_invalidate_its_results(db, experiment_id):
+    other = seed_experiment(db, code='E2', n_treatments=2, days=3)
+    cache = AnalysisResultCache(db)
+    calls = []
+    assert cache.get_or_compute('means', experiment_id, {}, _compute(calls, 1)) == 1
+    assert cache.get_or_compute('means', experiment_id, {}, _compute(calls, 2)) == 1
+    assert calls == [1]
+
+    # Writes elsewhere leave the result current
+    db.connection.execute("""
+        UPDATE measurements SET plant_height = 1
+        WHERE treatment_id IN (SELECT id FROM treatments WHERE experiment_id = ?)
+    """, (other,))
+    db.connection.commit()
+    assert cache.get_or_compute('means', experiment_id, {}, _compute(calls, 3)) == 1
+
+    for statement in ("UPDATE measurements SET plant_height = 1 WHERE id = 1",
+                      "DELETE FROM measurements WHERE id = 2",
+                      "UPDATE treatments SET concentration = 5 WHERE id = 1"):
+        db.connection.execute(statement)
+        db.connection.commit()
+        calls.clear()
+        assert cache.get_or_compute('means', experiment_id, {}, _compute(calls, statement)) == statement
+        assert calls == [statement]
+    assert cache.stats()['means']['hits'] == 2
+
+def test_parameters_are_part_of_the_key(db, experiment_id):
+    cache = AnalysisResultCache(db)
+    assert cache.get_or_compute('fit', experiment_id, {'metric': 'a'}, lambda: 'a') == 'a'
+    assert cache.get_or_compute('fit', experiment_id, {'metric': 'b'}, lambda: 'b') == 'b'
+    assert cache.stats()['fit']['entries'] == 2
+
+def test_least_recently_used_results_are_evicted(db, experiment_id):
+    cache = AnalysisResultCache(db, max_bytes=2500)
+    for name in ('a', 'b', 'c'):
+        cache.get_or_compute(name, experiment_id, {}, lambda: 'x' * 1000)
+    stats = cache.stats()
+    assert stats['a']['evictions'] == 1 and stats['a']['entries'] == 0
+    assert stats['c']['entries'] == 1
+    # Results larger than the whole budget are returned but not stored
+    cache.get_or_compute('big', experiment_id, {}, lambda: 'x' * 5000)
+    assert cache.stats()['big']['entries'] == 0
+
+def test_failed_analyses_are_not_cached(db, experiment_id):
+    cache = AnalysisResultCache(db)
+    calls = []
+    cache.get_or_compute('none', experiment_id, {}, _compute(calls, None))
+    cache.get_or_compute('none', experiment_id, {}, _compute(calls, None))
+    assert calls == [None, None]
+
+def test_decorated_analyses_are_served_from_the_cache(db, experiment_id):
+    analyzer = StressAnalyzer(db)
+    first = analyzer.calculate_growth_rates(experiment_id)
+    assert analyzer.calculate_growth_rates(experiment_id).equals(first)
+    assert analyzer.results.stats()['growth_rates']['hits'] == 1
+    analyzer.results.clear(experiment_id)
+    assert analyzer.results.stats()['growth_rates']['entries'] == 0
+    analyzer.results.enabled = False
+    assert analyzer.calculate_growth_rates(experiment_id).equals(first)
+    assert analyzer.results.stats()['growth_rates']['misses'] == 1
+
+def test_results_vanish_with_their_experiment(db, experiment_id):
+    db.connection.execute("PRAGMA foreign_keys = ON")
+    cache = AnalysisResultCache(db)
+    cache.get_or_compute('means', experiment_id, {}, lambda: 1)
+    db.connection.execute("DELETE FROM experiments WHERE id = ?", (experiment_id,))
+    db.connection.commit()
+    assert cache.stats()['means']['entries'] == 0
+
+def test_results_are_stored_as_data_not_pickles(db, experiment_id):
+    frame = pd.DataFrame({'treatment': ['T0', 'T1'], 'rate': [0.1, 1 / 3], 'n': [3, 4],
+                          'date': pd.to_datetime(['2024-01-01', '2024-01-02'])})
+    decoded = decode_result(encode_result(frame))
+    pd.testing.assert_frame_equal(decoded, frame)
+    assert decode_result(encode_result({'p': 0.05, 'groups': ['a', 'b']})) == {'p': 0.05, 'groups': ['a', 'b']}
+    # Anything JSON cannot hold is computed each time rather than pickled
+    cache = AnalysisResultCache(db)
+    cache.get_or_compute('object', experiment_id, {}, lambda: object())
+    assert cache.stats()['object']['entries'] == 0
+
+    # Grouped results keep their named index and two-level columns
+    rates = StressAnalyzer(db).calculate_growth_rates(experiment_id)
+    stored, = db.connection.execute(
+        "SELECT result FROM analysis_results WHERE analysis = 'growth_rates'").fetchone()
+    pd.testing.assert_frame_equal(decode_result(stored), rates)
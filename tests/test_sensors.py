@@ -0,0 +1,101 @@
+# test_sensors.py - CHUNKED SENSOR STORE AND AS-OF JOINS
+import numpy as np
+import pandas as pd
+import pytest
+
+from sensors import SensorStore
+
+@pytest.fixture
+def store(db, experiment_id):
+    return SensorStore(db)
+
+def minute_series(start, days, seed=0):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=days * 1440, freq='min')
+    values = 20 + 5 * np.sin(np.arange(len(times)) / 1440 * 2 * np.pi) + rng.normal(0, 0.2, len(times))
+    return times, values.astype(np.float32).astype(float)
+
+def test_ingest_round_trips_across_chunks(store, experiment_id):
+    series_id = store.get_or_create_series(experiment_id, 'temperature', unit='C')
+    times, values = minute_series('2024-01-01', 3)
+    assert store.ingest(series_id, times, values) == len(times)
+    chunks = store.db.connection.execute(
+        "SELECT COUNT(*), SUM(n_points) FROM sensor_chunks WHERE series_id = ?", (series_id,)).fetchone()
+    assert chunks == (3, len(times))
+    loaded = store.load_series(series_id, '2024-01-01 12:00', '2024-01-02 12:00')
+    assert len(loaded) == 1440
+    assert loaded['value'].to_numpy() == pytest.approx(values[720:2160])
+
+def test_overlapping_ingest_keeps_stored_readings_and_later_values_win(store, experiment_id):
+    series_id = store.get_or_create_series(experiment_id, 'humidity')
+    times, values = minute_series('2024-01-01', 2)
+    store.ingest(series_id, times[:1800], values[:1800])
+    # Overlaps the stored tail and extends it; overlapping minutes are corrected
+    store.ingest(series_id, times[1500:], values[1500:] + 1.0)
+    loaded = store.load_series(series_id)
+    assert len(loaded) == len(times)
+    assert loaded['value'].to_numpy()[:1500] == pytest.approx(values[:1500])
+    assert loaded['value'].to_numpy()[1500:] == pytest.approx(values[1500:] + 1.0)
+
+def test_window_means_and_asof_values_match_pandas(db, store, experiment_id):
+    shared = store.get_or_create_series(experiment_id, 'temperature')
+    times, values = minute_series('2023-12-31', 32)
+    store.ingest(shared, times, values)
+    # Treatment T1 has its own logger, which must win over the shared one
+    own = store.get_or_create_series(experiment_id, 'temperature', treatment_id=2, logger_id='L2')
+    store.ingest(own, times, values + 10)
+
+    result = store.attach_to_measurements(experiment_id, window_hours=24, anchor_hour=12)
+    raw = pd.Series(values, index=times)
+    for row in result.sample(20, random_state=0).itertuples():
+        anchor = pd.Timestamp(row.measurement_date) + pd.Timedelta(hours=12)
+        window = raw[(raw.index >= anchor - pd.Timedelta(hours=24)) & (raw.index <= anchor)]
+        offset = 10 if row.treatment_id == 2 else 0
+        assert row.temperature_n == len(window)
+        assert row.temperature_mean == pytest.approx(window.mean() + offset, abs=1e-3)
+        assert row.temperature_asof == pytest.approx(raw[anchor] + offset, abs=1e-3)
+
+def test_asof_respects_tolerance(store, experiment_id):
+    series_id = store.get_or_create_series(experiment_id, 'par')
+    # A single reading two days before the first measurement anchor
+    store.ingest(series_id, pd.to_datetime(['2023-12-30 12:00']), [800.0])
+    result = store.attach_to_measurements(experiment_id, asof_tolerance_hours=6)
+    assert result['par_asof'].isna().all()
+    assert (result['par_n'] == 0).all()
+
+def test_pyramid_buckets_match_pandas_resampling(store, experiment_id):
+    series_id = store.get_or_create_series(experiment_id, 'vpd')
+    times, values = minute_series('2024-01-03', 21)
+    store.ingest(series_id, times, values)
+    raw = pd.Series(values, index=times)
+
+    daily = store.query_series(series_id, '2024-01-03', '2024-01-24', level='day')
+    expected = raw.resample('D').agg(['mean', 'min', 'max', 'count'])
+    assert daily['mean'].to_numpy() == pytest.approx(expected['mean'].to_numpy(), rel=1e-5)
+    assert daily['min'].to_numpy() == pytest.approx(expected['min'].to_numpy())
+    assert daily['max'].to_numpy() == pytest.approx(expected['max'].to_numpy())
+    assert daily['n'].tolist() == expected['count'].tolist()
+
+    # Weeks start on Monday
+    weekly = store.query_series(series_id, '2024-01-01', '2024-01-29', level='week')
+    assert weekly['timestamp'].dt.dayofweek.eq(0).all()
+    assert weekly['n'].sum() == len(times)
+
+def test_query_level_follows_pixel_width(store, experiment_id):
+    series_id = store.get_or_create_series(experiment_id, 'soil_moisture')
+    times, values = minute_series('2024-01-01', 14)
+    store.ingest(series_id, times, values)
+    assert store.query_series(series_id, pixel_width=20000).attrs['level'] == 'raw'
+    hourly = store.query_series(series_id, pixel_width=500)
+    assert hourly.attrs['level'] == 'hour' and len(hourly) == 14 * 24
+    assert store.query_series(series_id, pixel_width=5).attrs['level'] == 'week'
+
+def test_reingest_refreshes_affected_buckets_only(store, experiment_id):
+    series_id = store.get_or_create_series(experiment_id, 'temperature', logger_id='L9')
+    times, values = minute_series('2024-01-01', 14)
+    store.ingest(series_id, times, values)
+    store.ingest(series_id, times[:60], values[:60] + 100)
+    hourly = store.query_series(series_id, '2024-01-01', '2024-01-15', level='hour')
+    assert hourly['mean'].iloc[0] == pytest.approx(values[:60].mean() + 100, rel=1e-5)
+    assert hourly['mean'].iloc[1] == pytest.approx(values[60:120].mean(), rel=1e-5)
+    assert hourly['n'].sum() == len(times)
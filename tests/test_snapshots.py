@@ -0,0 +1,53 @@
+# test_snapshots.py - IN-MEMORY ANALYSIS SNAPSHOTS
+from analysis import StressAnalyzer
+from partitions import PartitionManager
+from snapshots import SnapshotManager
+from conftest import seed_experiment
+
+def _count(database, table):
+    return database.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_experiment_snapshot_holds_only_that_experiment(db, experiment_id):
+    other = seed_experiment(db, code='E2', n_treatments=2, days=3)
+    snapshot = SnapshotManager(db).load(experiment_id)
+    assert _count(snapshot, 'measurements') == 4 * 30 * 3
+    assert snapshot.connection.execute("SELECT id FROM experiments").fetchall() == [(experiment_id,)]
+    assert _count(snapshot, 'change_history') == 0
+    assert snapshot.data_version(experiment_id) == db.data_version(experiment_id)
+    assert snapshot.data_version(other) == 0
+
+def test_snapshots_are_reused_until_the_data_changes(db, experiment_id):
+    manager = SnapshotManager(db)
+    first = manager.load(experiment_id)
+    assert manager.load(experiment_id) is first
+    db.connection.execute("UPDATE measurements SET plant_height = 1 WHERE id = 1")
+    db.connection.commit()
+    second = manager.load(experiment_id)
+    assert second is not first and first.released
+    assert second.connection.execute("SELECT plant_height FROM measurements WHERE id = 1").fetchone()[0] == 1
+
+def test_whole_database_snapshot(db, experiment_id):
+    snapshot = SnapshotManager(db).load()
+    assert _count(snapshot, 'measurements') == _count(db, 'measurements')
+
+def test_snapshots_over_budget_are_released(db, experiment_id):
+    other = seed_experiment(db, code='E2', n_treatments=2, days=3)
+    manager = SnapshotManager(db, max_bytes=1)
+    first = manager.load(experiment_id)
+    manager.load(other)
+    assert first.released
+    assert list(manager.snapshots) == [other]
+
+def test_archived_experiment_snapshot_uses_the_result_cache(db, experiment_id, capsys):
+    PartitionManager(db).archive_experiment(experiment_id)
+    analyzer = StressAnalyzer(db)
+    snapshot = analyzer.use_snapshot(experiment_id)
+    assert _count(snapshot, 'measurements') == 4 * 30 * 3
+    assert snapshot.data_version(experiment_id) == db.data_version(experiment_id)
+
+    first = analyzer.calculate_growth_rates(experiment_id)
+    second = analyzer.calculate_growth_rates(experiment_id)
+    assert first is not None and second.equals(first)
+    assert analyzer.results.stats()['growth_rates']['hits'] == 1
+    assert 'cache error' not in capsys.readouterr().out
+    analyzer.use_live()
@@ -0,0 +1,52 @@
+# test_timeseries.py - WINDOW-FUNCTION ANALYTICS AGAINST PANDAS
+import pandas as pd
+import pytest
+
+from timeseries import TimeSeriesAnalyzer
+
+@pytest.fixture
+def series(db, experiment_id):
+    return TimeSeriesAnalyzer(db)
+
+def daily_means(db, experiment_id, metric):
+    df = pd.read_sql_query(f"""
+        SELECT m.treatment_id, m.measurement_date, AVG(m.{metric}) AS value
+        FROM measurements m JOIN treatments t ON t.id = m.treatment_id
+        WHERE t.experiment_id = ? GROUP BY m.treatment_id, m.measurement_date
+        ORDER BY m.treatment_id, m.measurement_date
+    """, db.connection, params=(experiment_id,))
+    return df
+
+def test_rolling_mean_matches_pandas(series, experiment_id):
+    result = series.benchmark_against_pandas(experiment_id, 'plant_height', window_days=7, repeats=1)
+    assert result['results_match']
+    assert result['rows'] == 4 * 30
+
+def test_rolling_window_uses_calendar_days(db, series, experiment_id):
+    # A gap in the series must shrink the window rather than reach further back
+    db.connection.execute("""
+        DELETE FROM measurements WHERE measurement_date BETWEEN '2024-01-05' AND '2024-01-09'
+    """)
+    db.connection.commit()
+    df = series.rolling_mean(experiment_id, 'plant_height', window_days=3)
+    row = df[(df.treatment_id == 1) & (df.measurement_date == '2024-01-10')].iloc[0]
+    assert row.days_in_window == 1
+    assert row.rolling_mean == pytest.approx(row.value)
+
+def test_lag_lead_changes(db, series, experiment_id):
+    df = series.lag_lead_changes(experiment_id, 'leaf_area')
+    expected = daily_means(db, experiment_id, 'leaf_area')
+    expected['change'] = expected.groupby('treatment_id')['value'].diff()
+    assert df['change'].isna().sum() == 4
+    assert df['change'].dropna().values == pytest.approx(expected['change'].dropna().values, abs=1e-3)
+    assert (df['days_elapsed'].dropna() == 1).all()
+
+def test_cumulative_metrics(db, series, experiment_id):
+    df = series.cumulative_metrics(experiment_id, 'biomass_fresh')
+    expected = daily_means(db, experiment_id, 'biomass_fresh')
+    expected['cumulative_sum'] = expected.groupby('treatment_id')['value'].cumsum()
+    assert df['cumulative_sum'].values == pytest.approx(expected['cumulative_sum'].values, abs=1e-3)
+    assert df.groupby('treatment_id')['day_index'].max().tolist() == [30] * 4
+
+def test_unknown_metric_is_rejected(series, experiment_id):
+    assert series.rolling_mean(experiment_id, 'plant_height; DROP TABLE measurements') is None
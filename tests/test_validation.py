@@ -0,0 +1,62 @@
+# test_validation.py - RANGE, CROSS-FIELD AND OUTLIER FLAGS WITH INCREMENTAL RE-CHECKS
+from validation import MeasurementValidator
+
+def _group(db, date='2024-01-05'):
+    """Ids of the T1 measurements on one date (a treatment-date group of three replicates)"""
+    return [row[0] for row in db.connection.execute("""
+        SELECT m.id FROM measurements m JOIN treatments t ON t.id = m.treatment_id
+        WHERE t.treatment_name = 'T1' AND m.measurement_date = ? ORDER BY m.id
+    """, (date,)).fetchall()]
+
+def _add_replicate(db, measurement_id, height):
+    return db.connection.execute("""
+        INSERT INTO measurements (treatment_id, measurement_date, plant_height)
+        SELECT treatment_id, measurement_date, ? FROM measurements WHERE id = ?
+    """, (height, measurement_id)).lastrowid
+
+def _outliers(db):
+    return {row[0] for row in db.connection.execute(
+        "SELECT measurement_id FROM measurement_flags WHERE rule = 'outlier' AND metric = 'plant_height'")}
+
+def test_check_values_reports_range_and_cross_field_problems():
+    validator = MeasurementValidator(None)
+    problems = validator.check_values({'plant_height': -1, 'biomass_fresh': 1.0, 'biomass_dry': 2.0})
+    assert any('plant height' in p for p in problems)
+    assert any('biomass dry' in p for p in problems)
+    assert validator.check_values({'plant_height': 12.0}) == []
+
+def test_first_pass_covers_existing_rows(db, experiment_id):
+    measurement_id = _group(db)[0]
+    db.connection.execute("UPDATE measurements SET chlorophyll_content = 150 WHERE id = ?", (measurement_id,))
+    db.connection.commit()
+    flags = MeasurementValidator(db).get_flags(experiment_id, rules=['above_range'])
+    assert flags['measurement_id'].tolist() == [measurement_id]
+
+def _group_with_outlier(db, validator):
+    """Four-row treatment-date group whose last row is a plant-height outlier; returns the ids"""
+    ids = _group(db)
+    for measurement_id, height in zip(ids, (10.0, 10.0, 10.2)):
+        db.connection.execute("UPDATE measurements SET plant_height = ? WHERE id = ?", (height, measurement_id))
+    ids.append(_add_replicate(db, ids[0], 30.0))
+    db.connection.commit()
+    validator.validate()
+    assert _outliers(db) == {ids[-1]}
+    return ids
+
+def test_deleting_a_row_rechecks_its_group(db, experiment_id):
+    validator = MeasurementValidator(db)
+    ids = _group_with_outlier(db, validator)
+    # Three rows are too few to judge outliers, so the remaining flag is stale
+    db.connection.execute("DELETE FROM measurements WHERE id = ?", (ids[0],))
+    db.connection.commit()
+    validator.validate()
+    assert _outliers(db) == set()
+
+def test_moving_a_row_rechecks_the_group_it_left(db, experiment_id):
+    validator = MeasurementValidator(db)
+    ids = _group_with_outlier(db, validator)
+    db.connection.execute("UPDATE measurements SET measurement_date = '2024-01-06' WHERE id = ?", (ids[0],))
+    db.connection.commit()
+    validator.validate()
+    assert _outliers(db) == set()
+    assert db.connection.execute("SELECT COUNT(*) FROM validation_group_queue").fetchone()[0] == 0
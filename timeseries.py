@@ -0,0 +1,159 @@
+# timeseries.py - SQLITE WINDOW-FUNCTION TIME SERIES ANALYTICS
+import time
+import pandas as pd
+
+from database_sqlite import MEASUREMENT_COLUMNS
+
+class TimeSeriesAnalyzer:
+    """Lag/lead, rolling and cumulative metrics computed inside SQLite.
+
+    Replicate measurements are first collapsed to one daily mean per
+    treatment, then window functions run over the
+    (treatment_id, measurement_date) ordering so only the compact daily
+    series ever leaves the database. Requires SQLite 3.28+ for RANGE frames.
+    """
+
+    # Daily mean per treatment; {metric} is validated before formatting
+    DAILY_CTE = """
+        WITH daily AS (
+            SELECT m.treatment_id, t.treatment_name, m.measurement_date,
+                   julianday(m.measurement_date) AS day_number,
+                   AVG(m.{metric}) AS value,
+                   COUNT(m.{metric}) AS n
+            FROM measurements m
+            JOIN treatments t ON m.treatment_id = t.id
+            WHERE t.experiment_id = ? AND m.{metric} IS NOT NULL
+            GROUP BY m.treatment_id, m.measurement_date
+        )
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    def _check_metric(self, metric):
+        """Only allow real measurement columns to be formatted into SQL"""
+        if metric not in MEASUREMENT_COLUMNS:
+            raise ValueError(f"Unknown metric '{metric}'")
+
+    def _run(self, query, params):
+        return pd.read_sql_query(query, self.db.connection, params=params)
+
+    def lag_lead_changes(self, experiment_id, metric, periods=1):
+        """Change since the previous measurement day and to the next one"""
+        try:
+            self._check_metric(metric)
+            query = self.DAILY_CTE.format(metric=metric) + """
+                SELECT treatment_id, treatment_name, measurement_date, value, n,
+                       LAG(value, ?) OVER w AS previous_value,
+                       LEAD(value, ?) OVER w AS next_value,
+                       value - LAG(value, ?) OVER w AS change,
+                       day_number - LAG(day_number, ?) OVER w AS days_elapsed,
+                       (value - LAG(value, ?) OVER w)
+                           / NULLIF(day_number - LAG(day_number, ?) OVER w, 0) AS change_per_day
+                FROM daily
+                WINDOW w AS (PARTITION BY treatment_id ORDER BY measurement_date)
+                ORDER BY treatment_id, measurement_date
+            """
+            params = (experiment_id,) + (periods,) * 6
+            return self._run(query, params).round(4)
+
+        except Exception as e:
+            print(f"Error calculating lag/lead changes: {e}")
+            return None
+
+    def rolling_mean(self, experiment_id, metric, window_days=7):
+        """Calendar-day rolling mean/min/max ending on each measurement day"""
+        try:
+            self._check_metric(metric)
+            window = int(window_days) - 1
+            if window < 0:
+                raise ValueError("window_days must be at least 1")
+            # Frame offsets cannot be bound parameters, so the validated int is inlined
+            query = self.DAILY_CTE.format(metric=metric) + f"""
+                SELECT treatment_id, treatment_name, measurement_date, value,
+                       AVG(value) OVER w AS rolling_mean,
+                       MIN(value) OVER w AS rolling_min,
+                       MAX(value) OVER w AS rolling_max,
+                       COUNT(value) OVER w AS days_in_window
+                FROM daily
+                WINDOW w AS (PARTITION BY treatment_id ORDER BY day_number
+                             RANGE BETWEEN {window} PRECEDING AND CURRENT ROW)
+                ORDER BY treatment_id, measurement_date
+            """
+            return self._run(query, (experiment_id,)).round(4)
+
+        except Exception as e:
+            print(f"Error calculating rolling mean: {e}")
+            return None
+
+    def cumulative_metrics(self, experiment_id, metric):
+        """Running total, mean, max and change from the first measurement day"""
+        try:
+            self._check_metric(metric)
+            query = self.DAILY_CTE.format(metric=metric) + """
+                SELECT treatment_id, treatment_name, measurement_date, value,
+                       SUM(value) OVER w AS cumulative_sum,
+                       AVG(value) OVER w AS cumulative_mean,
+                       MAX(value) OVER w AS cumulative_max,
+                       value - FIRST_VALUE(value) OVER w AS change_from_start,
+                       ROW_NUMBER() OVER w AS day_index
+                FROM daily
+                WINDOW w AS (PARTITION BY treatment_id ORDER BY measurement_date
+                             ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+                ORDER BY treatment_id, measurement_date
+            """
+            return self._run(query, (experiment_id,)).round(4)
+
+        except Exception as e:
+            print(f"Error calculating cumulative metrics: {e}")
+            return None
+
+    def _pandas_rolling_mean(self, experiment_id, metric, window_days):
+        """Reference implementation: pull raw rows and roll in pandas"""
+        query = f"""
+            SELECT m.treatment_id, m.measurement_date, m.{metric} AS value
+            FROM measurements m
+            JOIN treatments t ON m.treatment_id = t.id
+            WHERE t.experiment_id = ? AND m.{metric} IS NOT NULL
+        """
+        df = self._run(query, (experiment_id,))
+        df['measurement_date'] = pd.to_datetime(df['measurement_date'])
+        daily = (df.groupby(['treatment_id', 'measurement_date'])['value']
+                   .mean().reset_index()
+                   .sort_values(['treatment_id', 'measurement_date']))
+        rolled = (daily.set_index('measurement_date')
+                       .groupby('treatment_id')['value']
+                       .rolling(f'{window_days}D').mean())
+        return rolled.reset_index(name='rolling_mean')
+
+    def benchmark_against_pandas(self, experiment_id, metric, window_days=7, repeats=3):
+        """Time the SQL rolling mean against the pandas equivalent"""
+        try:
+            self._check_metric(metric)
+            timings = {}
+            for label, func in (('sqlite', self.rolling_mean),
+                                ('pandas', self._pandas_rolling_mean)):
+                best = None
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    result = func(experiment_id, metric, window_days)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[label] = (best, result)
+
+            sql_df, pandas_df = timings['sqlite'][1], timings['pandas'][1]
+            matches = (len(sql_df) == len(pandas_df) and
+                       ((sql_df['rolling_mean'].values -
+                         pandas_df['rolling_mean'].round(4).values) ** 2).sum() < 1e-6)
+
+            return {
+                'rows': len(sql_df),
+                'sqlite_seconds': round(timings['sqlite'][0], 4),
+                'pandas_seconds': round(timings['pandas'][0], 4),
+                'speedup': round(timings['pandas'][0] / max(timings['sqlite'][0], 1e-9), 2),
+                'results_match': bool(matches)
+            }
+
+        except Exception as e:
+            print(f"Error benchmarking time-series queries: {e}")
+            return None
@@ -0,0 +1,233 @@
+# validation.py - VECTORISED MEASUREMENT VALIDATION AND OUTLIER FLAGGING
+import numpy as np
+import pandas as pd
+
+from database_sqlite import MEASUREMENT_COLUMNS
+
+# Physically plausible (min, max) per metric; None means unbounded on that side
+RANGE_RULES = {
+    'plant_height': (0, 1000),             # cm
+    'leaf_area': (0, None),                # cm²
+    'chlorophyll_content': (0, 100),       # SPAD units
+    'photosynthesis_rate': (-10, 80),      # µmol/m²/s, small negative values are respiration
+    'stomatal_conductance': (0, 5),        # mol/m²/s
+    'root_length': (0, 1000),              # cm
+    'biomass_fresh': (0, None),            # g
+    'biomass_dry': (0, None),              # g
+    'water_content': (0, 100)              # %
+}
+
+# Tolerance (percentage points) between entered and fresh/dry-implied water content
+WATER_CONTENT_TOLERANCE = 5.0
+
+def _cross_field_rules(frame):
+    """(rule, metric, mask, detail) for every cross-field constraint"""
+    fresh, dry, water = frame['biomass_fresh'], frame['biomass_dry'], frame['water_content']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        implied = (fresh - dry) / fresh * 100
+    return [
+        ('dry_exceeds_fresh', 'biomass_dry', dry > fresh,
+         'Dry biomass greater than fresh biomass'),
+        ('water_content_mismatch', 'water_content',
+         (fresh > 0) & ((water - implied).abs() > WATER_CONTENT_TOLERANCE),
+         'Water content disagrees with fresh/dry biomass')
+    ]
+
+class MeasurementValidator:
+    """Range, cross-field and outlier checks over the whole measurements table.
+
+    Every rule is a vectorised mask over a DataFrame, so a full pass is a handful
+    of column operations. Outliers are judged within each treatment and date
+    (robust z-score from the MAD, or Tukey's IQR fences). Problems are written
+    to measurement_flags. Triggers queue the treatment-date groups touched by
+    inserts, edits (old and new group) and deletes, and an incremental pass
+    re-checks only those groups.
+    """
+
+    def __init__(self, database, outlier_method='mad', threshold=None, min_group_size=4):
+        if outlier_method not in ('mad', 'iqr'):
+            raise ValueError("outlier_method must be 'mad' or 'iqr'")
+        self.db = database
+        self.outlier_method = outlier_method
+        self.threshold = threshold if threshold is not None else (3.5 if outlier_method == 'mad' else 1.5)
+        self.min_group_size = min_group_size
+        self._tables_ready = False
+
+    def create_tables(self):
+        """Create the flag table and the queue of treatment-date groups awaiting validation"""
+        if self._tables_ready:
+            return
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS measurement_flags (
+                id INTEGER PRIMARY KEY,
+                measurement_id INTEGER NOT NULL,
+                rule TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                value REAL,
+                detail TEXT,
+                flagged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (measurement_id) REFERENCES measurements (id) ON DELETE CASCADE,
+                UNIQUE(measurement_id, rule, metric)
+            )
+        """)
+        exists = self.db.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'validation_group_queue'").fetchone()
+        self.db.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS validation_group_queue (
+                treatment_id INTEGER NOT NULL,
+                measurement_date TEXT NOT NULL,
+                PRIMARY KEY (treatment_id, measurement_date)
+            ) WITHOUT ROWID
+        """)
+        # Outliers depend on the whole group, so triggers queue the treatment-date groups a
+        # write touches: the new group of an inserted row, both groups of an edited one and
+        # the old group of a deleted one (its remaining rows may no longer be outliers)
+        group = "INSERT OR IGNORE INTO validation_group_queue (treatment_id, measurement_date) VALUES ({0}.treatment_id, {0}.measurement_date);"
+        self.db.cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS main.trg_validation_insert
+            AFTER INSERT ON measurements
+            BEGIN
+                {group.format('NEW')}
+            END
+        """)
+        self.db.cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS main.trg_validation_update
+            AFTER UPDATE OF treatment_id, measurement_date, {', '.join(MEASUREMENT_COLUMNS)} ON measurements
+            BEGIN
+                {group.format('OLD')}
+                {group.format('NEW')}
+            END
+        """)
+        self.db.cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS main.trg_validation_delete
+            AFTER DELETE ON measurements
+            BEGIN
+                {group.format('OLD')}
+            END
+        """)
+        if not exists:
+            # Rows that predate the triggers still need their first pass
+            self.db.cursor.execute("""
+                INSERT OR IGNORE INTO validation_group_queue (treatment_id, measurement_date)
+                SELECT DISTINCT treatment_id, measurement_date FROM main.measurements
+            """)
+        self.db.connection.commit()
+        self._tables_ready = True
+
+    def evaluate(self, frame):
+        """Flags for a DataFrame of measurements; returns a DataFrame of measurement_id, rule, metric, value, detail"""
+        flags = []
+
+        def collect(rule, metric, mask, detail):
+            hit = frame.loc[mask.fillna(False).to_numpy(dtype=bool)]
+            if not hit.empty:
+                flags.append(pd.DataFrame({
+                    'measurement_id': hit['id'].to_numpy(), 'rule': rule, 'metric': metric,
+                    'value': hit[metric].to_numpy(dtype=float), 'detail': detail
+                }))
+
+        for metric, (low, high) in RANGE_RULES.items():
+            values = frame[metric]
+            if low is not None:
+                collect('below_range', metric, values < low, f"Below physical minimum {low}")
+            if high is not None:
+                collect('above_range', metric, values > high, f"Above physical maximum {high}")
+
+        for rule, metric, mask, detail in _cross_field_rules(frame):
+            collect(rule, metric, mask, detail)
+
+        groups = frame.groupby(['treatment_id', 'measurement_date'])
+        for metric in MEASUREMENT_COLUMNS:
+            values = frame[metric]
+            grouped = groups[metric]
+            size = grouped.transform('count')
+            if self.outlier_method == 'mad':
+                median = grouped.transform('median')
+                mad = (values - median).abs().groupby([frame['treatment_id'], frame['measurement_date']]).transform('median')
+                score = 0.6745 * (values - median).abs() / mad.where(mad > 0)
+                mask = (size >= self.min_group_size) & (score > self.threshold)
+                detail = f"Robust z-score above {self.threshold} within treatment-date"
+            else:
+                q1, q3 = grouped.transform('quantile', 0.25), grouped.transform('quantile', 0.75)
+                spread = self.threshold * (q3 - q1)
+                mask = (size >= self.min_group_size) & (spread > 0) & ((values < q1 - spread) | (values > q3 + spread))
+                detail = f"Outside {self.threshold} x IQR fences within treatment-date"
+            collect('outlier', metric, mask, detail)
+
+        if not flags:
+            return pd.DataFrame(columns=['measurement_id', 'rule', 'metric', 'value', 'detail'])
+        return pd.concat(flags, ignore_index=True)
+
+    def check_values(self, values):
+        """Range and cross-field problems for one set of form values; returns a list of messages"""
+        frame = pd.DataFrame([{'id': 0, 'treatment_id': 0, 'measurement_date': '',
+                               **{metric: values.get(metric) for metric in MEASUREMENT_COLUMNS}}])
+        frame[list(MEASUREMENT_COLUMNS)] = frame[list(MEASUREMENT_COLUMNS)].astype(float)
+        flags = self.evaluate(frame)
+        return [f"{row.metric.replace('_', ' ')}: {row.detail}" for row in flags.itertuples()
+                if row.rule != 'outlier']
+
+    def validate(self, full=False):
+        """Validate queued (or, with full=True, all) measurements; returns the number of flags written"""
+        try:
+            self.create_tables()
+            columns = ', '.join(f"m.{c}" for c in ('id', 'treatment_id', 'measurement_date') + tuple(MEASUREMENT_COLUMNS))
+            if full:
+                frame = pd.read_sql_query(f"SELECT {columns} FROM main.measurements m", self.db.connection)
+            else:
+                frame = pd.read_sql_query(f"""
+                    SELECT {columns}
+                    FROM main.measurements m
+                    JOIN validation_group_queue g
+                      ON m.treatment_id = g.treatment_id AND m.measurement_date = g.measurement_date
+                """, self.db.connection)
+            flags = self.evaluate(frame)
+
+            with self.db.connection:
+                if full:
+                    self.db.connection.execute("DELETE FROM measurement_flags")
+                else:
+                    self.db.connection.executemany(
+                        "DELETE FROM measurement_flags WHERE measurement_id = ?",
+                        [(int(i),) for i in frame['id']])
+                self.db.connection.executemany("""
+                    INSERT OR REPLACE INTO measurement_flags (measurement_id, rule, metric, value, detail)
+                    VALUES (?, ?, ?, ?, ?)
+                """, [(int(row.measurement_id), row.rule, row.metric,
+                       None if pd.isna(row.value) else float(row.value), row.detail)
+                      for row in flags.itertuples()])
+                self.db.connection.execute("DELETE FROM validation_group_queue")
+            return len(flags)
+
+        except Exception as e:
+            print(f"Error validating measurements: {e}")
+            return None
+
+    def get_flags(self, experiment_id, rules=None):
+        """Flagged measurements for an experiment, validating queued rows first"""
+        try:
+            self.validate()
+            query = """
+                SELECT f.measurement_id, t.treatment_name, m.measurement_date,
+                       f.rule, f.metric, f.value, f.detail
+                FROM measurement_flags f
+                JOIN measurements m ON f.measurement_id = m.id
+                JOIN treatments t ON m.treatment_id = t.id
+                WHERE t.experiment_id = ?
+            """
+            params = [experiment_id]
+            if rules:
+                query += f" AND f.rule IN ({', '.join('?' * len(rules))})"
+                params.extend(rules)
+            query += " ORDER BY t.treatment_name, m.measurement_date, f.measurement_id"
+            results = self.db.execute_query(query, tuple(params))
+            if results:
+                return pd.DataFrame(results, columns=[
+                    'measurement_id', 'treatment_name', 'measurement_date',
+                    'rule', 'metric', 'value', 'detail'
+                ])
+            return None
+
+        except Exception as e:
+            print(f"Error loading measurement flags: {e}")
+            return None